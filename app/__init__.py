@@ -56,6 +56,12 @@ def create_app(config_name='default'):
     from app.api import bp as api_bp
     app.register_blueprint(api_bp, url_prefix='/api')
     
+    # Services shared by every request this process serves
+    from app.services.registry import ServiceRegistry, warm_for_fork
+    ServiceRegistry(app)
+    if app.config.get('FACE_WARM_ON_START'):
+        warm_for_fork(app)
+    
     # Configure logging
     if not app.debug and not app.testing:
         if not os.path.exists('logs'):
@@ -47,6 +47,14 @@ def toggle_user_status(user_id):
     """Toggle user active status"""
     user = User.query.get_or_404(user_id)
     user.is_active = not user.is_active
+    
+    # Keep face galleries in step with account status
+    from app.services.registry import get_face_service
+    face_service = get_face_service()
+    if not user.is_active:
+        face_service.unenroll_user(user.id)
+    elif user.face_encoding:
+        face_service.enroll_user(user)
     db.session.commit()
     
     status = "activated" if user.is_active else "deactivated"
@@ -892,3 +900,90 @@ def add_attendance():
             flash(f'Error adding attendance record: {str(e)}', 'danger')
             return redirect(url_for('admin.attendance') + '#error')
     return render_template('admin/add_attendance_modal.html', users=users, locations=locations, today=today)
+
+@bp.route('/unknown_faces')
+@login_required
+@admin_required
+def unknown_faces():
+    """Review recurring faces that matched nobody"""
+    from flask import current_app
+    from app.services.registry import get_face_service
+    from app.services.unknown_faces import enrolment_suggestions, load_clusters
+    
+    clusters = load_clusters(current_app.config)
+    suggestions = []
+    if clusters is not None:
+        config = current_app.config
+        suggestions = enrolment_suggestions(clusters.clusters(min_size=config['UNKNOWN_FACES_MIN_CLUSTER']),
+                                            get_face_service(), config['UNKNOWN_FACES_SUGGEST_DISTANCE'])
+    user_ids = {suggestion['nearest_user_id'] for suggestion in suggestions if suggestion['nearest_user_id']}
+    users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))} if user_ids else {}
+    return render_template('admin/unknown_faces.html', suggestions=suggestions, users=users,
+                           enabled=clusters is not None)
+
+@bp.route('/unknown_faces/<face_id>.jpg')
+@login_required
+@admin_required
+def unknown_face_image(face_id):
+    """Thumbnail of a stored unknown face"""
+    from flask import abort, current_app, send_from_directory
+    from app.services.unknown_faces import get_unknown_store, parse_face_id
+    
+    store = get_unknown_store(current_app.config)
+    if store is None or parse_face_id(face_id) is None:
+        abort(404)
+    return send_from_directory(store.folder, face_id + '.jpg')
+
+@bp.route('/unknown_faces/<int:label>/dismiss', methods=['POST'])
+@login_required
+@admin_required
+def dismiss_unknown_faces(label):
+    """Delete a reviewed group of unknown faces"""
+    from flask import current_app
+    from app.services.unknown_faces import load_clusters
+    
+    clusters = load_clusters(current_app.config)
+    removed = clusters.dismiss(label) if clusters is not None else 0
+    flash(f'Dismissed {removed} unknown faces.', 'success')
+    return redirect(url_for('admin.unknown_faces'))
+
+@bp.route('/unknown_faces/<int:label>/enrol', methods=['POST'])
+@login_required
+@admin_required
+def enrol_unknown_faces(label):
+    """Add a group of unknown faces to a member as one more template.
+    
+    As suggested on the review page: an enrolled member only gets a group
+    whose nearest member they are, within UNKNOWN_FACES_SUGGEST_DISTANCE,
+    and a member without a face enrolment only a group near nobody else.
+    """
+    from flask import current_app
+    from app.services.registry import get_face_service
+    from app.services.unknown_faces import load_clusters
+    
+    clusters = load_clusters(current_app.config)
+    cluster = clusters.get(label) if clusters is not None else None
+    user = User.query.filter_by(state_code=request.form.get('state_code', '').strip()).first()
+    if cluster is None or user is None:
+        flash('Unknown face group or state code not found.', 'error')
+        return redirect(url_for('admin.unknown_faces'))
+    
+    face_service = get_face_service()
+    nearest_id, distance = face_service.nearest_users(cluster.centroid[None, :])[0]
+    near = distance is not None and distance <= current_app.config['UNKNOWN_FACES_SUGGEST_DISTANCE']
+    if user.id in face_service.gallery:
+        matches = nearest_id == user.id and near
+    else:
+        matches = not near
+    if not matches:
+        flash(f'These faces do not look like {user.full_name}; nothing was added.', 'error')
+        return redirect(url_for('admin.unknown_faces'))
+    
+    # The group's centroid averages the conditions the member went unrecognized in
+    centroid = user.add_face_template(cluster.centroid, max_templates=current_app.config.get('FACE_MAX_TEMPLATES'),
+                                      model_version=face_service.active_model_version())
+    face_service.enroll_user(user, centroid)
+    db.session.commit()
+    clusters.dismiss(label)
+    flash(f'Added {len(cluster.faces)} unknown faces to {user.full_name} as a face template.', 'success')
+    return redirect(url_for('admin.unknown_faces'))
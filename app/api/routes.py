@@ -1,11 +1,14 @@
-from flask import jsonify, request, current_app
+from flask import jsonify, request, current_app, url_for
 from flask_login import login_required, current_user
 from app.api import bp
-from app.models import User, Attendance, Location, CDSchedule
+from app.models import User, Attendance, Location, CDSchedule, EnrolmentJob
 from app.services.attendance_service import AttendanceService
-from app.services.face_recognition_service import FaceRecognitionService
+from app.services.registry import get_face_service, get_registry
+from app.services.timing import get_timings
+from app.services.enrolment_queue import enqueue_face_image
 from app import db
 from datetime import date, datetime
+import hmac
 import os
 from geopy.geocoders import Nominatim
 
@@ -126,7 +129,7 @@ def todays_schedules():
 @bp.route('/face_recognition/upload', methods=['POST'])
 @login_required
 def upload_face_image():
-    """Upload face image for recognition"""
+    """Queue a face image for enrolment; poll the returned job for the outcome"""
     try:
         if 'image' not in request.files:
             return jsonify({'error': 'No image file provided'}), 400
@@ -135,23 +138,76 @@ def upload_face_image():
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
-        if file:
-            # Save and process the image
-            face_service = FaceRecognitionService()
-            result = face_service.save_user_face_image(current_user.id, file)
-            
-            if result['success']:
-                return jsonify({
-                    'success': True,
-                    'message': 'Face image uploaded and processed successfully'
-                })
-            else:
-                return jsonify({'error': result['message']}), 400
+        try:
+            job = enqueue_face_image(current_user.id, file)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            'message': 'Face image received and queued for processing',
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': url_for('api.face_enrolment_status', job_id=job.id)
+        }), 202
                 
     except Exception as e:
         current_app.logger.error(f"Error uploading face image: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@bp.route('/face_recognition/jobs/<job_id>')
+@login_required
+def face_enrolment_status(job_id):
+    """Status of a queued face enrolment"""
+    job = db.session.get(EnrolmentJob, job_id)
+    if job is None or (job.user_id != current_user.id and not current_user.is_admin):
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@bp.route('/face_recognition/identify_batch', methods=['POST'])
+@login_required
+def identify_batch():
+    """Identify the face in each of several uploaded frames or crops in one request"""
+    try:
+        files = request.files.getlist('images')
+        if not files:
+            return jsonify({'error': 'No image files provided'}), 400
+        max_images = current_app.config.get('FACE_BATCH_MAX_IMAGES', 32)
+        if len(files) > max_images:
+            return jsonify({'error': f'At most {max_images} images per request'}), 400
+        
+        location_id = request.form.get('location_id', type=int)
+        aligned = request.form.get('crops', '').lower() in ('1', 'true', 'yes')
+        face_service = get_face_service()
+        try:
+            results, timings = face_service.identify_images(files, location_id=location_id, aligned=aligned)
+        except RuntimeError as e:
+            return jsonify({'error': str(e)}), 503
+        
+        matched_ids = {result['user_id'] for result in results if result['user_id'] is not None}
+        users = {user.id: user for user in User.query.filter(User.id.in_(matched_ids))} if matched_ids else {}
+        for index, (file, result) in enumerate(zip(files, results)):
+            user = users.get(result['user_id'])
+            result.update({
+                'index': index,
+                'filename': file.filename,
+                'matched': user is not None,
+                'state_code': user.state_code if user else None,
+                'full_name': user.full_name if user else None,
+                'confidence': round(float(result['confidence']), 4)
+            })
+        
+        return jsonify({
+            'success': True,
+            'results': results,
+            'timings': timings,
+            'gallery_version': face_service.version
+        })
+        
+    except Exception as e:
+        current_app.logger.error(f"Error in batch face identification: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @bp.route('/user/profile')
 @login_required
 def user_profile():
@@ -198,3 +254,28 @@ def geocode_address():
     except Exception as e:
         current_app.logger.error(f"Geocoding error: {str(e)}")
         return jsonify({'error': 'Geocoding failed'}), 500
+
+@bp.route('/health')
+def health():
+    """Readiness of this worker: 200 once the face models and gallery are loaded, 503 before.
+
+    Only reports: loading is left to warm-up and its background retries.
+    """
+    status = get_registry().status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@bp.route('/metrics')
+def metrics():
+    """This worker's stage timing histograms, as JSON or (``?format=prometheus``) scrape text.
+
+    Only for admins or scrapers sending ``Authorization: Bearer <METRICS_TOKEN>``.
+    """
+    token = current_app.config.get('METRICS_TOKEN')
+    authorized = bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''),
+                                                     f'Bearer {token}')
+    if not authorized and not (current_user.is_authenticated and current_user.is_admin):
+        return jsonify({'error': 'Unauthorized'}), 401
+    timings = get_timings()
+    if request.args.get('format') == 'prometheus':
+        return current_app.response_class(timings.prometheus(), mimetype='text/plain; version=0.0.4')
+    return jsonify(timings.snapshot())
@@ -111,14 +111,14 @@ def register():
         db.session.add(user)
         db.session.commit()
         
-        # Process face image if provided
+        # Queue the face image; encoding happens off the request
         if face_image and face_image.filename:
-            from app.services.face_recognition_service import FaceRecognitionService
-            face_service = FaceRecognitionService()
-            result = face_service.save_user_face_image(user.id, face_image)
-            
-            if not result['success']:
-                flash(f"Warning: {result['message']}. You can upload your face image later from your profile.", 'warning')
+            from app.services.enrolment_queue import enqueue_face_image
+            try:
+                enqueue_face_image(user.id, face_image)
+                flash('Your face image is being processed and will be ready shortly.', 'info')
+            except ValueError as e:
+                flash(f"Warning: {e}. You can upload your face image later from your profile.", 'warning')
         
         flash('Registration successful! Please log in.', 'success')
         return redirect(url_for('auth.login'))
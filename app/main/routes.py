@@ -113,15 +113,14 @@ def edit_profile():
         current_user.batch = batch or current_user.batch
         db.session.commit()
 
-        # Process face image if provided
+        # Queue the face image; encoding happens off the request
         if face_image and face_image.filename:
-            from app.services.face_recognition_service import FaceRecognitionService
-            face_service = FaceRecognitionService()
-            result = face_service.save_user_face_image(current_user.id, face_image)
-            if not result['success']:
-                flash(f"Warning: {result['message']}", 'warning')
-            else:
-                flash('Face image updated successfully.', 'success')
+            from app.services.enrolment_queue import enqueue_face_image
+            try:
+                enqueue_face_image(current_user.id, face_image)
+                flash('Profile updated. Your new face image is being processed.', 'success')
+            except ValueError as e:
+                flash(f"Warning: {e}", 'warning')
         else:
             flash('Profile updated successfully.', 'success')
         return redirect(url_for('main.profile'))
@@ -136,13 +135,12 @@ def upload_face_image():
     if not face_image or not face_image.filename:
         flash('No image file selected.', 'danger')
         return redirect(url_for('main.profile'))
-    from app.services.face_recognition_service import FaceRecognitionService
-    face_service = FaceRecognitionService()
-    result = face_service.save_user_face_image(current_user.id, face_image)
-    if not result['success']:
-        flash(f"Warning: {result['message']}", 'warning')
-    else:
-        flash('Face image uploaded successfully.', 'success')
+    from app.services.enrolment_queue import enqueue_face_image
+    try:
+        enqueue_face_image(current_user.id, face_image)
+        flash('Face image uploaded. It is being processed and will be ready shortly.', 'success')
+    except ValueError as e:
+        flash(f"Warning: {e}", 'warning')
     return redirect(url_for('main.profile'))
 
 @bp.route('/attendance')
@@ -200,7 +198,12 @@ def face_attendance():
 @bp.route('/mark_face_attendance', methods=['POST'])
 @login_required
 def mark_face_attendance():
-    """Mark attendance using face recognition and PIN"""
+    """Mark attendance using face recognition and PIN.
+    
+    With the TIMING_DEBUG_HEADER header set, the response carries the
+    request's stage timings in milliseconds under ``timings``.
+    """
+    from app.services.timing import trace
     try:
         data = request.get_json()
         schedule_id = data.get('schedule_id')
@@ -218,19 +221,24 @@ def mark_face_attendance():
         if not schedule:
             return jsonify({'error': 'Invalid schedule'}), 404
         
-        result = attendance_service.mark_attendance_by_face_and_pin(
-            current_user.state_code, pin, schedule.location_id
-        )
+        debug = bool(request.headers.get(current_app.config.get('TIMING_DEBUG_HEADER', 'X-Debug-Timings')))
+        with trace(enabled=debug) as stages:
+            result = attendance_service.mark_attendance_by_face_and_pin(
+                current_user.state_code, pin, schedule.location_id
+            )
         
         if result['success']:
-            return jsonify({
+            response, status = {
                 'success': True,
                 'message': result['message'],
                 'user_name': result.get('user_name', current_user.full_name),
                 'check_in_time': result.get('check_in_time')
-            })
+            }, 200
         else:
-            return jsonify({'error': result['message']}), 400
+            response, status = {'error': result['message']}, 400
+        if stages is not None:
+            response['timings'] = stages
+        return jsonify(response), status
             
     except Exception as e:
         current_app.logger.error(f"Error in face attendance: {str(e)}")
@@ -4,3 +4,7 @@ from .location import Location
 from .attendance import Attendance
 from .cd_schedule import CDSchedule
 from .announcement import Announcement
+from .gallery_change import GalleryChange
+from .face_template import FaceTemplate
+from .face_image import FaceImage
+from .enrolment_job import EnrolmentJob
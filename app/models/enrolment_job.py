@@ -0,0 +1,44 @@
+import uuid
+from datetime import datetime
+from app import db
+
+class EnrolmentJob(db.Model):
+    """A queued face enrolment; the upload is stored and encoded by a worker"""
+    __tablename__ = 'enrolment_jobs'
+    
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    status = db.Column(db.String(10), nullable=False, default=QUEUED, index=True)
+    upload_path = db.Column(db.String(255), nullable=False)  # raw uploaded bytes
+    original_filename = db.Column(db.String(255), nullable=True)
+    message = db.Column(db.String(255), nullable=True)
+    attempts = db.Column(db.Integer, default=0)
+    worker = db.Column(db.String(100), nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+    
+    def to_dict(self):
+        """Convert job to dictionary"""
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'message': self.message,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+    
+    def __repr__(self):
+        return f'<EnrolmentJob {self.id}: {self.status} for user {self.user_id}>'
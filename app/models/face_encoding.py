@@ -0,0 +1,71 @@
+# Compact, versioned binary storage for face encodings.
+#
+# Each blob is an 8-byte header followed by the raw little-endian vector:
+#   magic 'FE' | format version (u8) | dtype code (u8) | dim (u16) | reserved (u16)
+# A float32 128-d encoding takes 520 bytes, a float16 one 264 bytes.
+import struct
+import numpy as np
+
+ENCODING_MAGIC = b'FE'
+ENCODING_FORMAT = 1
+ENCODING_HEADER = struct.Struct('<2sBBHH')
+
+DTYPE_CODES = {1: np.dtype('<f4'), 2: np.dtype('<f2')}
+DTYPE_NAMES = {'float32': 1, 'float16': 2}
+
+
+def pack_encoding(encoding, dtype='float32') -> bytes:
+    """Serialize a 1-d encoding to a versioned binary blob"""
+    code = DTYPE_NAMES[dtype]
+    vector = np.ascontiguousarray(np.ravel(encoding), dtype=DTYPE_CODES[code])
+    header = ENCODING_HEADER.pack(ENCODING_MAGIC, ENCODING_FORMAT, code, vector.shape[0], 0)
+    return header + vector.tobytes()
+
+
+def unpack_encoding(blob: bytes) -> np.ndarray:
+    """Deserialize a blob written by pack_encoding into a float32 vector"""
+    if blob is None or len(blob) < ENCODING_HEADER.size:
+        raise ValueError("Face encoding blob is empty or truncated")
+    magic, fmt, code, dim, _ = ENCODING_HEADER.unpack_from(blob)
+    if magic != ENCODING_MAGIC or fmt != ENCODING_FORMAT or code not in DTYPE_CODES:
+        raise ValueError("Unrecognised face encoding format")
+    dtype = DTYPE_CODES[code]
+    if len(blob) != ENCODING_HEADER.size + dim * dtype.itemsize:
+        raise ValueError("Face encoding blob length does not match its header")
+    return np.frombuffer(blob, dtype=dtype, count=dim, offset=ENCODING_HEADER.size).astype(np.float32)
+
+
+def unpack_encodings(blobs, dim: int):
+    """Decode many blobs of one dimension at once.
+
+    Blobs of the same layout are joined and reinterpreted with a single
+    ``np.frombuffer`` call rather than parsed row by row. Returns
+    ``(matrix, valid)``: a float32 ``(len(blobs), dim)`` matrix and a mask
+    of the rows that decoded cleanly (invalid rows are zero).
+    """
+    matrix = np.zeros((len(blobs), dim), dtype=np.float32)
+    valid = np.zeros(len(blobs), dtype=bool)
+    lengths = np.fromiter((len(blob) if blob else 0 for blob in blobs), dtype=np.int64, count=len(blobs))
+
+    for code, dtype in DTYPE_CODES.items():
+        record_size = ENCODING_HEADER.size + dim * dtype.itemsize
+        rows = np.flatnonzero(lengths == record_size)
+        if len(rows) == 0:
+            continue
+        records = np.frombuffer(b''.join(blobs[row] for row in rows), dtype=np.uint8)
+        records = records.reshape(len(rows), record_size)
+
+        header = np.frombuffer(ENCODING_HEADER.pack(ENCODING_MAGIC, ENCODING_FORMAT, code, dim, 0), dtype=np.uint8)
+        ok = np.all(records[:, :ENCODING_HEADER.size] == header, axis=1)
+        vectors = np.ascontiguousarray(records[ok, ENCODING_HEADER.size:]).view(dtype)
+        matrix[rows[ok]] = vectors
+        valid[rows[ok]] = True
+    return matrix, valid
+
+
+def centroid_encoding(encodings) -> np.ndarray:
+    """Mean of the unit-length encodings, so no single template dominates"""
+    vectors = np.array(encodings, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).mean(axis=0)
@@ -0,0 +1,46 @@
+from datetime import datetime
+from app import db
+from .face_encoding import pack_encoding, unpack_encoding
+
+class FaceImage(db.Model):
+    """A stored enrolment image, addressed by the SHA-256 of its normalized JPEG.
+
+    The file lives under the content store (see ``face_image_store.py``);
+    ``ref_count`` is the number of face templates using it and the
+    encoding computed from it is cached for identical re-uploads.
+    """
+    __tablename__ = 'face_images'
+
+    digest = db.Column(db.String(64), primary_key=True)  # SHA-256 of the stored JPEG
+    source_digest = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 of the uploaded bytes
+    byte_size = db.Column(db.Integer, nullable=False, default=0)
+    encoding = db.Column(db.LargeBinary, nullable=True)  # packed float32 vector, see face_encoding.py
+    model_version = db.Column(db.String(64), nullable=True)  # embedding model that produced encoding
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def set_encoding(self, encoding_array, model_version=None):
+        """Cache the encoding as a compact binary blob"""
+        self.encoding = pack_encoding(encoding_array)
+        self.model_version = model_version
+
+    def get_encoding(self, model_version=None):
+        """The cached encoding as a float32 numpy array, or None if not computed (by that model) yet"""
+        if self.encoding and (model_version is None or self.model_version == model_version):
+            return unpack_encoding(self.encoding)
+        return None
+
+    @staticmethod
+    def retain(digest, count=1):
+        """Stage a reference count increase; committed with the caller's transaction"""
+        return FaceImage.query.filter_by(digest=digest).update(
+            {FaceImage.ref_count: FaceImage.ref_count + count}, synchronize_session=False)
+
+    @staticmethod
+    def release(digest, count=1):
+        """Stage a reference count decrease; unreferenced images are left to garbage collection"""
+        return FaceImage.query.filter_by(digest=digest).update(
+            {FaceImage.ref_count: FaceImage.ref_count - count}, synchronize_session=False)
+
+    def __repr__(self):
+        return f'<FaceImage {self.digest[:12]} refs={self.ref_count}>'
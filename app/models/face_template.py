@@ -0,0 +1,30 @@
+from datetime import datetime
+from app import db
+from .face_encoding import pack_encoding, unpack_encoding
+
+class FaceTemplate(db.Model):
+    """One enrolment image's face encoding; a user may have several"""
+    __tablename__ = 'face_templates'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    encoding = db.Column(db.LargeBinary, nullable=False)  # packed float32 vector, see face_encoding.py
+    image_path = db.Column(db.String(255), nullable=True)
+    image_digest = db.Column(db.String(64), nullable=True, index=True)  # FaceImage it was computed from
+    model_version = db.Column(db.String(64), nullable=True)  # embedding model that produced encoding
+    # Staged by the re-embedding job until the whole gallery is swapped to next_version
+    next_encoding = db.Column(db.LargeBinary, nullable=True)
+    next_version = db.Column(db.String(64), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def set_encoding(self, encoding_array, model_version=None):
+        """Store the encoding as a compact binary blob"""
+        self.encoding = pack_encoding(encoding_array)
+        self.model_version = model_version
+    
+    def get_encoding(self):
+        """Retrieve the encoding as a float32 numpy array"""
+        return unpack_encoding(self.encoding)
+    
+    def __repr__(self):
+        return f'<FaceTemplate {self.id} for user {self.user_id}>'
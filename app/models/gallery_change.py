@@ -0,0 +1,72 @@
+from datetime import datetime
+from app import db
+
+class GalleryChange(db.Model):
+    """Append-only log of face gallery changes; the latest id is the gallery version.
+    
+    Ids are assigned at insert but become visible at commit, so concurrent
+    transactions can commit out of id order: readers re-read a trailing
+    window of ids below their version (see ``window``) to catch late ones.
+    """
+    __tablename__ = 'gallery_changes'
+    
+    UPSERT = 'upsert'
+    REMOVE = 'remove'
+    RELOAD = 'reload'  # every encoding changed, e.g. re-embedded by a new model
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)  # 0 for reloads
+    operation = db.Column(db.String(10), nullable=False)  # upsert, remove, reload
+    model_version = db.Column(db.String(64), nullable=True)  # embedding model in use from a reload on
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @staticmethod
+    def record(user_id, operation):
+        """Stage a change in the current session; committed with the caller's transaction"""
+        change = GalleryChange(user_id=user_id, operation=operation)
+        db.session.add(change)
+        return change
+    
+    @staticmethod
+    def record_reload(model_version):
+        """Stage a whole-gallery change to ``model_version``; committed with the caller's transaction"""
+        change = GalleryChange(user_id=0, operation=GalleryChange.RELOAD, model_version=model_version)
+        db.session.add(change)
+        return change
+    
+    @staticmethod
+    def latest_reload():
+        """The most recent reload, or None if the gallery was never re-embedded"""
+        return GalleryChange.query.filter_by(operation=GalleryChange.RELOAD).order_by(
+            GalleryChange.id.desc()).first()
+    
+    @staticmethod
+    def latest_version():
+        """Current gallery version (0 when nothing has been recorded)"""
+        return db.session.query(db.func.max(GalleryChange.id)).scalar() or 0
+    
+    @staticmethod
+    def window(floor):
+        """``(count, max id)`` of the changes committed after id ``floor``"""
+        count, latest = db.session.query(db.func.count(GalleryChange.id), db.func.max(GalleryChange.id)).filter(
+            GalleryChange.id > floor).one()
+        return count, latest or 0
+    
+    @staticmethod
+    def ids_since(floor):
+        """Ids of the changes committed after id ``floor``"""
+        return [change_id for (change_id,) in db.session.query(GalleryChange.id).filter(GalleryChange.id > floor)]
+    
+    @staticmethod
+    def since(version, limit=None, exclude=()):
+        """Changes recorded after the given version, oldest first, less the ids in ``exclude``"""
+        query = GalleryChange.query.filter(GalleryChange.id > version)
+        if exclude:
+            query = query.filter(GalleryChange.id.notin_(list(exclude)))
+        query = query.order_by(GalleryChange.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
+    
+    def __repr__(self):
+        return f'<GalleryChange {self.id}: {self.operation} user {self.user_id}>'
@@ -2,7 +2,9 @@ from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 from app import db
-import json
+from .face_encoding import centroid_encoding, pack_encoding, unpack_encoding
+from .face_template import FaceTemplate
+from .face_image import FaceImage
 import secrets
 
 class User(UserMixin, db.Model):
@@ -22,7 +24,11 @@ class User(UserMixin, db.Model):
     pin_hash = db.Column(db.String(200), nullable=False)  # 4-digit PIN
     
     # Face Recognition Data
-    face_encoding = db.Column(db.Text, nullable=True)  # JSON encoded face data
+    face_encoding = db.Column(db.LargeBinary, nullable=True)  # centroid of face_templates, see face_encoding.py
+    face_encoding_version = db.Column(db.String(64), nullable=True)  # embedding model behind face_encoding
+    # Staged by the re-embedding job until the whole gallery is swapped to next_encoding_version
+    next_face_encoding = db.Column(db.LargeBinary, nullable=True)
+    next_encoding_version = db.Column(db.String(64), nullable=True)
     face_image_path = db.Column(db.String(255), nullable=True)
     
     # Account Status
@@ -33,7 +39,7 @@ class User(UserMixin, db.Model):
     # Corps Information
     ppa_name = db.Column(db.String(200), nullable=True)  # Primary Place of Assignment
     cd_group = db.Column(db.String(50), nullable=True)   # CD Group
-    local_government = db.Column(db.String(100), nullable=True)
+    local_government = db.Column(db.String(100), nullable=True, index=True)
     batch = db.Column(db.String(10), nullable=True)      # e.g., "Batch C"
     
     # Security Features
@@ -49,6 +55,8 @@ class User(UserMixin, db.Model):
     
     # Relationships
     attendance_records = db.relationship('Attendance', backref='user', lazy='dynamic', cascade='all, delete-orphan')
+    face_templates = db.relationship('FaceTemplate', backref='user', lazy='dynamic', cascade='all, delete-orphan',
+                                     order_by='FaceTemplate.id')
     
     def set_password(self, password):
         """Set password hash"""
@@ -69,17 +77,47 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.pin_hash, str(pin))
     
     def set_face_encoding(self, encoding_array):
-        """Store face encoding as JSON"""
+        """Store face encoding as a compact binary blob"""
         if encoding_array is not None:
-            self.face_encoding = json.dumps(encoding_array.tolist())
+            self.face_encoding = pack_encoding(encoding_array)
     
     def get_face_encoding(self):
-        """Retrieve face encoding as numpy array"""
+        """Retrieve face encoding as a float32 numpy array"""
         if self.face_encoding:
-            import numpy as np
-            return np.array(json.loads(self.face_encoding))
+            return unpack_encoding(self.face_encoding)
         return None
     
+    def add_face_template(self, encoding_array, image_path=None, max_templates=None, image_digest=None,
+                          model_version=None):
+        """Add an enrolment template and refresh the centroid in face_encoding.
+        
+        Beyond ``max_templates`` the oldest templates are dropped. References
+        to stored images (``image_digest``) are counted on ``FaceImage``.
+        A re-embedding staged for the user is discarded, so the job redoes
+        it with the new template. Returns the new centroid.
+        """
+        template = FaceTemplate(image_path=image_path, image_digest=image_digest)
+        template.set_encoding(encoding_array, model_version)
+        self.face_templates.append(template)
+        if image_digest is not None:
+            FaceImage.retain(image_digest)
+        
+        templates = self.face_templates.all()
+        if max_templates and len(templates) > max_templates:
+            for stale in templates[:len(templates) - max_templates]:
+                if stale.image_digest is not None:
+                    FaceImage.release(stale.image_digest)
+                self.face_templates.remove(stale)
+            templates = templates[len(templates) - max_templates:]
+        
+        centroid = centroid_encoding([t.get_encoding() for t in templates])
+        self.set_face_encoding(centroid)
+        self.face_encoding_version = model_version
+        self.next_face_encoding = self.next_encoding_version = None
+        if image_path is not None:
+            self.face_image_path = image_path
+        return centroid
+    
     def is_account_locked(self):
         """Check if account is locked due to failed login attempts"""
         if self.account_locked_until and datetime.utcnow() < self.account_locked_until:
@@ -0,0 +1,367 @@
+# Approximate nearest-neighbour indexes for large face galleries
+import os
+import json
+import time
+import hashlib
+import logging
+import numpy as np
+from typing import Optional, Tuple
+
+from app.services.face_gallery import (ENCODING_DIM, FaceGallery, normalize_encodings,
+                                       similarity_to_distance, top_k)
+
+logger = logging.getLogger(__name__)
+
+try:
+    import hnswlib
+except ImportError:  # optional dependency
+    hnswlib = None
+
+INDEX_DIRNAME = 'ann_index'
+META_FILENAME = 'meta.json'
+
+# Superseded index files are kept this long for workers still mapping them
+RETAIN_SECONDS = 24 * 3600
+
+
+def gallery_fingerprint(user_ids: np.ndarray, encodings: np.ndarray) -> str:
+    """Digest identifying the exact gallery contents an index was built from"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(user_ids, dtype=np.int32).tobytes())
+    digest.update(np.ascontiguousarray(encodings, dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+def _assign(data: np.ndarray, centroids: np.ndarray, block: int = 65536) -> np.ndarray:
+    """Index of the most similar centroid for every row of data"""
+    assignment = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), block):
+        assignment[start:start + block] = np.argmax(data[start:start + block] @ centroids.T, axis=1)
+    return assignment
+
+
+def train_kmeans(data: np.ndarray, nlist: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """Spherical k-means over unit vectors; returns nlist unit centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _assign(data, centroids)
+        order = np.argsort(assignment, kind='stable')
+        counts = np.bincount(assignment, minlength=nlist)
+        present = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts[present])[:-1]))
+        sums = np.add.reduceat(data[order], starts, axis=0)
+
+        updated = centroids.copy()
+        updated[present] = sums
+        # Re-seed empty lists from random points so every list stays usable
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            updated[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+        centroids = normalize_encodings(updated)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index with k-means coarse quantization (pure NumPy).
+
+    Gallery rows are grouped by their nearest of ``nlist`` centroids. A probe
+    only scans the ``nprobe`` lists whose centroids are closest to it, so
+    raising ``nprobe`` trades latency for recall.
+    """
+
+    backend = 'ivf'
+
+    def __init__(self, dim: int = ENCODING_DIM, nlist: int = 1024, nprobe: int = 16,
+                 train_iterations: int = 20, max_train_points: int = 256, seed: int = 0):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iterations = train_iterations
+        self.max_train_points = max_train_points  # per list
+        self.seed = seed
+        self.fingerprint = None
+        self.centroids = np.empty((0, dim), dtype=np.float32)
+        self.list_offsets = np.zeros(1, dtype=np.int64)
+        self.encodings = np.empty((0, dim), dtype=np.float32)
+        self.user_ids = np.empty(0, dtype=np.int32)
+
+    def __len__(self):
+        return int(self.user_ids.shape[0])
+
+    def build(self, user_ids: np.ndarray, encodings: np.ndarray) -> 'IVFIndex':
+        """Train centroids and bucket the (already normalized) gallery rows"""
+        encodings = np.ascontiguousarray(encodings, dtype=np.float32)
+        nlist = max(1, min(self.nlist, len(encodings)))
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(encodings), nlist * self.max_train_points)
+        sample = encodings[rng.choice(len(encodings), sample_size, replace=False)]
+
+        started = time.perf_counter()
+        self.centroids = train_kmeans(sample, nlist, self.train_iterations, self.seed)
+        assignment = _assign(encodings, self.centroids)
+        order = np.argsort(assignment, kind='stable')
+        self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=nlist))))
+        self.encodings = encodings[order]
+        self.user_ids = np.asarray(user_ids, dtype=np.int32)[order]
+        self.fingerprint = gallery_fingerprint(user_ids, encodings)
+        logger.info(f"Built IVF index over {len(self)} encodings with {nlist} lists "
+                    f"in {time.perf_counter() - started:.1f}s")
+        return self
+
+    def search(self, probes: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate k nearest neighbours as ``(user_ids, distances)``"""
+        probes = normalize_encodings(probes)
+        nprobe = min(self.nprobe, len(self.centroids))
+        lists, _ = top_k(probes @ self.centroids.T, nprobe)
+
+        ids = np.full((len(probes), k), -1, dtype=np.int32)
+        distances = np.full((len(probes), k), np.inf, dtype=np.float32)
+        for row, probe in enumerate(probes):
+            rows = np.concatenate([np.arange(self.list_offsets[l], self.list_offsets[l + 1])
+                                   for l in lists[row]])
+            if len(rows) == 0:
+                continue
+            columns, best = top_k((self.encodings[rows] @ probe)[None, :], k)
+            found = columns.shape[1]
+            ids[row, :found] = self.user_ids[rows[columns[0]]]
+            distances[row, :found] = similarity_to_distance(best[0])
+        return ids, distances
+
+    def stale_ids(self, user_ids: np.ndarray, encodings: np.ndarray,
+                  block: int = 65536) -> np.ndarray:
+        """User ids whose gallery entry was added, changed or removed since build"""
+        common, index_rows, gallery_rows = np.intersect1d(self.user_ids, user_ids, assume_unique=True,
+                                                          return_indices=True)
+        changed = [common[start:start + block][np.any(
+            self.encodings[index_rows[start:start + block]] != encodings[gallery_rows[start:start + block]],
+            axis=1)] for start in range(0, len(common), block)]
+        return np.concatenate(changed + [np.setdiff1d(user_ids, self.user_ids, assume_unique=True),
+                                         np.setdiff1d(self.user_ids, user_ids, assume_unique=True)])
+
+    def save(self, folder: str, retain_seconds: float = RETAIN_SECONDS):
+        """Persist the index under folder, replacing any previous one atomically.
+
+        Files are named after the fingerprint, written under temporary
+        names and renamed into place, and only become live when meta.json
+        is replaced, so readers never see a half-written index and a file
+        another worker has mapped is never rewritten. The encodings go in
+        a plain .npy file that loads memory-mapped and is therefore shared
+        between worker processes. Superseded files are removed once they
+        have been out of use for ``retain_seconds``.
+        """
+        os.makedirs(folder, exist_ok=True)
+        prefix = f'ivf-{self.fingerprint}'
+        suffix = f'.{os.getpid()}.tmp'
+        encodings_path = os.path.join(folder, prefix + '.encodings.npy')
+        np.save(encodings_path + suffix, self.encodings, allow_pickle=False)
+        os.replace(encodings_path + suffix + '.npy', encodings_path)
+        lists_path = os.path.join(folder, prefix + '.npz')
+        np.savez(lists_path + suffix, centroids=self.centroids, list_offsets=self.list_offsets,
+                 user_ids=self.user_ids)
+        os.replace(lists_path + suffix + '.npz', lists_path)
+
+        previous = _read_meta(folder).get('prefix')
+        _write_meta(folder, {'backend': self.backend, 'dim': self.dim, 'nlist': self.nlist,
+                             'nprobe': self.nprobe, 'fingerprint': self.fingerprint, 'prefix': prefix})
+        _remove_superseded(folder, 'ivf-', prefix, previous, retain_seconds)
+
+    @classmethod
+    def load(cls, folder: str, meta: dict) -> 'IVFIndex':
+        index = cls(dim=meta['dim'], nlist=meta['nlist'], nprobe=meta['nprobe'])
+        prefix = os.path.join(folder, meta['prefix'])
+        with np.load(prefix + '.npz') as data:
+            index.centroids = data['centroids']
+            index.list_offsets = data['list_offsets']
+            index.user_ids = data['user_ids']
+        index.encodings = np.load(prefix + '.encodings.npy', mmap_mode='r')
+        index.fingerprint = meta['fingerprint']
+        return index
+
+
+class HNSWIndex:
+    """Graph index backed by the optional ``hnswlib`` package.
+
+    ``ef_search`` is the recall/latency knob at query time; ``m`` and
+    ``ef_construction`` control graph quality and build cost.
+    """
+
+    backend = 'hnsw'
+
+    def __init__(self, dim: int = ENCODING_DIM, m: int = 16, ef_construction: int = 200,
+                 ef_search: int = 64):
+        if hnswlib is None:
+            raise RuntimeError("The hnsw index backend requires the hnswlib package")
+        self.dim = dim
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.fingerprint = None
+        self._index = None
+
+    def __len__(self):
+        return self._index.get_current_count() if self._index is not None else 0
+
+    def build(self, user_ids: np.ndarray, encodings: np.ndarray) -> 'HNSWIndex':
+        self._index = hnswlib.Index(space='ip', dim=self.dim)
+        self._index.init_index(max_elements=max(1, len(encodings)), M=self.m,
+                               ef_construction=self.ef_construction)
+        self._index.add_items(encodings, np.asarray(user_ids, dtype=np.int64))
+        self._index.set_ef(self.ef_search)
+        self.fingerprint = gallery_fingerprint(user_ids, encodings)
+        return self
+
+    def search(self, probes: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        probes = normalize_encodings(probes)
+        k = min(k, len(self))
+        self._index.set_ef(max(self.ef_search, k))
+        labels, inner_distances = self._index.knn_query(probes, k=k)
+        # hnswlib reports 1 - inner product for the 'ip' space
+        return labels.astype(np.int32), similarity_to_distance(1.0 - inner_distances)
+
+    def stale_ids(self, user_ids: np.ndarray, encodings: np.ndarray) -> Optional[np.ndarray]:
+        """Not tracked for graph indexes; callers rebuild on any change"""
+        return None
+
+    def save(self, folder: str, retain_seconds: float = RETAIN_SECONDS):
+        """Persist the index under folder, replacing any previous one atomically.
+
+        As for ``IVFIndex.save``: the graph is written under a temporary
+        name, renamed to a file named after the fingerprint and only becomes
+        live when meta.json is replaced, so a worker reloading meanwhile
+        never reads a half-written graph or one that does not match the meta.
+        """
+        os.makedirs(folder, exist_ok=True)
+        prefix = f'hnsw-{self.fingerprint}'
+        graph_path = os.path.join(folder, prefix + '.bin')
+        tmp_path = f'{graph_path}.{os.getpid()}.tmp'
+        self._index.save_index(tmp_path)
+        os.replace(tmp_path, graph_path)
+
+        previous = _read_meta(folder).get('prefix')
+        _write_meta(folder, {'backend': self.backend, 'dim': self.dim, 'm': self.m,
+                             'ef_construction': self.ef_construction, 'ef_search': self.ef_search,
+                             'fingerprint': self.fingerprint, 'prefix': prefix})
+        _remove_superseded(folder, 'hnsw', prefix, previous, retain_seconds)
+
+    @classmethod
+    def load(cls, folder: str, meta: dict) -> 'HNSWIndex':
+        index = cls(dim=meta['dim'], m=meta['m'], ef_construction=meta['ef_construction'],
+                    ef_search=meta['ef_search'])
+        index._index = hnswlib.Index(space='ip', dim=index.dim)
+        # Indexes saved before files were named after their fingerprint used hnsw.bin
+        index._index.load_index(os.path.join(folder, meta.get('prefix', 'hnsw') + '.bin'))
+        index._index.set_ef(index.ef_search)
+        index.fingerprint = meta['fingerprint']
+        return index
+
+
+INDEX_BACKENDS = {
+    IVFIndex.backend: IVFIndex,
+    HNSWIndex.backend: HNSWIndex,
+}
+
+
+def _read_meta(folder: str) -> dict:
+    try:
+        with open(os.path.join(folder, META_FILENAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_meta(folder: str, meta: dict):
+    tmp_path = os.path.join(folder, f'{META_FILENAME}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(folder, META_FILENAME))
+
+
+def _remove_superseded(folder: str, backend_prefix: str, live: str, previous: Optional[str],
+                       retain_seconds: float):
+    """Remove index files other than ``live``'s once out of use for ``retain_seconds``.
+
+    The ``previous`` generation goes out of use now, so its clock starts
+    from its replacement rather than from when it was written.
+    """
+    now = time.time()
+    for filename in os.listdir(folder):
+        if not filename.startswith(backend_prefix) or filename.startswith(live + '.'):
+            continue
+        path = os.path.join(folder, filename)
+        try:
+            if previous and filename.startswith(previous + '.'):
+                os.utime(path, (now, now))
+            if os.path.getmtime(path) <= now - retain_seconds:
+                os.remove(path)
+        except OSError:
+            continue
+
+
+def create_index(config) -> Optional[object]:
+    """Create an unbuilt index from FACE_INDEX_* settings, or None for brute force"""
+    backend = config.get('FACE_INDEX_BACKEND', 'flat')
+    if backend == 'ivf':
+        return IVFIndex(nlist=config.get('FACE_IVF_NLIST', 1024),
+                        nprobe=config.get('FACE_IVF_NPROBE', 16))
+    if backend == 'hnsw':
+        return HNSWIndex(m=config.get('FACE_HNSW_M', 16),
+                         ef_construction=config.get('FACE_HNSW_EF_CONSTRUCTION', 200),
+                         ef_search=config.get('FACE_HNSW_EF_SEARCH', 64))
+    if backend != 'flat':
+        raise ValueError(f"Unknown face index backend: {backend}")
+    return None
+
+
+def load_index(encodings_folder: str) -> Optional[object]:
+    """Load the index persisted in encodings_folder, if any"""
+    folder = os.path.join(encodings_folder, INDEX_DIRNAME)
+    meta_path = os.path.join(folder, META_FILENAME)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        return INDEX_BACKENDS[meta['backend']].load(folder, meta)
+    except Exception as e:
+        logger.error(f"Error loading face index from {folder}: {str(e)}")
+        return None
+
+
+def save_index(index, encodings_folder: str):
+    """Persist index into encodings_folder"""
+    index.save(os.path.join(encodings_folder, INDEX_DIRNAME))
+
+
+def measure_recall(index, gallery: FaceGallery, probes: np.ndarray, k: int = 1,
+                   tolerance: float = 1.13) -> dict:
+    """Compare an approximate index against an exact brute-force scan.
+
+    ``recall_at_k`` is the fraction of true top-k neighbours the index also
+    returned. ``decision_agreement`` is the fraction of probes for which
+    the accept/reject decision at ``tolerance`` (and the accepted identity)
+    is the same as brute force, which is what matters for attendance.
+    """
+    started = time.perf_counter()
+    exact_ids, exact_distances = gallery.search(probes, k=k)
+    exact_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    approx_ids, approx_distances = index.search(probes, k=k)
+    approx_seconds = time.perf_counter() - started
+
+    hits = sum(len(np.intersect1d(exact, approx)) for exact, approx in zip(exact_ids, approx_ids))
+    exact_decision = np.where(exact_distances[:, 0] <= tolerance, exact_ids[:, 0], -1)
+    approx_decision = np.where(approx_distances[:, 0] <= tolerance, approx_ids[:, 0], -1)
+
+    n_probes = max(len(probes), 1)
+    return {
+        'backend': index.backend,
+        'probes': len(probes),
+        'k': k,
+        'tolerance': tolerance,
+        'recall_at_k': hits / float(n_probes * exact_ids.shape[1]) if exact_ids.size else 1.0,
+        'decision_agreement': float(np.mean(exact_decision == approx_decision)),
+        'exact_ms_per_probe': 1000.0 * exact_seconds / n_probes,
+        'index_ms_per_probe': 1000.0 * approx_seconds / n_probes,
+    }
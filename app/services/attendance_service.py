@@ -2,6 +2,9 @@ from datetime import datetime, date, timedelta
 from app import db
 from app.models import User, Attendance, Location, CDSchedule
 from app.services.face_recognition_service import FaceRecognitionService
+from app.services.registry import get_face_service
+from app.services.face_gallery import distance_to_confidence
+from app.services.timing import span
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,14 +12,22 @@ logger = logging.getLogger(__name__)
 class AttendanceService:
     """Service for handling attendance operations"""
     
-    def __init__(self):
-        self.face_service = FaceRecognitionService()
+    def __init__(self, face_service: FaceRecognitionService = None):
+        self.face_service = face_service or get_face_service()
     
     def mark_attendance_by_face_and_pin(self, state_code: str, pin: str, location_id: int) -> dict:
-        """Mark attendance using face recognition and a secure PIN"""
+        """Mark attendance using face recognition and a secure PIN.
+        
+        Each stage is timed (``attendance.*`` in ``app.services.timing``).
+        """
+        with span('attendance.total'):
+            return self._mark_attendance_by_face_and_pin(state_code, pin, location_id)
+
+    def _mark_attendance_by_face_and_pin(self, state_code: str, pin: str, location_id: int) -> dict:
         try:
             # Verify PIN
-            user = User.query.filter_by(state_code=state_code, is_active=True).first()
+            with span('attendance.lookup'):
+                user = User.query.filter_by(state_code=state_code, is_active=True).first()
             if not user:
                 return {
                     'success': False,
@@ -24,25 +35,31 @@ class AttendanceService:
                     'user_id': None
                 }
 
-            if not user.check_pin(pin):
+            with span('attendance.pin'):
+                pin_ok = user.check_pin(pin)
+            if not pin_ok:
                 return {
                     'success': False,
                     'message': 'Invalid PIN.',
                     'user_id': user.id
                 }
 
-            # Recognize face from camera
-            recognized_user_id, confidence = self.face_service.recognize_face_from_camera()
+            # The PIN already names the claimed identity, so verify 1:1 against it
+            probe = self.face_service.capture_probe_from_camera()
+            distance = self.face_service.verify(user.id, probe)
 
-            if recognized_user_id != user.id:
+            if distance > self.face_service.tolerance:
                 return {
                     'success': False,
                     'message': 'Face not recognized or mismatch. Please try again or contact admin.',
                     'user_id': user.id
                 }
+            confidence = distance_to_confidence(distance)
 
             # Check if location is scheduled for today
-            if not self.is_location_scheduled_today(location_id):
+            with span('attendance.schedule'):
+                scheduled = self.is_location_scheduled_today(location_id)
+            if not scheduled:
                 return {
                     'success': False,
                     'message': 'This location is not scheduled for today.',
@@ -51,11 +68,12 @@ class AttendanceService:
 
             # Check if already marked attendance today
             today = date.today()
-            existing_attendance = Attendance.query.filter_by(
-                user_id=user.id,
-                location_id=location_id,
-                attendance_date=today
-            ).first()
+            with span('attendance.duplicate_check'):
+                existing_attendance = Attendance.query.filter_by(
+                    user_id=user.id,
+                    location_id=location_id,
+                    attendance_date=today
+                ).first()
 
             if existing_attendance:
                 return {
@@ -74,8 +92,9 @@ class AttendanceService:
                 status=self._determine_attendance_status()
             )
 
-            db.session.add(attendance)
-            db.session.commit()
+            with span('attendance.commit'):
+                db.session.add(attendance)
+                db.session.commit()
 
             logger.info(f"Attendance marked for user {user.id} at location {location_id}")
 
@@ -0,0 +1,339 @@
+# Bulk face enrolment from a directory or CSV manifest
+import csv
+import hashlib
+import logging
+import os
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, List, Optional
+
+import cv2
+from flask import current_app
+
+from app import db
+from app.models import User, FaceImage, FaceTemplate, GalleryChange
+from app.models.face_encoding import centroid_encoding, pack_encoding, unpack_encoding, unpack_encodings
+from app.services.face_image_store import content_path, store_root, write_normalized
+from app.services.face_pipeline import embedding_model_path, get_pipeline
+from app.services.image_ingest import DEFAULT_MAX_PIXELS
+from app.services.face_recognition_service import FaceRecognitionService
+from app.services.registry import create_face_service
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp'}
+
+# Settings the encoding workers need; they run without an app context
+PIPELINE_SETTINGS = ('FACE_DETECTOR_MODEL', 'FACE_EMBEDDING_MODEL', 'FACE_DETECTION_THRESHOLD',
+                     'FACE_EMBEDDING_BATCH', 'FACE_MAX_IMAGE_PIXELS')
+
+# Keeps IN clauses under SQLite's bound-parameter limit
+QUERY_CHUNK = 900
+
+EnrolmentItem = namedtuple('EnrolmentItem', ['state_code', 'source_path'])
+EnrolmentFailure = namedtuple('EnrolmentFailure', ['state_code', 'source_path', 'reason'])
+# An image encoded for a user, ready to be stored as a template
+EncodedImage = namedtuple('EncodedImage', ['user_id', 'source_digest', 'digest', 'byte_size', 'encoding'])
+
+
+def read_manifest(source: str) -> List[EnrolmentItem]:
+    """Images to enrol from a directory or a CSV of ``state_code,image_path`` rows.
+
+    In a directory each image is named after its state code with ``/``
+    written as ``_`` (``NY_23A_1234.jpg``), or several images sit in a
+    sub-directory so named. CSV image paths are relative to the CSV file
+    and a state code may appear on several rows.
+    """
+    items = []
+    if os.path.isdir(source):
+        for entry in sorted(os.scandir(source), key=lambda entry: entry.name):
+            if entry.is_dir():
+                state_code = entry.name.replace('_', '/')
+                items.extend(EnrolmentItem(state_code, os.path.join(entry.path, name))
+                             for name in sorted(os.listdir(entry.path)) if _is_image(name))
+            elif _is_image(entry.name):
+                items.append(EnrolmentItem(os.path.splitext(entry.name)[0].replace('_', '/'), entry.path))
+        return items
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip() or row[0].strip().lower() == 'state_code':
+                continue
+            items.append(EnrolmentItem(row[0].strip(), os.path.join(base, row[1].strip())))
+    return items
+
+
+def _is_image(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's bytes, the ``source_digest`` of the image stored from it"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+_worker_service = None
+_worker_max_pixels = DEFAULT_MAX_PIXELS
+_worker_store_root = None
+
+
+def _init_worker(settings: dict, root: str):
+    """Load the face models once per worker; processes, not threads, use the cores"""
+    global _worker_service, _worker_max_pixels, _worker_store_root
+    cv2.setNumThreads(1)
+    pipeline = get_pipeline(settings)
+    if pipeline is None:
+        raise RuntimeError("Face models could not be loaded")
+    _worker_service = FaceRecognitionService(pipeline=pipeline)
+    _worker_max_pixels = settings.get('FACE_MAX_IMAGE_PIXELS') or DEFAULT_MAX_PIXELS
+    _worker_store_root = root
+
+
+def _encode_image(source_path: str):
+    """Worker: downscale one image into the content store and encode it.
+
+    Returns ``((digest, byte size, packed encoding), None)`` or ``(None, reason)``.
+    """
+    try:
+        with open(source_path, 'rb') as f:
+            digest, byte_size = write_normalized(f.read(), _worker_max_pixels, _worker_store_root)
+        encoding = _worker_service.extract_face_encoding(content_path(digest, _worker_store_root))
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
+    if encoding is None:
+        # The stored file is left to garbage collection, like a failed upload's
+        return None, 'Could not process face image'
+    return (digest, byte_size, pack_encoding(encoding)), None
+
+
+def enrol_images(items: List[EnrolmentItem], face_service: Optional[FaceRecognitionService] = None,
+                 workers: Optional[int] = None, batch_size: int = 500,
+                 progress: Optional[Callable[[int, int, int], None]] = None) -> dict:
+    """Encode images in a process pool and store them as face templates.
+
+    Images go to the content-addressed store (``face_image_store``), so a
+    picture already uploaded or enrolled for someone else shares its file
+    and, when encoded by the active model, skips the encoding. Results are
+    written every ``batch_size`` images with bulk inserts and updates in
+    one transaction, which also records the gallery changes. Images are
+    recognised by the SHA-256 of their bytes, so a run that was
+    interrupted can simply be repeated. The shared gallery snapshot is
+    rebuilt at the end. ``progress(done, total, failed)`` is called as
+    images complete.
+    """
+    started = time.perf_counter()
+    config = current_app.config
+    max_templates = config.get('FACE_MAX_TEMPLATES', 5)
+    face_service = face_service or create_face_service()
+    # Encode with the model the gallery is on, which a re-embedding may have changed
+    version = face_service.active_model_version()
+
+    failures = []
+    user_ids = _resolve_state_codes({item.state_code for item in items})
+    tasks = {}
+    for item in items:
+        user_id = user_ids.get(item.state_code)
+        if user_id is None:
+            failures.append(EnrolmentFailure(item.state_code, item.source_path, 'Unknown state code'))
+            continue
+        try:
+            source_digest = file_digest(item.source_path)
+        except OSError as e:
+            failures.append(EnrolmentFailure(item.state_code, item.source_path, f'{type(e).__name__}: {e}'))
+            continue
+        tasks.setdefault((user_id, source_digest), (item, user_id, source_digest))
+    tasks = list(tasks.values())
+
+    # Sources stored before, and the users already holding them as templates
+    stored = _stored_images(sorted({source_digest for _, _, source_digest in tasks}), version)
+    enrolled_digests = _existing_templates(sorted({user_id for _, user_id, _ in tasks}))
+    pending, encode = [], []
+    for item, user_id, source_digest in tasks:
+        digest, blob = stored.get(source_digest, (None, None))
+        if digest is None:
+            encode.append((item, user_id, source_digest))
+        elif (user_id, digest) not in enrolled_digests:
+            if blob is None:
+                encode.append((item, user_id, source_digest))
+            else:
+                pending.append(EncodedImage(user_id, source_digest, digest, None, blob))
+    skipped = len(tasks) - len(encode) - len(pending)
+    if skipped:
+        logger.info(f"Skipping {skipped} images enrolled by an earlier run")
+
+    total, done, enrolled = len(encode), 0, 0
+    workers = workers or os.cpu_count() or 1
+    settings = {key: config.get(key) for key in PIPELINE_SETTINGS}
+    settings['FACE_EMBEDDING_MODEL'] = embedding_model_path(config, version)
+    if encode:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(settings, store_root())) as executor:
+            # Bound the number of in-flight images so memory stays flat
+            queue = iter(encode)
+            in_flight = {}
+            while True:
+                while len(in_flight) < workers * 4:
+                    task = next(queue, None)
+                    if task is None:
+                        break
+                    in_flight[executor.submit(_encode_image, task[0].source_path)] = task
+                if not in_flight:
+                    break
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    item, user_id, source_digest = in_flight.pop(future)
+                    result, reason = future.result()
+                    if result is None:
+                        failures.append(EnrolmentFailure(item.state_code, item.source_path, reason))
+                    else:
+                        pending.append(EncodedImage(user_id, source_digest, *result))
+                    done += 1
+                if len(pending) >= batch_size:
+                    enrolled += _write_batch(pending, max_templates, version)
+                    pending = []
+                if progress is not None:
+                    progress(done, total, len(failures))
+    if pending:
+        enrolled += _write_batch(pending, max_templates, version)
+
+    if enrolled:
+        face_service.load_known_faces(use_snapshot=False)
+
+    return {
+        'enrolled': enrolled,
+        'skipped': skipped,
+        'failed': len(failures),
+        'failures': failures,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+
+
+def _resolve_state_codes(state_codes) -> dict:
+    state_codes = sorted(state_codes)
+    user_ids = {}
+    for start in range(0, len(state_codes), QUERY_CHUNK):
+        rows = db.session.query(User.state_code, User.id).filter(
+            User.state_code.in_(state_codes[start:start + QUERY_CHUNK])
+        ).all()
+        user_ids.update(rows)
+    return user_ids
+
+
+def _stored_images(source_digests, model_version: str) -> dict:
+    """Source digest -> (stored digest, encoding cached for ``model_version`` or None)"""
+    stored = {}
+    for start in range(0, len(source_digests), QUERY_CHUNK):
+        for source_digest, digest, blob, version in db.session.query(
+                FaceImage.source_digest, FaceImage.digest, FaceImage.encoding, FaceImage.model_version
+        ).filter(FaceImage.source_digest.in_(source_digests[start:start + QUERY_CHUNK])):
+            if os.path.exists(content_path(digest)):
+                stored[source_digest] = (digest, blob if version == model_version else None)
+    return stored
+
+
+def _existing_templates(user_ids) -> set:
+    """(user id, image digest) of the stored images these users are enrolled with"""
+    existing = set()
+    for start in range(0, len(user_ids), QUERY_CHUNK):
+        existing.update(db.session.query(FaceTemplate.user_id, FaceTemplate.image_digest).filter(
+            FaceTemplate.user_id.in_(user_ids[start:start + QUERY_CHUNK]),
+            FaceTemplate.image_digest.isnot(None)
+        ))
+    return existing
+
+
+def _write_batch(results: List[EncodedImage], max_templates: int, model_version: Optional[str] = None) -> int:
+    """Insert templates, refresh the affected centroids and log the changes in one commit.
+
+    Also records new stored images, caches their encodings and counts the
+    templates' references to them. Returns the number of templates stored.
+    """
+    try:
+        user_ids = sorted({result.user_id for result in results})
+        enrolled = _existing_templates(user_ids)
+        digests = sorted({result.digest for result in results})
+        images = {}
+        for start in range(0, len(digests), QUERY_CHUNK):
+            images.update(db.session.query(FaceImage.digest, FaceImage.model_version).filter(
+                FaceImage.digest.in_(digests[start:start + QUERY_CHUNK])))
+
+        new_images, cached, templates_added, references = {}, {}, [], Counter()
+        for result in results:
+            if (result.user_id, result.digest) in enrolled:
+                continue  # the same picture twice for one user
+            enrolled.add((result.user_id, result.digest))
+            if result.digest not in images:
+                new_images.setdefault(result.digest, {
+                    'digest': result.digest, 'source_digest': result.source_digest,
+                    'byte_size': result.byte_size, 'encoding': result.encoding,
+                    'model_version': model_version, 'ref_count': 0})
+            elif images[result.digest] != model_version:
+                cached[result.digest] = {'digest': result.digest, 'encoding': result.encoding,
+                                         'model_version': model_version}
+            templates_added.append({'user_id': result.user_id, 'encoding': result.encoding,
+                                    'image_path': content_path(result.digest), 'image_digest': result.digest,
+                                    'model_version': model_version})
+            references[result.digest] += 1
+        if not templates_added:
+            return 0
+
+        db.session.bulk_insert_mappings(FaceImage, list(new_images.values()))
+        db.session.bulk_update_mappings(FaceImage, list(cached.values()))
+        for digest, count in references.items():
+            FaceImage.retain(digest, count)
+        db.session.bulk_insert_mappings(FaceTemplate, templates_added)
+
+        latest_paths = {template['user_id']: template['image_path'] for template in templates_added}
+        user_ids = sorted(latest_paths)
+        rows = []
+        for start in range(0, len(user_ids), QUERY_CHUNK):
+            rows.extend(db.session.query(FaceTemplate.id, FaceTemplate.user_id, FaceTemplate.encoding,
+                                         FaceTemplate.image_digest).filter(
+                FaceTemplate.user_id.in_(user_ids[start:start + QUERY_CHUNK])
+            ).order_by(FaceTemplate.id).all())
+
+        templates = {}
+        for template_id, user_id, blob, digest in rows:
+            templates.setdefault(user_id, []).append((template_id, blob, digest))
+
+        # Centroids are of the active model's encodings; older templates of
+        # another dimension are left out
+        dim = len(unpack_encoding(templates_added[0]['encoding']))
+        stale_ids, released, updates = [], Counter(), []
+        for user_id, user_templates in templates.items():
+            if max_templates and len(user_templates) > max_templates:
+                for template_id, _, digest in user_templates[:-max_templates]:
+                    stale_ids.append(template_id)
+                    if digest is not None:
+                        released[digest] += 1
+                user_templates = user_templates[-max_templates:]
+            matrix, valid = unpack_encodings([blob for _, blob, _ in user_templates], dim)
+            if not valid.any():
+                continue
+            # A staged re-embedding is redone with the new template
+            updates.append({'id': user_id, 'face_encoding': pack_encoding(centroid_encoding(matrix[valid])),
+                            'face_image_path': latest_paths[user_id], 'face_encoding_version': model_version,
+                            'next_face_encoding': None, 'next_encoding_version': None})
+
+        for start in range(0, len(stale_ids), QUERY_CHUNK):
+            FaceTemplate.query.filter(FaceTemplate.id.in_(stale_ids[start:start + QUERY_CHUNK])).delete(
+                synchronize_session=False)
+        for digest, count in released.items():
+            FaceImage.release(digest, count)
+        db.session.bulk_update_mappings(User, updates)
+        db.session.bulk_insert_mappings(GalleryChange, [
+            {'user_id': update['id'], 'operation': GalleryChange.UPSERT} for update in updates
+        ])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    logger.info(f"Stored {len(templates_added)} face templates for {len(updates)} users")
+    return len(templates_added)
@@ -0,0 +1,458 @@
+# Multi-camera frame ingest for the scheduled locations' cameras
+import itertools
+import logging
+import threading
+import time
+from collections import Counter, deque, namedtuple
+from datetime import date, datetime
+from typing import Callable, Dict, Optional
+
+import cv2
+import numpy as np
+from flask import current_app
+
+from app import db
+from app.models import Attendance, CDSchedule, Location
+from app.services.attendance_service import AttendanceService
+from app.services.face_pipeline import get_pipeline
+from app.services.face_tracker import FaceTracker
+from app.services.frame_gate import FrameGate, create_gate
+from app.services.registry import get_face_service
+from app.services.unknown_faces import record_unknown_face
+
+logger = logging.getLogger(__name__)
+
+Frame = namedtuple('Frame', ['location_id', 'camera_id', 'sequence', 'captured_at', 'image'])
+
+
+class OpenCVSource:
+    """Frames from ``cv2.VideoCapture``: a device index, a stream URL or a video file.
+
+    With ``realtime`` (the default for files) reads are paced to the
+    file's frame rate, so a recording stands in for a live camera.
+    """
+
+    def __init__(self, camera_id: str, realtime: Optional[bool] = None):
+        target = int(camera_id) if str(camera_id).isdigit() else camera_id
+        self.capture = cv2.VideoCapture(target)
+        if not self.capture.isOpened():
+            raise IOError(f"Cannot open camera {camera_id}")
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # device-side queueing would add latency
+        is_file = isinstance(target, str) and '://' not in target
+        fps = self.capture.get(cv2.CAP_PROP_FPS) or 0
+        self.interval = 1.0 / fps if (realtime if realtime is not None else is_file) and fps > 0 else 0.0
+        self._next_read = time.monotonic()
+
+    def read(self) -> Optional[np.ndarray]:
+        if self.interval:
+            delay = self._next_read - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_read = max(self._next_read, time.monotonic() - self.interval) + self.interval
+        ok, image = self.capture.read()
+        return image if ok else None
+
+    def release(self):
+        self.capture.release()
+
+
+class SyntheticSource:
+    """Frames from a list or a ``sequence -> image`` function, at up to ``fps``.
+
+    Returns None once a list is exhausted unless ``loop`` is set.
+    """
+
+    def __init__(self, frames, fps: float = 0.0, loop: bool = False):
+        self.frames = frames
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.loop = loop
+        self.sequence = 0
+        self._next_read = time.monotonic()
+
+    def read(self) -> Optional[np.ndarray]:
+        if self.interval:
+            delay = self._next_read - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_read = max(self._next_read, time.monotonic() - self.interval) + self.interval
+        if callable(self.frames):
+            image = self.frames(self.sequence)
+        elif self.sequence < len(self.frames) or (self.loop and self.frames):
+            image = self.frames[self.sequence % len(self.frames)]
+        else:
+            image = None
+        self.sequence += 1
+        return image
+
+    def release(self):
+        pass
+
+
+class FrameBuffer:
+    """Bounded per-camera rings of frames, shared by the recognition workers.
+
+    Capture never blocks: a full ring overwrites its oldest frame. Workers
+    serve cameras round-robin and always take a camera's newest frame,
+    discarding the older ones and any past ``max_age`` seconds, so a slow
+    pool drops stale frames instead of falling further behind the cameras.
+    """
+
+    def __init__(self, capacity: int = 4, max_age: float = 1.0, clock=time.monotonic):
+        self.capacity = capacity
+        self.max_age = max_age
+        self.clock = clock
+        self.stats = {}  # location_id -> Counter of captured, overwritten, stale, taken
+        self._rings = {}  # location_id -> deque of frames
+        self._turn = deque()  # round-robin order of location ids
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def put(self, frame: Frame):
+        with self._condition:
+            ring = self._rings.get(frame.location_id)
+            if ring is None:
+                ring = self._rings[frame.location_id] = deque(maxlen=self.capacity)
+                self._turn.append(frame.location_id)
+            stats = self.stats.setdefault(frame.location_id, Counter())
+            if len(ring) == ring.maxlen:
+                stats['overwritten'] += 1
+            ring.append(frame)
+            stats['captured'] += 1
+            self._condition.notify()
+
+    def take(self, timeout: Optional[float] = None) -> Optional[Frame]:
+        """The next camera's newest fresh frame; None on timeout or once closed"""
+        deadline = None if timeout is None else self.clock() + timeout
+        with self._condition:
+            while not self._closed:
+                frame = self._take_ready()
+                if frame is not None:
+                    return frame
+                remaining = None if deadline is None else deadline - self.clock()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            return None
+
+    def _take_ready(self) -> Optional[Frame]:
+        now = self.clock()
+        for _ in range(len(self._turn)):
+            location_id = self._turn[0]
+            self._turn.rotate(-1)
+            ring = self._rings[location_id]
+            if not ring:
+                continue
+            frame = ring.pop()
+            stats = self.stats[location_id]
+            stats['stale'] += len(ring)
+            ring.clear()
+            if now - frame.captured_at > self.max_age:
+                stats['stale'] += 1
+                continue
+            stats['taken'] += 1
+            return frame
+        return None
+
+    def remove(self, location_id: int):
+        """Forget a camera that stopped capturing"""
+        with self._condition:
+            self._rings.pop(location_id, None)
+            if location_id in self._turn:
+                self._turn.remove(location_id)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def snapshot(self) -> dict:
+        """A copy of the per-camera counters"""
+        with self._condition:
+            return {location_id: dict(counter) for location_id, counter in self.stats.items()}
+
+
+class CameraCapture(threading.Thread):
+    """Reads one location's camera into the frame buffer at up to ``fps``.
+
+    Every frame the source delivers is read, so devices never serve old
+    buffered frames, but only one per ``1 / fps`` seconds is kept, and
+    only if the ``gate`` (a ``FrameGate``) passes it. A source that fails
+    or ends is reopened after ``reconnect_seconds``.
+    """
+
+    def __init__(self, location_id: int, camera_id: str, open_source: Callable, buffer: FrameBuffer,
+                 fps: float = 5.0, reconnect_seconds: float = 5.0, gate: Optional[FrameGate] = None):
+        super().__init__(name=f'camera-{location_id}', daemon=True)
+        self.location_id = location_id
+        self.camera_id = camera_id
+        self.open_source = open_source
+        self.buffer = buffer
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.reconnect_seconds = reconnect_seconds
+        self.gate = gate
+        self.stopping = threading.Event()
+
+    def run(self):
+        sequence = itertools.count()
+        while not self.stopping.is_set():
+            try:
+                source = self.open_source(self.camera_id)
+            except Exception as e:
+                logger.error(f"Camera {self.camera_id} at location {self.location_id}: {str(e)}")
+                self.stopping.wait(self.reconnect_seconds)
+                continue
+            if self.gate is not None:
+                self.gate.reset(self.location_id)
+            try:
+                last_kept = float('-inf')
+                while not self.stopping.is_set():
+                    image = source.read()
+                    if image is None:
+                        logger.warning(f"Camera {self.camera_id} at location {self.location_id} "
+                                       f"stopped delivering frames")
+                        break
+                    now = self.buffer.clock()
+                    if now - last_kept < self.interval:
+                        continue
+                    last_kept = now
+                    if self.gate is not None and self.gate.check(self.location_id, image):
+                        continue
+                    self.buffer.put(Frame(self.location_id, self.camera_id, next(sequence), now, image))
+            finally:
+                source.release()
+            self.stopping.wait(self.reconnect_seconds)
+
+    def stop(self):
+        self.stopping.set()
+
+
+def active_cameras() -> Dict[int, str]:
+    """``location_id -> camera_id`` for active locations with a camera whose schedule is running now"""
+    now = datetime.now().time()
+    rows = CDSchedule.query.join(Location).filter(
+        CDSchedule.schedule_date == date.today(),
+        CDSchedule.is_active == True,
+        CDSchedule.is_cancelled == False,
+        CDSchedule.start_time <= now,
+        CDSchedule.end_time >= now,
+        Location.is_active == True,
+        Location.camera_id.isnot(None),
+        Location.camera_id != ''
+    ).with_entities(Location.id, Location.camera_id).all()
+    return dict(rows)
+
+
+class CameraIngest:
+    """Capture threads for the scheduled cameras feeding a shared recognition pool.
+
+    ``handle(frame)`` runs on one of ``workers`` threads, each inside an
+    app context. ``open_source(camera_id)`` defaults to ``OpenCVSource``;
+    tests and dry runs pass synthetic or video-file sources instead.
+    """
+
+    def __init__(self, app, handle: Callable[[Frame], None], open_source: Callable = OpenCVSource,
+                 workers: Optional[int] = None, gate: Optional[FrameGate] = None):
+        config = app.config
+        self.app = app
+        self.handle = handle
+        self.open_source = open_source
+        self.workers = workers or config.get('CAMERA_WORKERS', 2)
+        self.fps = config.get('CAMERA_CAPTURE_FPS', 5.0)
+        self.reconnect_seconds = config.get('CAMERA_RECONNECT_SECONDS', 5.0)
+        self.buffer = FrameBuffer(config.get('CAMERA_BUFFER_FRAMES', 4), config.get('CAMERA_MAX_FRAME_AGE', 1.0))
+        self.gate = gate if gate is not None else create_gate(config)
+        self.captures = {}  # location_id -> CameraCapture
+        self.processed = Counter()  # location_id -> frames handled
+        self._worker_threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'recognition-{number}', daemon=True)
+            thread.start()
+            self._worker_threads.append(thread)
+
+    def sync_cameras(self, cameras: Dict[int, str]):
+        """Start capturing ``location_id -> camera_id`` and stop every other camera"""
+        for location_id, capture in list(self.captures.items()):
+            if cameras.get(location_id) != capture.camera_id:
+                capture.stop()
+                del self.captures[location_id]
+                self.buffer.remove(location_id)
+                logger.info(f"Stopped camera {capture.camera_id} at location {location_id}")
+        for location_id, camera_id in cameras.items():
+            if location_id not in self.captures:
+                capture = CameraCapture(location_id, camera_id, self.open_source, self.buffer,
+                                        fps=self.fps, reconnect_seconds=self.reconnect_seconds, gate=self.gate)
+                capture.start()
+                self.captures[location_id] = capture
+                logger.info(f"Started camera {camera_id} at location {location_id}")
+
+    def run(self, stop: Optional[threading.Event] = None, poll_seconds: Optional[float] = None):
+        """Follow the schedule until stopped, checking it every ``poll_seconds``"""
+        stop = stop or threading.Event()
+        poll_seconds = poll_seconds or self.app.config.get('CAMERA_SCHEDULE_POLL_SECONDS', 30)
+        self.start()
+        try:
+            while not stop.is_set():
+                with self.app.app_context():
+                    try:
+                        self.sync_cameras(active_cameras())
+                    except Exception as e:
+                        logger.error(f"Error reading camera schedule: {str(e)}")
+                self.log_stats()
+                stop.wait(poll_seconds)
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.sync_cameras({})
+        self.buffer.close()
+        for thread in self._worker_threads:
+            thread.join()
+        self._worker_threads = []
+
+    def stats(self) -> dict:
+        """Per-location frame counters, including the gate's and the handler's"""
+        counters = self.buffer.snapshot()
+        for source in (self.gate, self.handle):
+            for location_id, counter in (source.snapshot() if hasattr(source, 'snapshot') else {}).items():
+                counters.setdefault(location_id, {}).update(counter)
+        with self._lock:
+            for location_id, counter in counters.items():
+                counter['processed'] = self.processed[location_id]
+        return counters
+
+    def log_stats(self):
+        for location_id, counter in sorted(self.stats().items()):
+            skipped = sum(count for name, count in counter.items() if name.startswith('skipped_'))
+            sampled = skipped + counter.get('passed', 0)
+            logger.info(f"Location {location_id}: gate skipped {skipped}/{sampled} frames, "
+                        f"processed {counter['processed']}, dropped "
+                        f"{counter.get('overwritten', 0) + counter.get('stale', 0)} stale; "
+                        f"{counter.get('recognitions', 0)} recognitions for {counter.get('faces', 0)} faces")
+
+    def _work(self):
+        with self.app.app_context():
+            while True:
+                frame = self.buffer.take()
+                if frame is None:
+                    break
+                try:
+                    self.handle(frame)
+                except Exception as e:
+                    logger.error(f"Error recognizing frame from location {frame.location_id}: {str(e)}")
+                finally:
+                    db.session.remove()
+                with self._lock:
+                    self.processed[frame.location_id] += 1
+
+
+class FrameRecognizer:
+    """Default frame handler: track faces across frames and mark attendance.
+
+    Faces are detected on every frame and followed with a ``FaceTracker``
+    per location; only tracks that are new, still unknown or due for
+    re-verification are embedded and matched, so a person standing in
+    view costs detection alone. The first identification of a track is
+    its one attendance event, and the first crop of a track nobody matched
+    goes to the unknown face store. Worker threads share the app's
+    ``FaceRecognitionService`` (see ``app.services.registry``), and a
+    member is marked once per location and day.
+    """
+
+    def __init__(self):
+        self.counts = {}  # location_id -> Counter of faces seen, recognitions run, events emitted
+        self._trackers = {}  # location_id -> (lock, FaceTracker)
+        self._marked = set()  # (location_id, user_id) marked on _marked_on
+        self._marking = set()  # (location_id, user_id) being marked by a worker
+        self._marked_on = date.today()
+        self._lock = threading.Lock()
+
+    def _tracker(self, location_id: int):
+        with self._lock:
+            if location_id not in self._trackers:
+                config = current_app.config
+                self._trackers[location_id] = (threading.Lock(), FaceTracker(
+                    iou_threshold=config.get('CAMERA_TRACK_IOU', 0.3),
+                    max_age=config.get('CAMERA_TRACK_MAX_AGE', 1.5),
+                    retry_seconds=config.get('CAMERA_TRACK_RETRY_SECONDS', 1.0),
+                    reverify_seconds=config.get('CAMERA_TRACK_REVERIFY_SECONDS', 10.0)))
+            return self._trackers[location_id]
+
+    def __call__(self, frame: Frame):
+        service = get_face_service()
+        service.refresh()  # a re-embedded gallery switches the model too
+        pipeline = get_pipeline(current_app.config, service.active_model_version())
+        if pipeline is None:
+            return
+        faces = pipeline.detect(frame.image)
+        lock, tracker = self._tracker(frame.location_id)
+        with lock:
+            # Workers may finish a camera's frames out of order
+            if frame.sequence <= tracker.last_sequence:
+                return
+            tracker.last_sequence = frame.sequence
+            tracks = tracker.update([face.box for face in faces], frame.captured_at)
+            due = [(face, track) for face, track in zip(faces, tracks) if tracker.claim(track, frame.captured_at)]
+        self._count(frame.location_id, faces=len(faces), recognitions=len(due))
+        if not due:
+            return
+
+        crops = [pipeline.align(frame.image, face) for face, _ in due]
+        encodings = pipeline.embed(crops)
+        matches = service.identify_encodings(encodings, frame.location_id)
+        with lock:
+            events = [(track, user_id, confidence) for (_, track), (user_id, confidence) in zip(due, matches)
+                      if tracker.assign(track, user_id, confidence, frame.captured_at)]
+            # One face per unrecognized track is kept for review
+            unknown = [row for row, (_, track) in enumerate(due)
+                       if matches[row][0] is None and not track.kept_unknown]
+            for row in unknown:
+                due[row][1].kept_unknown = True
+        for row in unknown:
+            record_unknown_face(encodings[row], crops[row], frame.location_id)
+        for track, user_id, confidence in events:
+            self._count(frame.location_id, events=1)
+            self.on_match(frame, user_id, confidence)
+
+    def _count(self, location_id: int, **counts):
+        with self._lock:
+            self.counts.setdefault(location_id, Counter()).update(counts)
+
+    def snapshot(self) -> dict:
+        """A copy of the per-location counters"""
+        with self._lock:
+            return {location_id: dict(counter) for location_id, counter in self.counts.items()}
+
+    def on_match(self, frame: Frame, user_id: int, confidence: float):
+        """A track was identified as ``user_id``: mark them present.
+
+        Only a mark that succeeded (or found one already made) is
+        remembered, so a failed attempt is repeated by the member's next
+        track; the memory is cleared when the day changes.
+        """
+        key = (frame.location_id, user_id)
+        today = date.today()
+        with self._lock:
+            if today != self._marked_on:
+                self._marked.clear()
+                self._marked_on = today
+            if key in self._marked or key in self._marking:
+                return
+            self._marking.add(key)
+        try:
+            schedule = CDSchedule.get_active_schedule_for_location(frame.location_id)
+            if schedule is None:
+                return
+            result = AttendanceService(get_face_service()).mark_attendance(user_id, schedule.id, method='face')
+            logger.info(f"Camera {frame.camera_id} saw user {user_id} ({confidence:.2f}): {result['message']}")
+            marked = result['success'] or Attendance.query.filter_by(
+                user_id=user_id, location_id=frame.location_id, attendance_date=today).first() is not None
+            if marked:
+                with self._lock:
+                    if today == self._marked_on:
+                        self._marked.add(key)
+        finally:
+            with self._lock:
+                self._marking.discard(key)
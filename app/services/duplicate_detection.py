@@ -0,0 +1,105 @@
+# Suspected duplicate enrolments: all-pairs gallery similarity in bounded tiles
+import csv
+import logging
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from app.models import User
+from app.services.face_gallery import distance_to_confidence, normalize_encodings, similarity_to_distance
+
+logger = logging.getLogger(__name__)
+
+DuplicatePair = namedtuple('DuplicatePair', 'user_id other_user_id distance')
+
+REPORT_COLUMNS = ['user_id', 'state_code', 'full_name', 'other_user_id', 'other_state_code',
+                  'other_full_name', 'distance', 'confidence']
+
+
+def distance_to_similarity(distance: float) -> float:
+    """Cosine similarity of unit vectors at the given euclidean distance"""
+    return 1.0 - distance * distance / 2.0
+
+
+def find_duplicates(user_ids, encodings, max_distance: float, block_size: int = 2048,
+                    workers: Optional[int] = None,
+                    progress: Optional[Callable[[int, int], None]] = None) -> List[DuplicatePair]:
+    """Pairs of users whose encodings lie within ``max_distance`` of each other.
+
+    The similarity matrix is never materialized. Only the tiles on and
+    above the diagonal are computed, each ``block_size`` rows square,
+    and only pairs over the threshold are kept. Tiles are spread over a
+    thread pool, because numpy releases the GIL inside the matrix
+    product. At most ``workers`` tiles are in memory at once (4 bytes per
+    score). ``progress(done, total)`` is called as tiles finish. Pairs
+    are returned closest first, each with ``user_id < other_user_id``.
+    """
+    user_ids = np.asarray(user_ids)
+    matrix = normalize_encodings(encodings) if len(user_ids) else np.empty((0, 0), np.float32)
+    threshold = np.float32(distance_to_similarity(max_distance))
+    starts = range(0, len(user_ids), block_size)
+    tiles = [(row, column) for row in starts for column in starts if column >= row]
+
+    def scan(tile):
+        row, column = tile
+        scores = matrix[row:row + block_size] @ matrix[column:column + block_size].T
+        if row == column:
+            scores[np.tri(*scores.shape, dtype=bool)] = -np.inf  # each pair once, not against itself
+        # Almost every row has no pair over the threshold; search only those that do
+        candidates = np.flatnonzero(scores.max(axis=1) >= threshold)
+        rows, columns = np.nonzero(scores[candidates] >= threshold)
+        rows = candidates[rows]
+        return row + rows, column + columns, scores[rows, columns]
+
+    found_rows, found_columns, found_scores = [], [], []
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        for done, (rows, columns, scores) in enumerate(executor.map(scan, tiles), start=1):
+            found_rows.append(rows)
+            found_columns.append(columns)
+            found_scores.append(scores)
+            if progress is not None:
+                progress(done, len(tiles))
+    if not tiles:
+        return []
+
+    rows, columns, scores = (np.concatenate(found) for found in (found_rows, found_columns, found_scores))
+    order = np.argsort(-scores, kind='stable')
+    first, second = user_ids[rows[order]], user_ids[columns[order]]
+    distances = similarity_to_distance(scores[order])
+    return [DuplicatePair(int(min(a, b)), int(max(a, b)), float(distance))
+            for a, b, distance in zip(first, second, distances)]
+
+
+def write_report(pairs: List[DuplicatePair], path: str, chunk_size: int = 500) -> int:
+    """Write ``pairs`` with both members' details to a CSV file; returns the row count"""
+    ids = sorted({user_id for pair in pairs for user_id in pair[:2]})
+    users = {}
+    for start in range(0, len(ids), chunk_size):
+        for user in User.query.filter(User.id.in_(ids[start:start + chunk_size])):
+            users[user.id] = user
+
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(REPORT_COLUMNS)
+        for pair in pairs:
+            user, other = users.get(pair.user_id), users.get(pair.other_user_id)
+            writer.writerow([pair.user_id, user.state_code if user else '', user.full_name if user else '',
+                             pair.other_user_id, other.state_code if other else '',
+                             other.full_name if other else '', f'{pair.distance:.4f}',
+                             f'{distance_to_confidence(pair.distance):.4f}'])
+    return len(pairs)
+
+
+def scan_gallery(gallery, max_distance: float, block_size: int = 2048, workers: Optional[int] = None,
+                 progress=None) -> List[DuplicatePair]:
+    """Suspected duplicates among the users of a loaded ``FaceGallery`` (one centroid each)"""
+    started = time.perf_counter()
+    pairs = find_duplicates(gallery.user_ids, gallery.encodings, max_distance, block_size=block_size,
+                            workers=workers, progress=progress)
+    logger.info(f"Scanned {len(gallery)} users for duplicates in {time.perf_counter() - started:.1f}s; "
+                f"{len(pairs)} pairs within {max_distance}")
+    return pairs
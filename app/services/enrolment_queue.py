@@ -0,0 +1,212 @@
+# Persistent face enrolment queue, decoupled from the upload request
+import os
+import socket
+import threading
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+from flask import current_app
+
+from app import db
+from app.models import User, EnrolmentJob
+from app.services.face_recognition_service import FaceRecognitionService
+from app.services.registry import get_face_service
+from app.services.image_ingest import DEFAULT_MAX_PIXELS, ImageTooLarge, probe_image
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'bmp'}
+
+# One pool per process, shared by every request handled in it
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def worker_name() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def enqueue_face_image(user_id: int, image_file) -> EnrolmentJob:
+    """Persist the raw upload and queue it for encoding.
+
+    Only the bytes are written here, so the request returns as soon as
+    the job row is committed. Raises ``ValueError`` for uploads that are
+    empty or not an image type.
+    """
+    filename = getattr(image_file, 'filename', '') or ''
+    if '.' not in filename or filename.rsplit('.', 1)[1].lower() not in ALLOWED_EXTENSIONS:
+        raise ValueError('Invalid image format')
+    data = image_file.read()
+    if not data:
+        raise ValueError('Empty image file')
+    # Header-only check, so bombs and non-images are refused before queueing
+    try:
+        probe_image(data, current_app.config.get('FACE_MAX_IMAGE_PIXELS', DEFAULT_MAX_PIXELS))
+    except ImageTooLarge:
+        raise ValueError('Image resolution is too large')
+    except Exception:
+        raise ValueError('Invalid image file')
+
+    job = EnrolmentJob(id=uuid.uuid4().hex, user_id=user_id, original_filename=filename[:255])
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'enrolment')
+    os.makedirs(folder, exist_ok=True)
+    job.upload_path = os.path.join(folder, job.id)
+    with open(job.upload_path, 'wb') as f:
+        f.write(data)
+
+    db.session.add(job)
+    db.session.commit()
+    _dispatch(job.id)
+    return job
+
+
+def _dispatch(job_id: str):
+    """Hand a job to this process's worker threads, if it runs any"""
+    workers = current_app.config.get('FACE_ENROLMENT_WORKERS', 2)
+    if workers <= 0:
+        return  # left to `flask enrolment-worker`
+    global _executor
+    app = current_app._get_current_object()
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='enrolment')
+            interval = current_app.config.get('FACE_ENROLMENT_SWEEP_INTERVAL', 60)
+            threading.Thread(target=_sweep, args=(app, _executor, interval), daemon=True,
+                             name='enrolment-sweeper').start()
+    _executor.submit(_run_in_app, app, job_id)
+
+
+def _sweep(app, executor: ThreadPoolExecutor, interval: float):
+    """Drain the queue now and every ``interval`` seconds.
+
+    Picks up jobs orphaned by a previous process, jobs whose worker
+    stalled (via ``requeue_stale_jobs``) and any job no request handed to
+    this process. Each sweep finishes before the next is scheduled.
+    """
+    while True:
+        try:
+            executor.submit(_run_in_app, app, None).result()
+        except RuntimeError:
+            return  # the pool was shut down
+        time.sleep(interval)
+
+
+def _run_in_app(app, job_id: Optional[str]):
+    with app.app_context():
+        try:
+            if job_id is None:
+                while process_next() is not None:
+                    pass
+                return
+            job = claim(job_id)
+            if job is not None:
+                process(job)
+        except Exception as e:
+            logger.error(f"Enrolment worker error: {str(e)}")
+        finally:
+            db.session.remove()
+
+
+def _claim_where(*criteria) -> bool:
+    """Move a job to running with a conditional update, so exactly one worker wins it"""
+    claimed = EnrolmentJob.query.filter(*criteria).update({
+        EnrolmentJob.status: EnrolmentJob.RUNNING,
+        EnrolmentJob.worker: worker_name(),
+        EnrolmentJob.started_at: datetime.utcnow(),
+        EnrolmentJob.attempts: EnrolmentJob.attempts + 1,
+    }, synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+
+def claim(job_id: str) -> Optional[EnrolmentJob]:
+    """Claim a specific queued job; None if another worker already has it"""
+    if not _claim_where(EnrolmentJob.id == job_id, EnrolmentJob.status == EnrolmentJob.QUEUED):
+        return None
+    return db.session.get(EnrolmentJob, job_id)
+
+
+def requeue_stale_jobs() -> int:
+    """Return jobs whose worker died mid-run to the queue, failing those out of attempts"""
+    config = current_app.config
+    stale = (EnrolmentJob.status == EnrolmentJob.RUNNING,
+             EnrolmentJob.started_at < datetime.utcnow() - timedelta(
+                 seconds=config.get('FACE_ENROLMENT_JOB_TIMEOUT', 300)))
+    max_attempts = config.get('FACE_ENROLMENT_MAX_ATTEMPTS', 3)
+    EnrolmentJob.query.filter(*stale, EnrolmentJob.attempts >= max_attempts).update({
+        EnrolmentJob.status: EnrolmentJob.FAILED,
+        EnrolmentJob.message: 'Error processing face image',
+        EnrolmentJob.finished_at: datetime.utcnow(),
+    }, synchronize_session=False)
+    requeued = EnrolmentJob.query.filter(*stale).update(
+        {EnrolmentJob.status: EnrolmentJob.QUEUED}, synchronize_session=False)
+    db.session.commit()
+    if requeued:
+        logger.warning(f"Requeued {requeued} stalled enrolment jobs")
+    return requeued
+
+
+def process_next() -> Optional[EnrolmentJob]:
+    """Claim and run the oldest queued job; None when the queue is empty"""
+    requeue_stale_jobs()
+    while True:
+        job_id = db.session.query(EnrolmentJob.id).filter(
+            EnrolmentJob.status == EnrolmentJob.QUEUED
+        ).order_by(EnrolmentJob.created_at).limit(1).scalar()
+        if job_id is None:
+            return None
+        job = claim(job_id)
+        if job is not None:
+            process(job)
+            return job
+
+
+def process(job: EnrolmentJob, face_service: Optional[FaceRecognitionService] = None):
+    """Encode a claimed job's upload and record the outcome on the job"""
+    face_service = face_service or get_face_service()
+    user = db.session.get(User, job.user_id)
+    try:
+        if user is None:
+            result = {'success': False, 'message': 'User not found'}
+        else:
+            result = face_service.enroll_face_image(user, job.upload_path)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error processing enrolment job {job.id}: {str(e)}")
+        if job.attempts < current_app.config.get('FACE_ENROLMENT_MAX_ATTEMPTS', 3) and \
+                os.path.exists(job.upload_path):
+            job.status = EnrolmentJob.QUEUED
+            db.session.commit()
+            _dispatch(job.id)
+            return
+        result = {'success': False, 'message': 'Error processing face image'}
+
+    job.status = EnrolmentJob.DONE if result['success'] else EnrolmentJob.FAILED
+    job.message = result['message']
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    if os.path.exists(job.upload_path):
+        os.remove(job.upload_path)
+
+
+def run_worker(poll_interval: float = 1.0, once: bool = False,
+               stop: Optional[threading.Event] = None) -> int:
+    """Process jobs until stopped, or with ``once`` until the queue is empty.
+
+    Returns the number of jobs processed.
+    """
+    processed = 0
+    while not (stop and stop.is_set()):
+        job = process_next()
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        processed += 1
+        logger.info(f"Enrolment job {job.id} {job.status}: {job.message}")
+    return processed
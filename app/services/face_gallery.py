@@ -0,0 +1,372 @@
+# Vectorized 1:N face gallery
+import numpy as np
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+ENCODING_DIM = 128
+
+# Upper bound on the number of similarity scores held in memory at once
+# while scanning (probes x gallery rows), roughly 128MB of float32.
+MAX_SCORES_PER_BLOCK = 32 * 1024 * 1024
+
+
+def normalize_encodings(encodings) -> np.ndarray:
+    """L2-normalize encodings row-wise into a contiguous float32 matrix"""
+    matrix = np.array(encodings, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return np.ascontiguousarray(matrix)
+
+
+def similarity_to_distance(similarity):
+    """Convert cosine similarity of unit vectors to euclidean distance"""
+    return np.sqrt(np.maximum(0.0, 2.0 - 2.0 * np.asarray(similarity, dtype=np.float32)))
+
+
+def distance_to_confidence(distance: float) -> float:
+    """Map a euclidean distance to a 0..1 confidence score"""
+    return float(max(0.0, 1.0 - distance))
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (columns, scores) of the k highest scores per row, best first"""
+    n = scores.shape[1]
+    k = min(k, n)
+    if k < n:
+        columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        columns = np.tile(np.arange(n), (scores.shape[0], 1))
+    best = np.take_along_axis(scores, columns, axis=1)
+    order = np.argsort(-best, axis=1, kind='stable')
+    return (np.take_along_axis(columns, order, axis=1),
+            np.take_along_axis(best, order, axis=1))
+
+
+class FaceGallery:
+    """Enrolled encodings as L2-normalized float32 matrices.
+
+    The gallery has two segments. The base is a matrix whose rows are
+    sorted by user id; it is never written to, so it can be a read-only
+    memory map of a snapshot shared by every worker (see
+    ``app.services.gallery_snapshot``). Removing a base entry only sets a
+    flag in a private mask. The delta is a small private matrix holding
+    users added or replaced since the base was built; it grows
+    geometrically and removal swaps the last row into the freed slot, so
+    every update is amortized O(1).
+
+    With ``quantization`` set, the base is scanned through compact codes
+    and only the best candidates are re-scored against its float32 rows
+    (see ``set_quantization``).
+
+    Matching a batch of probes is one matrix product per segment followed
+    by a top-k selection, unless an approximate index (see
+    ``app.services.ann_index``) has been attached, in which case searches
+    are delegated to it. Users changed after the index was attached are
+    tracked as dirty, filtered out of index results and scanned exactly.
+    """
+
+    # Past this many dirty users the index is detached until rebuilt
+    max_dirty = 1024
+
+    def __init__(self, dim: int = ENCODING_DIM):
+        self.dim = dim
+        self.quantization = 'none'
+        self.rerank_candidates = 32
+        self._quantizer = None
+        self._set_base(np.empty((0, dim), dtype=np.float32), np.empty(0, dtype=np.int32))
+
+    def _set_base(self, encodings: np.ndarray, user_ids: np.ndarray):
+        self._base_ids = user_ids
+        self._base_removed = None  # allocated on first removal
+        self._removed_count = 0
+        self._store_base(encodings)
+        self._delta_matrix = np.empty((0, self.dim), dtype=np.float32)
+        self._delta_ids = np.empty(0, dtype=np.int32)
+        self._delta_size = 0
+        self._delta_rows = {}
+        self.index = None
+        self._dirty = set()
+
+    def __len__(self):
+        return len(self._base_ids) - self._removed_count + self._delta_size
+
+    def set_quantization(self, mode: str, rerank_candidates: int = 32):
+        """Scan the base through compact 'float16' or 'int8' codes ('none' to disable).
+
+        The codes stay in private memory and only pick candidates; the best
+        ``rerank_candidates`` per probe are re-scored against the float32
+        rows, so matches and distances are exact and a memory-mapped base
+        is only paged in for those rows.
+        """
+        self.quantization = mode
+        self.rerank_candidates = rerank_candidates
+        self._store_base(self._base_matrix)
+
+    def _store_base(self, encodings: np.ndarray):
+        self._base_matrix = encodings
+        self._quantizer = None
+        if self.quantization != 'none' and len(encodings):
+            from app.services.quantization import ScalarQuantizer
+            self._quantizer = ScalarQuantizer(self.quantization).fit(encodings)
+
+    @property
+    def quantized(self) -> bool:
+        """True when the base is scanned through compact codes"""
+        return self._quantizer is not None
+
+    @property
+    def nbytes(self) -> int:
+        """Memory of the encodings every search reads: the codes of a quantized base, else its rows"""
+        base = self._quantizer.nbytes if self._quantizer is not None else self._base_matrix.nbytes
+        return base + self._base_ids.nbytes + self._delta_matrix.nbytes + self._delta_ids.nbytes
+
+    def __contains__(self, user_id):
+        return user_id in self._delta_rows or self._base_row(user_id) is not None
+
+    @property
+    def delta_size(self) -> int:
+        """Entries held outside the shared base"""
+        return self._delta_size + self._removed_count
+
+    @property
+    def encodings(self) -> np.ndarray:
+        """All live encodings; a view of the base when there is no delta"""
+        if self.delta_size == 0:
+            return self._base_matrix
+        return np.concatenate([self._base_matrix[self._base_alive()],
+                               self._delta_matrix[:self._delta_size]])
+
+    @property
+    def user_ids(self) -> np.ndarray:
+        """User ids matching the rows of ``encodings``"""
+        if self.delta_size == 0:
+            return self._base_ids
+        return np.concatenate([self._base_ids[self._base_alive()], self._delta_ids[:self._delta_size]])
+
+    def _base_alive(self) -> np.ndarray:
+        if self._base_removed is None:
+            return np.ones(len(self._base_ids), dtype=bool)
+        return ~self._base_removed
+
+    def _base_row(self, user_id: int) -> Optional[int]:
+        row = int(np.searchsorted(self._base_ids, user_id))
+        if row == len(self._base_ids) or self._base_ids[row] != user_id:
+            return None
+        if self._base_removed is not None and self._base_removed[row]:
+            return None
+        return row
+
+    def get(self, user_id: int) -> Optional[np.ndarray]:
+        """A user's normalized encoding, or None if not enrolled"""
+        row = self._delta_rows.get(user_id)
+        if row is not None:
+            return self._delta_matrix[row]
+        row = self._base_row(user_id)
+        return self._base_matrix[row] if row is not None else None
+
+    def subset(self, user_ids: Sequence[int]) -> 'FaceGallery':
+        """A new gallery holding copies of the given users' entries (absent users are skipped)"""
+        wanted = np.unique(np.asarray(user_ids, dtype=np.int32))
+        rows = np.searchsorted(self._base_ids, wanted)
+        rows = np.minimum(rows, max(len(self._base_ids) - 1, 0))
+        in_base = np.zeros(len(wanted), dtype=bool)
+        if len(self._base_ids):
+            in_base = self._base_ids[rows] == wanted
+            if self._base_removed is not None:
+                in_base &= ~self._base_removed[rows]
+
+        subset = FaceGallery(self.dim)
+        ids = [wanted[in_base]]
+        matrices = [self._base_matrix[rows[in_base]]]
+        delta = [(user_id, self._delta_rows[user_id]) for user_id in wanted[~in_base].tolist()
+                 if user_id in self._delta_rows]
+        if delta:
+            ids.append(np.array([user_id for user_id, _ in delta], dtype=np.int32))
+            matrices.append(self._delta_matrix[[row for _, row in delta]])
+        ids = np.concatenate(ids)
+        if len(ids):
+            order = np.argsort(ids)
+            subset._set_base(np.ascontiguousarray(np.concatenate(matrices)[order]), ids[order])
+        return subset
+
+    def build(self, user_ids: Sequence[int], encodings) -> 'FaceGallery':
+        """Replace the gallery contents, dropping any attached index"""
+        if len(user_ids) == 0:
+            self._set_base(np.empty((0, self.dim), dtype=np.float32), np.empty(0, dtype=np.int32))
+            return self
+
+        matrix = normalize_encodings(encodings)
+        if matrix.shape != (len(user_ids), self.dim):
+            raise ValueError(f"Expected {len(user_ids)} encodings of dimension {self.dim}, "
+                             f"got shape {matrix.shape}")
+        ids = np.asarray(user_ids, dtype=np.int32)
+        order = np.argsort(ids, kind='stable')
+        ids = ids[order]
+        if np.any(ids[1:] == ids[:-1]):
+            raise ValueError("Duplicate user ids in gallery")
+        self._set_base(np.ascontiguousarray(matrix[order]), ids)
+        return self
+
+    def open_base(self, user_ids: np.ndarray, encodings: np.ndarray) -> 'FaceGallery':
+        """Adopt normalized encodings sorted by user id as the base, without copying.
+
+        Used with read-only memory maps, which are never written through.
+        """
+        if encodings.shape != (len(user_ids), self.dim):
+            raise ValueError(f"Expected {len(user_ids)} encodings of dimension {self.dim}, "
+                             f"got shape {encodings.shape}")
+        self._set_base(encodings, user_ids)
+        return self
+
+    def upsert(self, user_id: int, encoding):
+        """Add a user's encoding, or replace it if already enrolled"""
+        vector = normalize_encodings(encoding)
+        if vector.shape != (1, self.dim):
+            raise ValueError(f"Expected one encoding of dimension {self.dim}, got shape {vector.shape}")
+
+        row = self._delta_rows.get(user_id)
+        if row is None:
+            base_row = self._base_row(user_id)
+            if base_row is not None:
+                self._remove_base_row(base_row)
+            if self._delta_size == len(self._delta_ids):
+                self._grow_delta()
+            row = self._delta_size
+            self._delta_size += 1
+            self._delta_ids[row] = user_id
+            self._delta_rows[user_id] = row
+        self._delta_matrix[row] = vector[0]
+        self._mark_dirty(user_id)
+
+    def remove(self, user_id: int) -> bool:
+        """Drop a user from the gallery; returns False if they were not enrolled"""
+        row = self._delta_rows.pop(user_id, None)
+        if row is not None:
+            last = self._delta_size - 1
+            if row != last:
+                moved = int(self._delta_ids[last])
+                self._delta_matrix[row] = self._delta_matrix[last]
+                self._delta_ids[row] = moved
+                self._delta_rows[moved] = row
+            self._delta_size = last
+        else:
+            base_row = self._base_row(user_id)
+            if base_row is None:
+                return False
+            self._remove_base_row(base_row)
+        self._mark_dirty(user_id)
+        return True
+
+    def _remove_base_row(self, row: int):
+        if self._base_removed is None:
+            self._base_removed = np.zeros(len(self._base_ids), dtype=bool)
+        self._base_removed[row] = True
+        self._removed_count += 1
+
+    def _grow_delta(self):
+        capacity = max(16, 2 * len(self._delta_ids))
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        ids = np.empty(capacity, dtype=np.int32)
+        matrix[:self._delta_size] = self._delta_matrix[:self._delta_size]
+        ids[:self._delta_size] = self._delta_ids[:self._delta_size]
+        self._delta_matrix, self._delta_ids = matrix, ids
+
+    def _mark_dirty(self, user_id: int):
+        if self.index is None:
+            return
+        self._dirty.add(user_id)
+        if len(self._dirty) > self.max_dirty:
+            logger.info(f"{len(self._dirty)} gallery changes since the index was built; "
+                        f"falling back to brute force until it is rebuilt")
+            self.index = None
+            self._dirty = set()
+
+    def attach_index(self, index, dirty=()):
+        """Serve searches from an approximate index built over this gallery.
+
+        ``dirty`` lists users whose entries differ from what the index holds.
+        """
+        self.index = index
+        self._dirty = set(int(user_id) for user_id in dirty)
+
+    def search(self, probes, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Find the k nearest gallery entries for each probe.
+
+        Returns ``(user_ids, distances)``, both shaped ``(n_probes, k)`` and
+        sorted by ascending distance. ``k`` is clipped to the gallery size.
+        """
+        if self.index is not None:
+            return self._search_indexed(probes, min(k, len(self)))
+
+        probes = normalize_encodings(probes)
+        if probes.shape[1] != self.dim:
+            raise ValueError(f"Probe dimension {probes.shape[1]} does not match gallery dimension {self.dim}")
+
+        n_probes, n = probes.shape[0], len(self)
+        k = min(k, n)
+        ids = np.empty((n_probes, k), dtype=np.int32)
+        distances = np.empty((n_probes, k), dtype=np.float32)
+        if k == 0:
+            return ids, distances
+
+        # Bound the score matrix so a large probe batch cannot exhaust memory
+        block = max(1, MAX_SCORES_PER_BLOCK // n)
+        segments = [(self._base_matrix, self._base_ids, self._base_removed if self._removed_count else None,
+                     self._quantizer),
+                    (self._delta_matrix[:self._delta_size], self._delta_ids[:self._delta_size], None, None)]
+        for start in range(0, n_probes, block):
+            chunk = probes[start:start + block]
+            candidate_ids, candidate_scores = [], []
+            for matrix, segment_ids, removed, quantizer in segments:
+                if len(segment_ids) == 0:
+                    continue
+                if quantizer is not None:
+                    from app.services.quantization import rerank
+                    rows, _ = quantizer.scan(chunk, max(k, self.rerank_candidates), removed)
+                    rows, best = rerank(chunk, matrix, rows, k, removed)
+                    candidate_ids.append(segment_ids[rows])
+                    candidate_scores.append(best)
+                    continue
+                scores = chunk @ matrix.T
+                if removed is not None:
+                    scores[:, removed] = -np.inf
+                columns, best = top_k(scores, k)
+                candidate_ids.append(segment_ids[columns])
+                candidate_scores.append(best)
+
+            merged_ids = np.concatenate(candidate_ids, axis=1)
+            columns, best = top_k(np.concatenate(candidate_scores, axis=1), k)
+            ids[start:start + block] = np.take_along_axis(merged_ids, columns, axis=1)
+            distances[start:start + block] = similarity_to_distance(best)
+        return ids, distances
+
+    def _search_indexed(self, probes, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Index search corrected for users changed since the index was built"""
+        if not self._dirty:
+            return self.index.search(probes, k=k)
+
+        dirty = np.fromiter(self._dirty, dtype=np.int32, count=len(self._dirty))
+        ids, distances = self.index.search(probes, k=k + len(dirty))
+        distances = np.where(np.isin(ids, dirty), np.inf, distances)
+
+        current = [(user_id, self.get(user_id)) for user_id in self._dirty]
+        current = [(user_id, vector) for user_id, vector in current if vector is not None]
+        if current:
+            exact = similarity_to_distance(normalize_encodings(probes) @ np.stack([v for _, v in current]).T)
+            current_ids = np.array([user_id for user_id, _ in current], dtype=np.int32)
+            ids = np.concatenate([ids, np.broadcast_to(current_ids, exact.shape)], axis=1)
+            distances = np.concatenate([distances, exact], axis=1)
+
+        columns, best = top_k(-distances, k)
+        return np.take_along_axis(ids, columns, axis=1), (-best).astype(np.float32)
+
+    def match(self, probes, tolerance: float) -> List[Tuple[Optional[int], float]]:
+        """Best match per probe as ``(user_id, distance)``; user_id is None above tolerance"""
+        ids, distances = self.search(probes, k=1)
+        if ids.shape[1] == 0:
+            return [(None, float('inf')) for _ in range(ids.shape[0])]
+        return [(int(user_id) if distance <= tolerance else None, float(distance))
+                for user_id, distance in zip(ids[:, 0], distances[:, 0])]
@@ -0,0 +1,173 @@
+# Content-addressed store for enrolment images
+import hashlib
+import io
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import User, FaceImage, FaceTemplate
+from app.services.image_ingest import DEFAULT_MAX_PIXELS, read_bytes, save_face_image
+
+logger = logging.getLogger(__name__)
+
+# Sub-directory of FACES_FOLDER; per-user folders beside it hold older uploads
+STORE_DIR = 'sha256'
+
+
+def store_root() -> str:
+    return os.path.join(current_app.config.get('FACES_FOLDER', 'data/faces'), STORE_DIR)
+
+
+def content_path(digest: str, root: Optional[str] = None) -> str:
+    """``<root>/ab/cd/abcd….jpg``: two fan-out levels keep directories small"""
+    return os.path.join(root or store_root(), digest[:2], digest[2:4], f'{digest}.jpg')
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def store_face_image(source, max_pixels: int = DEFAULT_MAX_PIXELS) -> FaceImage:
+    """Normalize an upload (path, bytes or file object) into the store.
+
+    Bytes seen before resolve to their stored image without decoding.
+    Otherwise the image is downscaled to a JPEG whose SHA-256 is its
+    address, so different uploads of the same picture share one file and
+    one cached encoding. The returned ``FaceImage`` is added to the session
+    but not committed. Raises like ``save_face_image``.
+    """
+    data = read_bytes(source)
+    source_digest = sha256_hex(data)
+    # Rows are locked until the caller commits, so garbage collection
+    # cannot remove an image between here and the template's reference
+    image = FaceImage.query.filter_by(source_digest=source_digest).with_for_update().first()
+    if image is not None and os.path.exists(content_path(image.digest)):
+        return image
+
+    digest, byte_size = write_normalized(data, max_pixels)
+    image = db.session.get(FaceImage, digest, with_for_update=True)
+    if image is None:
+        image = FaceImage(digest=digest, source_digest=source_digest, byte_size=byte_size, ref_count=0)
+        try:
+            with db.session.begin_nested():
+                db.session.add(image)
+        except IntegrityError:
+            # A concurrent upload of the same picture inserted it first
+            image = db.session.get(FaceImage, digest, with_for_update=True, populate_existing=True)
+    if image.source_digest is None:
+        image.source_digest = source_digest
+    return image
+
+
+def write_normalized(data: bytes, max_pixels: int = DEFAULT_MAX_PIXELS, root: Optional[str] = None):
+    """Downscale image bytes to a JPEG and write it into the store under its SHA-256.
+
+    Returns ``(digest, byte size)``. Needs no database, so processes without
+    an app context can use it by passing ``root``. Raises like ``save_face_image``.
+    """
+    buffer = io.BytesIO()
+    save_face_image(io.BytesIO(data), buffer, max_pixels)
+    normalized = buffer.getvalue()
+    digest = sha256_hex(normalized)
+
+    path = content_path(digest, root)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Rename into place so a reader never sees a partial file
+        temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(normalized)
+        os.replace(temporary, path)
+    return digest, len(normalized)
+
+
+def recount_references() -> int:
+    """Reset every reference count from the templates; returns the number corrected"""
+    actual = db.session.query(db.func.count(FaceTemplate.id)).filter(
+        FaceTemplate.image_digest == FaceImage.digest
+    ).scalar_subquery()
+    corrected = FaceImage.query.filter(FaceImage.ref_count != actual).update(
+        {FaceImage.ref_count: actual}, synchronize_session=False)
+    db.session.commit()
+    return corrected
+
+
+def collect_garbage(grace_seconds: float = 24 * 3600, recount: bool = False) -> dict:
+    """Delete unreferenced images and files no record points to.
+
+    Only what is older than ``grace_seconds`` is touched, so uploads and
+    bulk runs still between writing a file and committing its record are
+    left alone. Besides the store, the per-user folders are swept for
+    images no template or profile refers to. ``recount`` first rebuilds
+    the reference counts from the templates.
+    """
+    corrected = recount_references() if recount else 0
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    stats = {'corrected': corrected, 'images': 0, 'files': 0, 'bytes': 0}
+
+    unreferenced = [digest for (digest,) in db.session.query(FaceImage.digest).filter(
+        FaceImage.ref_count <= 0, FaceImage.created_at < cutoff)]
+    root = store_root()
+    for digest in unreferenced:
+        # Locked and re-checked in the transaction that deletes it: an upload
+        # reusing the image either committed its reference first or waits for
+        # the commit and stores the image again
+        image = FaceImage.query.filter_by(digest=digest).with_for_update().first()
+        if image is None or image.ref_count > 0 or db.session.query(
+                FaceTemplate.query.filter_by(image_digest=digest).exists()).scalar():
+            db.session.rollback()
+            continue
+        db.session.delete(image)
+        db.session.flush()
+        _remove(content_path(digest, root), stats)
+        db.session.commit()
+        stats['images'] += 1
+
+    mtime_cutoff = time.time() - grace_seconds
+    known = {digest for (digest,) in db.session.query(FaceImage.digest)}
+    for path in _files(root, mtime_cutoff):
+        if os.path.basename(path).split('.')[0] not in known or path.endswith('.tmp'):
+            _remove(path, stats)
+
+    referenced = {path for (path,) in db.session.query(FaceTemplate.image_path).filter(
+        FaceTemplate.image_path.isnot(None))}
+    referenced.update(path for (path,) in db.session.query(User.face_image_path).filter(
+        User.face_image_path.isnot(None)))
+    faces_folder = current_app.config.get('FACES_FOLDER', 'data/faces')
+    for entry in (os.scandir(faces_folder) if os.path.isdir(faces_folder) else ()):
+        if entry.is_dir() and entry.name.isdigit():
+            for path in _files(entry.path, mtime_cutoff):
+                if path not in referenced:
+                    _remove(path, stats)
+
+    logger.info(f"Face image GC removed {stats['images']} images and {stats['files']} files "
+                f"({stats['bytes']} bytes)")
+    return stats
+
+
+def _files(folder: str, mtime_cutoff: float):
+    for parent, _, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(parent, name)
+            try:
+                if os.path.getmtime(path) < mtime_cutoff:
+                    yield path
+            except OSError:
+                continue
+
+
+def _remove(path: str, stats: dict):
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+    except OSError:
+        return
+    stats['files'] += 1
+    stats['bytes'] += size
@@ -0,0 +1,254 @@
+# CPU face detection, alignment and embedding on OpenCV
+import os
+import threading
+import time
+import logging
+import cv2
+import numpy as np
+from collections import namedtuple
+from typing import List, Optional, Sequence, Tuple
+
+from app.services.image_ingest import DEFAULT_MAX_PIXELS, decode_bgr
+
+logger = logging.getLogger(__name__)
+
+# Five-point template of a 112x112 aligned crop (ArcFace/SFace convention):
+# right eye, left eye, nose tip, right and left mouth corners
+REFERENCE_LANDMARKS = np.array([[38.2946, 51.6963], [73.5318, 51.5014], [56.0252, 71.7366],
+                                [41.5493, 92.3655], [70.7299, 92.2041]], dtype=np.float64)
+CROP_SIZE = (112, 112)
+
+PIPELINE_STAGES = ('detect', 'align', 'embed')
+
+# Shorter side images are decoded to at least; detection runs at up to 640px
+DECODE_MIN_SIDE = 480
+
+DetectedFace = namedtuple('DetectedFace', ['box', 'landmarks', 'score'])
+
+
+def similarity_transform(src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """Least-squares rotation, uniform scale and translation mapping src onto dst (Umeyama)"""
+    src, dst = np.asarray(src, dtype=np.float64), np.asarray(dst, dtype=np.float64)
+    src_mean, dst_mean = src.mean(axis=0), dst.mean(axis=0)
+    src_centered, dst_centered = src - src_mean, dst - dst_mean
+
+    u, s, vt = np.linalg.svd(dst_centered.T @ src_centered / len(src))
+    d = np.ones(2)
+    if np.linalg.det(u) * np.linalg.det(vt) < 0:
+        d[1] = -1
+    rotation = u @ np.diag(d) @ vt
+    scale = (s * d).sum() / src_centered.var(axis=0).sum()
+
+    matrix = np.empty((2, 3))
+    matrix[:, :2] = scale * rotation
+    matrix[:, 2] = dst_mean - matrix[:, :2] @ src_mean
+    return matrix
+
+
+def load_image(source, max_pixels: int = DEFAULT_MAX_PIXELS) -> Optional[np.ndarray]:
+    """Decode a path, bytes or file object into a BGR image; None if unreadable.
+
+    JPEGs are decoded at reduced resolution, still large enough for
+    detection and alignment.
+    """
+    return decode_bgr(source, min_side=DECODE_MIN_SIDE, max_pixels=max_pixels)
+
+
+class YuNetDetector:
+    """OpenCV's YuNet face detector (``cv2.FaceDetectorYN``).
+
+    Large images are downscaled to ``max_side`` before detection, which
+    dominates its cost; boxes and landmarks are mapped back to the
+    original resolution so alignment uses full-resolution pixels.
+    """
+
+    def __init__(self, model_path: str, score_threshold: float = 0.9, nms_threshold: float = 0.3,
+                 top_k: int = 50, max_side: int = 640):
+        self.max_side = max_side
+        self.model = cv2.FaceDetectorYN.create(model_path, '', (320, 320), score_threshold, nms_threshold, top_k)
+
+    def detect(self, image: np.ndarray) -> np.ndarray:
+        """``(n, 15)`` rows of box (x, y, w, h), five landmark points and score"""
+        height, width = image.shape[:2]
+        scale = min(1.0, self.max_side / max(height, width))
+        if scale < 1.0:
+            image = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+        self.model.setInputSize((image.shape[1], image.shape[0]))
+        _, faces = self.model.detect(image)
+        if faces is None:
+            return np.empty((0, 15), dtype=np.float32)
+        faces[:, :14] /= scale
+        return faces
+
+
+class FacePipeline:
+    """Detect, align and embed faces, batching crops into one forward pass.
+
+    ``detector`` is anything with a ``detect(image)`` returning YuNet-style
+    rows. The embedding model is an ONNX network run by ``cv2.dnn`` on
+    aligned 112x112 crops; crops from every image in a call share forward
+    passes of up to ``batch_size``. Models exported with a fixed batch of
+    one are detected on first use and run crop by crop instead.
+
+    One pipeline serves all of a process's threads. The detector's
+    ``setInputSize``/``detect`` and the network's ``setInput``/``forward``
+    are stateful pairs, so each runs under its own lock; one thread can
+    detect while another embeds.
+    """
+
+    def __init__(self, detector, embedding_model, batch_size: int = 32, input_scale: float = 1.0,
+                 input_mean: Tuple[float, float, float] = (0.0, 0.0, 0.0), swap_rb: bool = True):
+        self.detector = detector
+        if isinstance(embedding_model, str):
+            embedding_model = cv2.dnn.readNetFromONNX(embedding_model)
+        self.net = embedding_model
+        self.batch_size = batch_size
+        self.input_scale = input_scale
+        self.input_mean = input_mean
+        self.swap_rb = swap_rb
+        self._detect_lock = threading.Lock()
+        self._forward_lock = threading.Lock()
+
+    def detect(self, image: np.ndarray) -> List[DetectedFace]:
+        with self._detect_lock:
+            rows = self.detector.detect(image)
+        return [DetectedFace(row[:4].copy(), row[4:14].reshape(5, 2).copy(), float(row[14])) for row in rows]
+
+    @staticmethod
+    def align(image: np.ndarray, face: DetectedFace) -> np.ndarray:
+        """Warp a face onto the reference landmarks as a 112x112 crop"""
+        matrix = similarity_transform(face.landmarks, REFERENCE_LANDMARKS)
+        return cv2.warpAffine(image, matrix, CROP_SIZE, flags=cv2.INTER_LINEAR, borderValue=0)
+
+    def embed(self, crops: Sequence[np.ndarray]) -> np.ndarray:
+        """``(len(crops), dim)`` float32 embeddings"""
+        outputs = []
+        for start in range(0, len(crops), self.batch_size):
+            batch = list(crops[start:start + self.batch_size])
+            outputs.append(self._forward(batch))
+        if not outputs:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.concatenate(outputs).astype(np.float32, copy=False)
+
+    def _forward(self, crops: List[np.ndarray]) -> np.ndarray:
+        blob = cv2.dnn.blobFromImages(crops, self.input_scale, CROP_SIZE, self.input_mean,
+                                      swapRB=self.swap_rb, crop=False)
+        with self._forward_lock:
+            return self._forward_blob(blob, len(crops))
+
+    def _forward_blob(self, blob: np.ndarray, count: int) -> np.ndarray:
+        if count > 1 and self.batch_size > 1:
+            try:
+                self.net.setInput(blob)
+                output = self.net.forward()
+                if output.shape[0] == count:
+                    return output.reshape(count, -1)
+            except cv2.error:
+                pass
+            logger.warning("Embedding model does not accept batches; running one crop per pass")
+            self.batch_size = 1
+        outputs = []
+        for row in range(count):
+            self.net.setInput(blob[row:row + 1])
+            outputs.append(self.net.forward().reshape(1, -1))
+        return np.concatenate(outputs)
+
+    def encode(self, images: Sequence[np.ndarray], largest_only: bool = False):
+        """Faces and embeddings for a batch of BGR images.
+
+        Returns ``(faces, encodings, timings)``: per image a list of
+        detected faces and a matching ``(n_faces, dim)`` array (only the
+        largest face with ``largest_only``), and the milliseconds spent in
+        each stage for the whole batch (``detect_images`` splits detection
+        per image).
+        """
+        timings = dict.fromkeys(PIPELINE_STAGES, 0.0)
+        timings['detect_images'] = []
+        faces = []
+        for image in images:
+            started = time.perf_counter()
+            detected = self.detect(image) if image is not None else []
+            if largest_only and detected:
+                detected = [max(detected, key=lambda face: face.box[2] * face.box[3])]
+            faces.append(detected)
+            timings['detect_images'].append((time.perf_counter() - started) * 1000)
+        timings['detect'] = sum(timings['detect_images'])
+
+        started = time.perf_counter()
+        crops = [self.align(image, face) for image, detected in zip(images, faces) for face in detected]
+        timings['align'] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        embeddings = self.embed(crops)
+        timings['embed'] = (time.perf_counter() - started) * 1000
+
+        encodings, offset = [], 0
+        for detected in faces:
+            encodings.append(embeddings[offset:offset + len(detected)])
+            offset += len(detected)
+        return faces, encodings, timings
+
+
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+# Model paths already reported missing, so the warning is logged once
+_missing_models = set()
+
+
+def model_version(config) -> str:
+    """Tag of the configured embedding model: FACE_MODEL_VERSION, or the model file's name"""
+    configured = config.get('FACE_MODEL_VERSION')
+    if configured:
+        return configured
+    return os.path.splitext(os.path.basename(config.get('FACE_EMBEDDING_MODEL') or ''))[0] or 'default'
+
+
+def embedding_model_path(config, version: Optional[str] = None) -> Optional[str]:
+    """The embedding model for ``version``: ``<version>.onnx`` beside the configured model"""
+    embedding_model = config.get('FACE_EMBEDDING_MODEL')
+    if version is None or version == model_version(config) or not embedding_model:
+        return embedding_model
+    return os.path.join(os.path.dirname(embedding_model), f'{version}.onnx')
+
+
+def get_pipeline(config, version: Optional[str] = None) -> Optional[FacePipeline]:
+    """The process-wide pipeline for the configured models, or None if they are missing.
+
+    ``config`` is the Flask config or any mapping with the same keys.
+    ``version`` selects another embedding model (see ``embedding_model_path``).
+    Only a loaded pipeline is cached: missing models are looked for again on
+    the next call, so installing them takes effect without a restart.
+    """
+    detector_model = config.get('FACE_DETECTOR_MODEL')
+    embedding_model = embedding_model_path(config, version)
+    key = (detector_model, embedding_model)
+    pipeline = _pipelines.get(key)
+    if pipeline is not None:
+        return pipeline
+    with _pipelines_lock:
+        pipeline = _pipelines.get(key)
+        if pipeline is None:
+            pipeline = _load_pipeline(config, detector_model, embedding_model)
+            if pipeline is not None:
+                _pipelines[key] = pipeline
+    return pipeline
+
+
+def _load_pipeline(config, detector_model: str, embedding_model: str) -> Optional[FacePipeline]:
+    key = (detector_model, embedding_model)
+    pipeline = None
+    missing = [path for path in key if not path or not os.path.exists(path)]
+    if missing:
+        if key not in _missing_models:
+            _missing_models.add(key)
+            logger.warning(f"Face models not found ({', '.join(map(str, missing))}); "
+                           f"faces cannot be encoded")
+    else:
+        _missing_models.discard(key)
+        threads = config.get('FACE_PIPELINE_THREADS', 0)
+        if threads:
+            cv2.setNumThreads(threads)
+        detector = YuNetDetector(detector_model, score_threshold=config.get('FACE_DETECTION_THRESHOLD', 0.9))
+        pipeline = FacePipeline(detector, embedding_model, batch_size=config.get('FACE_EMBEDDING_BATCH', 32))
+        logger.info(f"Loaded face pipeline ({os.path.basename(detector_model)}, {os.path.basename(embedding_model)})")
+    return pipeline
@@ -1,65 +1,522 @@
 # Simplified Face Recognition Service (without face_recognition library)
 import cv2
+import functools
 import numpy as np
-import pickle
 import os
+import threading
+import time
 import logging
 from typing import List, Tuple, Optional
-from PIL import Image
-from app.models import User
+from PIL import Image, UnidentifiedImageError
+from app.models import User, GalleryChange, CDSchedule, FaceTemplate
+from app.models.face_encoding import unpack_encoding, unpack_encodings
 from app import db
-from flask import current_app
-from datetime import datetime
+from flask import current_app, has_app_context
+from datetime import date
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.services.face_gallery import (FaceGallery, distance_to_confidence, normalize_encodings,
+                                       similarity_to_distance)
+from app.services.face_pipeline import CROP_SIZE, get_pipeline, load_image, model_version
+from app.services.image_ingest import DEFAULT_MAX_PIXELS, ImageTooLarge, read_bytes
+from app.services.face_image_store import content_path, sha256_hex, store_face_image
+from app.services.probe_cache import ProbeCache, get_probe_cache
+from app.services.timing import record_ms, span
+from app.services.unknown_faces import record_unknown_face
+from app.services.ann_index import create_index, gallery_fingerprint, load_index, save_index
+from app.services.gallery_snapshot import (open_snapshot, read_snapshot_header, snapshot_identity,
+                                           snapshot_path, write_snapshot)
 
 logger = logging.getLogger(__name__)
 
+# Session.info key of the gallery updates waiting for their transaction to commit
+_PENDING_UPDATES = 'face_gallery_updates'
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed_updates(session):
+    for service, user_id, encoding in session.info.pop(_PENDING_UPDATES, ()):
+        service._apply_update(user_id, encoding)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back_updates(session):
+    session.info.pop(_PENDING_UPDATES, None)
+
+
+def _locked(method):
+    """Run a method under the service's gallery lock"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class FaceRecognitionService:
     """Simplified service for handling face recognition operations"""
     
-    def __init__(self, tolerance=0.6):
+    def __init__(self, tolerance=1.13, pipeline=None, probe_cache=None):
         self.tolerance = tolerance
-        self.known_encodings = []
-        self.known_user_ids = []
-        # Load known faces would be called here in production
+        self.pipeline = pipeline  # FacePipeline; the configured models' by default
+        self.probe_cache = probe_cache  # ProbeCache; the process-wide one by default
+        self.gallery = FaceGallery()
+        self.version = 0  # last GalleryChange applied to the gallery
+        self._applied = set()  # ids applied within the trailing window below the version
+        self._reload_id = 0  # last GalleryChange.RELOAD the gallery was loaded after
+        self.model_version = None  # embedding model behind the gallery, see GalleryChange.RELOAD
+        self._last_refresh_check = 0.0
+        self._snapshot_version = None  # version of the mapped snapshot, if any
+        self._snapshot_identity = None
+        self._scoped_galleries = {}  # scope -> (gallery version, FaceGallery)
+        self._scoped_locations = {}  # location_id -> scope, for today's schedules
+        self._scoped_day = None
+        # Gallery loads, refreshes and searches are serialized, so one
+        # service can be shared by a process's request threads
+        self._lock = threading.RLock()
     
-    def load_known_faces(self):
-        """Load all registered user face encodings"""
+    @_locked
+    def load_known_faces(self, use_snapshot: bool = True) -> bool:
+        """Load the gallery from the shared snapshot, falling back to the database.
+        
+        Snapshots written before the last re-embedding (``GalleryChange.RELOAD``)
+        hold the old model's encodings and are ignored. Returns False (and
+        logs) if the gallery could not be loaded.
+        """
         try:
-            users = User.query.filter(User.face_encoding.isnot(None)).all()
-            self.known_encodings = []
-            self.known_user_ids = []
-            
-            for user in users:
-                if user.face_encoding:
-                    try:
-                        encoding = pickle.loads(user.face_encoding)
-                        self.known_encodings.append(encoding)
-                        self.known_user_ids.append(user.id)
-                    except Exception as e:
-                        logger.error(f"Error loading encoding for user {user.id}: {str(e)}")
-            
-            logger.info(f"Loaded {len(self.known_encodings)} face encodings")
+            config = current_app.config
+            reload = GalleryChange.latest_reload()
+            self.model_version = reload.model_version if reload is not None else model_version(config)
+            self._reload_id = reload.id if reload is not None else 0
+            self.gallery.quantization = config.get('FACE_QUANTIZATION', 'none')
+            self.gallery.rerank_candidates = config.get('FACE_RERANK_CANDIDATES', 32)
+            if use_snapshot and self._open_snapshot(min_version=reload.id if reload is not None else 0):
+                self.refresh(force=True)
+                self._attach_index()
+                return True
+            
+            # Read the change ids first so changes racing with the load are
+            # replayed; the ids read were all committed before the users are
+            version = GalleryChange.latest_version()
+            applied = GalleryChange.ids_since(max(version - self._change_window(), 0))
+            rows = db.session.query(User.id, User.face_encoding).filter(
+                User.face_encoding.isnot(None), User.is_active == True
+            ).all()
+            dim = len(unpack_encoding(rows[0][1])) if rows else self.gallery.dim
+            if dim != self.gallery.dim:
+                # A re-embedding moved to a model with another output size
+                quantization, rerank_candidates = self.gallery.quantization, self.gallery.rerank_candidates
+                self.gallery = FaceGallery(dim)
+                self.gallery.quantization, self.gallery.rerank_candidates = quantization, rerank_candidates
+            user_ids = np.fromiter((row[0] for row in rows), dtype=np.int32, count=len(rows))
+            encodings, valid = unpack_encodings([row[1] for row in rows], self.gallery.dim)
+            if not valid.all():
+                logger.error(f"Skipping {int((~valid).sum())} undecodable face encodings")
+            
+            exact = FaceGallery(dim).build(user_ids[valid], encodings[valid])
+            self.version = max(applied, default=version)
+            logger.info(f"Loaded {len(exact)} face encodings at gallery version {version}")
+            
+            # Publish for other workers and serve from the shared mapping
+            # ourselves, so a quantized gallery only pages in re-ranked rows
+            if not (self.publish_snapshot(source=exact) and self._open_snapshot()):
+                self.gallery.open_base(exact.user_ids, exact.encodings)
+                self._snapshot_version = None
+            self._applied = set(applied)
+            self._attach_index()
+            return True
         except Exception as e:
             logger.error(f"Error loading known faces: {str(e)}")
+            return False
     
-    def extract_face_encoding(self, image_path: str) -> Optional[np.ndarray]:
-        """Extract face encoding from image file (simplified)"""
+    def _open_snapshot(self, min_version: int = 0) -> bool:
+        """Map the published snapshot as the gallery base; False if unavailable or older than ``min_version``"""
+        snapshot = open_snapshot(current_app.config['ENCODINGS_FOLDER'])
+        if snapshot is None or snapshot.dim != self.gallery.dim or snapshot.version < min_version:
+            return False
+        self.gallery.open_base(snapshot.user_ids, snapshot.encodings)
+        self.version = snapshot.version
+        # Which changes below its version made it into the snapshot is not
+        # known, so the next refresh replays the window (idempotently)
+        self._applied = set()
+        self._snapshot_version = snapshot.version
+        self._snapshot_identity = snapshot.identity
+        logger.info(f"Mapped gallery snapshot with {len(self.gallery)} encodings at version {snapshot.version}")
+        return True
+    
+    def publish_snapshot(self, force: bool = False, source: Optional[FaceGallery] = None) -> bool:
+        """Write the gallery (or ``source``) as the shared snapshot unless an equally new one exists"""
+        source = source if source is not None else self.gallery
+        try:
+            folder = current_app.config['ENCODINGS_FOLDER']
+            header = read_snapshot_header(snapshot_path(folder))
+            if not force and header is not None and header['version'] >= self.version:
+                return False
+            write_snapshot(folder, source.user_ids, source.encodings, self.version)
+            return True
+        except Exception as e:
+            logger.error(f"Error publishing gallery snapshot: {str(e)}")
+            return False
+    
+    def _check_snapshot(self):
+        """Switch to a snapshot newer than our base; a stat() when nothing changed"""
+        identity = snapshot_identity(snapshot_path(current_app.config['ENCODINGS_FOLDER']))
+        if identity is None or identity == self._snapshot_identity:
+            return
+        snapshot_version = self._snapshot_version if self._snapshot_version is not None else -1
+        header = read_snapshot_header(snapshot_path(current_app.config['ENCODINGS_FOLDER']))
+        if header is not None and header['version'] > snapshot_version and self._open_snapshot():
+            self.model_version = None  # looked up again: the snapshot may follow a re-embedding
+            self._attach_index()
+    
+    def _decode_encoding(self, user) -> Optional[np.ndarray]:
+        """Decode a user's stored face encoding, or None if unusable"""
+        if not user.face_encoding:
+            return None
         try:
-            # For demo purposes, create a dummy encoding based on image properties
-            # In production, this would use OpenCV for face detection and feature extraction
+            return user.get_face_encoding()
+        except Exception as e:
+            logger.error(f"Error loading encoding for user {user.id}: {str(e)}")
+            return None
+    
+    def _attach_index(self):
+        """Put an approximate index in front of large galleries"""
+        config = current_app.config
+        if self.gallery.index is not None or len(self.gallery) < config.get('FACE_INDEX_MIN_SIZE', 50000):
+            return
+        
+        encodings_folder = config['ENCODINGS_FOLDER']
+        user_ids, encodings = self.gallery.user_ids, self.gallery.encodings
+        index = load_index(encodings_folder)
+        dirty = ()
+        if index is not None and index.backend == config.get('FACE_INDEX_BACKEND'):
+            if index.fingerprint != gallery_fingerprint(user_ids, encodings):
+                # Reuse an index that is only slightly behind the gallery
+                dirty = index.stale_ids(user_ids, encodings)
+                if dirty is None or len(dirty) > self.gallery.max_dirty:
+                    index = None
+        else:
+            index = None
+        
+        if index is None:
+            index = create_index(config)
+            if index is None:
+                return
+            index.build(user_ids, encodings)
+            save_index(index, encodings_folder)
+            dirty = ()
+        self.gallery.attach_index(index, dirty)
+    
+    def _change_window(self) -> int:
+        return current_app.config.get('FACE_GALLERY_CHANGE_WINDOW', 1000)
+    
+    @_locked
+    def refresh(self, force: bool = False):
+        """Apply gallery changes recorded by any worker since our version.
+        
+        Change ids can commit out of order, so the last FACE_GALLERY_CHANGE_WINDOW
+        ids below our version are re-read too and any not applied yet are
+        picked up. Costs one ``count``/``max(id)`` query over that window when
+        nothing changed; otherwise only the changed users are fetched.
+        Checks are throttled by FACE_GALLERY_REFRESH_SECONDS unless ``force``
+        is set. A newer shared snapshot is mapped in place of the private
+        delta when one appears.
+        """
+        config = current_app.config
+        now = time.monotonic()
+        if not force and now - self._last_refresh_check < config.get('FACE_GALLERY_REFRESH_SECONDS', 1.0):
+            return
+        self._last_refresh_check = now
+        
+        try:
+            self._check_snapshot()
+            floor = max(self.version - self._change_window(), 0)
+            self._applied = {change_id for change_id in self._applied if change_id > floor}
+            count, latest = GalleryChange.window(floor)
+            if latest <= self.version and count == len(self._applied):
+                return
+            
+            max_changes = config.get('FACE_GALLERY_MAX_DELTA', 10000)
+            changes = GalleryChange.since(floor, limit=max_changes + 1, exclude=self._applied)
+            if len(changes) > max_changes:
+                logger.info("Too many gallery changes to apply incrementally; reloading")
+                self.load_known_faces(use_snapshot=False)
+                return
+            
+            if any(change.operation == GalleryChange.RELOAD and change.id > self._reload_id
+                   for change in changes):
+                logger.info("Gallery was re-embedded; reloading")
+                self.load_known_faces()
+                return
+            late = any(change.id <= self.version for change in changes)
             
-            # Check if image exists and can be opened
+            # Later changes to the same user supersede earlier ones
+            operations = {change.user_id: change.operation for change in changes}
+            upserts = [user_id for user_id, operation in operations.items()
+                       if operation == GalleryChange.UPSERT]
+            users = {user.id: user for user in User.query.filter(User.id.in_(upserts)).all()} if upserts else {}
+            
+            for user_id, operation in operations.items():
+                user = users.get(user_id)
+                encoding = self._decode_encoding(user) if user is not None and user.is_active else None
+                if operation == GalleryChange.UPSERT and encoding is not None:
+                    self.gallery.upsert(user_id, encoding)
+                elif operation != GalleryChange.RELOAD:
+                    self.gallery.remove(user_id)
+            
+            self._applied.update(change.id for change in changes)
+            self.version = max(self.version, changes[-1].id)
+            if late:
+                # Results cached at this version predate the late changes
+                logger.info("Applied gallery changes committed out of order")
+                self._scoped_galleries = {}
+                cache = self._get_probe_cache()
+                if cache is not None:
+                    cache.invalidate_results()
+            logger.info(f"Applied {len(changes)} gallery changes; now at version {self.version}")
+            
+            # Fold a large private delta back into a shared snapshot
+            if self.gallery.delta_size > config.get('FACE_SNAPSHOT_MAX_DELTA', 5000):
+                self.publish_snapshot()
+                if self._open_snapshot():
+                    self.refresh(force=True)
+                    self._attach_index()
+        except Exception as e:
+            logger.error(f"Error refreshing face gallery: {str(e)}")
+    
+    def enroll_user(self, user, encoding: Optional[np.ndarray] = None):
+        """Record a new or replaced encoding, applied to the live gallery once committed.
+        
+        The encoding defaults to the one stored on the user. The caller
+        commits; the change log entry shares its transaction, and a
+        rollback leaves the gallery untouched.
+        """
+        if encoding is None:
+            encoding = self._decode_encoding(user)
+        GalleryChange.record(user.id, GalleryChange.UPSERT)
+        self._after_commit(user.id, encoding if user.is_active else None)
+    
+    def unenroll_user(self, user_id: int):
+        """Record a removal (e.g. deactivation), applied to the live gallery once committed"""
+        GalleryChange.record(user_id, GalleryChange.REMOVE)
+        self._after_commit(user_id, None)
+    
+    def _after_commit(self, user_id: int, encoding: Optional[np.ndarray]):
+        db.session.info.setdefault(_PENDING_UPDATES, []).append((self, user_id, encoding))
+    
+    @_locked
+    def _apply_update(self, user_id: int, encoding: Optional[np.ndarray]):
+        """Upsert (or with no encoding, remove) a committed change in the live gallery"""
+        if encoding is not None:
+            self.gallery.upsert(user_id, encoding)
+        else:
+            self.gallery.remove(user_id)
+    
+    @_locked
+    def get_scoped_gallery(self, location_id: int) -> Optional[FaceGallery]:
+        """Sub-gallery of the members expected at a venue scheduled today.
+        
+        Members are scoped by the venue's local government. Sub-galleries
+        are built lazily from the main gallery, shared by venues in the same
+        local government, rebuilt when the gallery version moves and all
+        evicted at day rollover. Returns None for venues not scheduled today.
+        """
+        today = date.today()
+        if self._scoped_day != today:
+            self._scoped_galleries = {}
+            self._scoped_locations = {location.id: location.local_government
+                                      for location in CDSchedule.get_today_active_locations()}
+            self._scoped_day = today
+        
+        scope = self._scoped_locations.get(location_id)
+        if scope is None:
+            return None
+        
+        cached = self._scoped_galleries.get(scope)
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+        
+        member_ids = [user_id for (user_id,) in User.query.with_entities(User.id).filter(
+            User.local_government == scope,
+            User.is_active == True,
+            User.face_encoding.isnot(None)
+        )]
+        gallery = self.gallery.subset(member_ids)
+        self._scoped_galleries[scope] = (self.version, gallery)
+        logger.info(f"Built scoped gallery for {scope} with {len(gallery)} encodings")
+        return gallery
+    
+    @_locked
+    def identify_encodings(self, encodings, location_id: Optional[int] = None) -> List[Tuple[Optional[int], float]]:
+        """Match a batch of probe encodings against the gallery in one pass.
+        
+        The scan compares each probe with one centroid per user; probes
+        whose best centroid distance is borderline are re-scored against
+        the candidates' individual templates. With a ``location_id``
+        scheduled today, only the members expected at that venue are
+        searched.
+        """
+        if len(encodings) == 0:
+            return []
+        with span('face.match'):
+            return self._identify_encodings(encodings, location_id)
+    
+    def _identify_encodings(self, encodings, location_id: Optional[int]) -> List[Tuple[Optional[int], float]]:
+        with span('face.refresh'):
+            self.refresh()
+            gallery = self.get_scoped_gallery(location_id) if location_id is not None else None
+        if gallery is None:
+            gallery = self.gallery
+        
+        config = current_app.config
+        with span('face.search'):
+            ids, distances = gallery.search(encodings, k=config.get('FACE_TEMPLATE_CANDIDATES', 3))
+        if ids.shape[1] == 0:
+            return [(None, 0.0) for _ in range(ids.shape[0])]
+        with span('face.rescore'):
+            ids, distances = self._rescore_with_templates(encodings, ids, distances)
+        
+        results = []
+        for user_id, distance in zip(ids, distances):
+            if distance <= self.tolerance:
+                results.append((int(user_id), distance_to_confidence(distance)))
+            else:
+                results.append((None, 0.0))
+        return results
+    
+    @_locked
+    def nearest_users(self, encodings) -> List[Tuple[Optional[int], Optional[float]]]:
+        """The closest enrolled user and their distance for each encoding, however far"""
+        self.refresh()
+        if len(encodings) == 0 or len(self.gallery) == 0:
+            return [(None, None) for _ in range(len(encodings))]
+        ids, distances = self.gallery.search(encodings, k=1)
+        return [(int(row_ids[0]), float(row[0])) for row_ids, row in zip(ids, distances)]
+    
+    def _is_borderline(self, distance: float) -> bool:
+        margin = current_app.config.get('FACE_TEMPLATE_MARGIN', 0.1)
+        return margin > 0 and abs(distance - self.tolerance) <= margin
+    
+    def _load_templates(self, user_ids) -> dict:
+        """Normalized template matrices for the given users, in one query"""
+        rows = db.session.query(FaceTemplate.user_id, FaceTemplate.encoding).filter(
+            FaceTemplate.user_id.in_([int(user_id) for user_id in user_ids])
+        ).all()
+        matrix, valid = unpack_encodings([row[1] for row in rows], self.gallery.dim)
+        owners = np.array([row[0] for row in rows], dtype=np.int64)[valid]
+        matrix = normalize_encodings(matrix[valid]) if valid.any() else matrix[valid]
+        return {int(user_id): matrix[owners == user_id] for user_id in np.unique(owners)}
+    
+    def _rescore_with_templates(self, probes, ids: np.ndarray, distances: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Best ``(user_id, distance)`` per probe after checking borderline candidates.
+        
+        ``ids``/``distances`` are the centroid search results, best first.
+        A candidate's distance becomes the smaller of its centroid distance
+        and its closest template.
+        """
+        best_ids, best_distances = ids[:, 0].copy(), distances[:, 0].astype(np.float64)
+        borderline = [row for row in range(len(ids)) if self._is_borderline(best_distances[row])]
+        if not borderline:
+            return best_ids, best_distances
+        
+        ceiling = self.tolerance + current_app.config.get('FACE_TEMPLATE_MARGIN', 0.1)
+        candidates = {int(user_id) for row in borderline
+                      for user_id, distance in zip(ids[row], distances[row]) if distance <= ceiling}
+        templates = self._load_templates(candidates)
+        unit = normalize_encodings(probes)
+        for row in borderline:
+            for user_id, distance in zip(ids[row], distances[row]):
+                matrix = templates.get(int(user_id))
+                if matrix is None or len(matrix) == 0 or distance > ceiling:
+                    continue
+                closest = float(similarity_to_distance(np.max(matrix @ unit[row])))
+                if min(closest, distance) < best_distances[row]:
+                    best_ids[row], best_distances[row] = user_id, min(closest, distance)
+        return best_ids, best_distances
+    
+    def verify(self, user_id: int, probe) -> float:
+        """1:1 check of a probe against one user's stored templates.
+        
+        Returns the distance to the user's centroid, or to their closest
+        template when the centroid is borderline (inf if the user has no
+        template); callers accept when it is within ``tolerance``. The cost
+        does not depend on the gallery size.
+        """
+        with span('face.verify'):
+            return self._verify(user_id, probe)
+    
+    def _verify(self, user_id: int, probe) -> float:
+        user = db.session.get(User, user_id)
+        template = self._decode_encoding(user) if user is not None else None
+        if template is None or probe is None:
+            return float('inf')
+        unit = normalize_encodings(np.stack([np.ravel(probe), np.ravel(template)]))
+        distance = float(similarity_to_distance(unit[0] @ unit[1]))
+        if self._is_borderline(distance):
+            matrix = self._load_templates([user_id]).get(user_id)
+            if matrix is not None and len(matrix):
+                distance = min(distance, float(similarity_to_distance(np.max(matrix @ unit[0]))))
+        return distance
+    
+    def _max_pixels(self) -> int:
+        if has_app_context():
+            return current_app.config.get('FACE_MAX_IMAGE_PIXELS', DEFAULT_MAX_PIXELS)
+        return DEFAULT_MAX_PIXELS
+    
+    def _get_pipeline(self):
+        # Looked up per call (a dict hit), so a shared service follows the app's
+        # models and switches with the gallery when it is re-embedded
+        if self.pipeline is None and has_app_context():
+            return get_pipeline(current_app.config, self.active_model_version())
+        return self.pipeline
+    
+    def active_model_version(self) -> str:
+        """Embedding model of the gallery, looked up once if the gallery is not loaded"""
+        if self.model_version is None:
+            reload = GalleryChange.latest_reload()
+            self.model_version = reload.model_version if reload is not None else model_version(current_app.config)
+        return self.model_version
+    
+    def encode_images(self, images) -> Tuple[List[Optional[np.ndarray]], dict]:
+        """Encode the largest face in each of a batch of BGR images.
+        
+        Crops from all images share batched forward passes. Returns one
+        encoding per image (None where no face was found) and per-stage
+        timings in milliseconds.
+        """
+        _, encodings, timings = self._encode_largest(images)
+        return encodings, timings
+    
+    def _encode_largest(self, images) -> Tuple[list, List[Optional[np.ndarray]], dict]:
+        """``encode_images`` that also returns each image's largest face (None where there is none)"""
+        pipeline = self._get_pipeline()
+        if pipeline is None:
+            return [None] * len(images), [None] * len(images), {}
+        faces, encodings, timings = pipeline.encode(images, largest_only=True)
+        for stage in ('detect', 'align', 'embed'):
+            if stage in timings:
+                record_ms(f'face.{stage}', timings[stage])
+        return ([image_faces[0] if len(image_faces) else None for image_faces in faces],
+                [encoding[0] if len(encoding) else None for encoding in encodings], timings)
+    
+    def extract_face_encoding(self, image_path: str) -> Optional[np.ndarray]:
+        """Extract the encoding of the largest face in an image file.
+        
+        None if there is no face, the file is unreadable or the face models
+        are not installed.
+        """
+        try:
             if not os.path.exists(image_path):
                 return None
             
-            try:
-                image = Image.open(image_path)
-                # Create a simple "encoding" based on image characteristics
-                # This is just for demo - real implementation would use actual face detection
-                dummy_encoding = np.random.rand(128)  # 128-dimensional face encoding
-                return dummy_encoding
-            except Exception:
+            if self._get_pipeline() is None:
+                logger.info("Face encoding needs the face models - none extracted")
+                return None
+            
+            image = load_image(image_path, max_pixels=self._max_pixels())
+            if image is None:
                 return None
+            return self.encode_images([image])[0][0]
             
         except Exception as e:
             logger.error(f"Error extracting face encoding: {str(e)}")
@@ -76,17 +533,160 @@ class FaceRecognitionService:
             logger.error(f"Error in face recognition: {str(e)}")
             return None, 0.0
     
-    def recognize_face_from_image(self, image_path: str) -> Tuple[Optional[int], float]:
-        """Recognize face from uploaded image (simplified)"""
+    def capture_probe_from_camera(self) -> Optional[np.ndarray]:
+        """Capture a single probe encoding from the camera feed (simplified)"""
+        with span('face.capture'):
+            logger.info("Camera capture not available in simplified mode")
+            return None
+    
+    def recognize_face_from_image(self, image_path: str, location_id: Optional[int] = None) -> Tuple[Optional[int], float]:
+        """Recognize the largest face in an uploaded image (path, bytes or file object).
+        
+        Probes are cached by the SHA-256 of their bytes: a retry of the
+        same capture reuses the embedding, and the match result too while
+        the gallery version is unchanged. A fresh face that matches nobody
+        is kept in the unknown face store.
+        """
         try:
-            # For demo purposes, return None to indicate feature not fully implemented
-            logger.info("Image-based face recognition simplified - returning no match")
-            return None, 0.0
+            pipeline = self._get_pipeline()
+            if pipeline is None:
+                logger.info("Image-based face recognition needs the face models - returning no match")
+                return None, 0.0
+            
+            data = read_bytes(image_path)
+            cache = self._get_probe_cache()
+            self.refresh()
+            digest = f'{self.active_model_version()}:{sha256_hex(data)}'  # embeddings differ across models
+            cached = cache.get(digest, self.version, location_id) if cache is not None else None
+            if cached is not None and (cached.result is not None or cached.encoding is None):
+                return cached.result or (None, 0.0)
+            
+            thumbnail = None
+            if cached is not None:
+                encoding = cached.encoding
+            else:
+                with span('face.decode'):
+                    image = load_image(data, max_pixels=self._max_pixels())
+                encoding = None
+                if image is not None:
+                    faces, encodings, _ = self._encode_largest([image])
+                    encoding = encodings[0]
+                    if encoding is not None:
+                        thumbnail = lambda: pipeline.align(image, faces[0])
+            result = self.identify_encodings([encoding], location_id)[0] if encoding is not None else None
+            if cache is not None:
+                cache.put(digest, encoding, self.version, location_id, result)
+            if result is not None and result[0] is None and thumbnail is not None:
+                record_unknown_face(encoding, thumbnail, location_id)
+            return result or (None, 0.0)
                 
         except Exception as e:
             logger.error(f"Error recognizing face from image: {str(e)}")
             return None, 0.0
     
+    def identify_images(self, sources, location_id: Optional[int] = None,
+                        aligned: bool = False) -> Tuple[List[dict], dict]:
+        """Recognize the largest face in each of many images in one batch.
+        
+        ``sources`` are paths, bytes or file objects; with ``aligned`` they
+        are face crops, resized to the model input without detection. Probes
+        already in the probe cache skip decoding and embedding, the others
+        share batched forward passes, and every encoding is matched in one
+        gallery search. Fresh faces that match nobody are kept in the
+        unknown face store. Returns one result dict per image and the
+        batch's per-stage milliseconds. Raises ``RuntimeError`` without the
+        face models.
+        """
+        started = time.perf_counter()
+        self.refresh()  # first: a re-embedded gallery switches the pipeline too
+        pipeline = self._get_pipeline()
+        if pipeline is None:
+            raise RuntimeError('Face recognition models are not available')
+        timings = dict.fromkeys(('decode', 'detect', 'align', 'embed', 'match'), 0.0)
+        results = [{'user_id': None, 'confidence': 0.0, 'face_found': False, 'cached': False,
+                    'timings': {}} for _ in sources]
+        cache = self._get_probe_cache()
+        prefix = f'{self.active_model_version()}:'  # embeddings differ across models
+        
+        digests, encodings, pending, thumbnails = {}, {}, [], {}
+        for index, source in enumerate(sources):
+            decode_started = time.perf_counter()
+            data = read_bytes(source)
+            digests[index] = prefix + ('crop:' if aligned else '') + sha256_hex(data)
+            cached = cache.get(digests[index], self.version, location_id) if cache is not None else None
+            if cached is not None:
+                results[index]['cached'] = True
+                if cached.encoding is None:
+                    continue
+                results[index]['face_found'] = True
+                if cached.result is not None:
+                    results[index]['user_id'], results[index]['confidence'] = cached.result
+                else:
+                    encodings[index] = cached.encoding
+                continue
+            try:
+                image = load_image(data, max_pixels=self._max_pixels())
+            except ImageTooLarge:
+                image, results[index]['error'] = None, 'Image resolution is too large'
+            else:
+                if image is None:
+                    results[index]['error'] = 'Invalid image file'
+            decode_ms = (time.perf_counter() - decode_started) * 1000
+            results[index]['timings']['decode_ms'] = round(decode_ms, 2)
+            timings['decode'] += decode_ms
+            if image is not None:
+                pending.append((index, image))
+        
+        if pending:
+            images = [image for _, image in pending]
+            if aligned:
+                embed_started = time.perf_counter()
+                crops = [cv2.resize(image, CROP_SIZE, interpolation=cv2.INTER_AREA) for image in images]
+                new_encodings = list(pipeline.embed(crops))
+                timings['embed'] += (time.perf_counter() - embed_started) * 1000
+                thumbnails = {index: crop for (index, _), crop in zip(pending, crops)}
+            else:
+                batch_faces, batch_encodings, stage_timings = pipeline.encode(images, largest_only=True)
+                new_encodings = [encoding[0] if len(encoding) else None for encoding in batch_encodings]
+                # Aligned again only for the faces that turn out to be unknown
+                thumbnails = {index: (lambda image=image, face=faces[0]: pipeline.align(image, face))
+                              for (index, image), faces in zip(pending, batch_faces) if faces}
+                for (index, _), detect_ms in zip(pending, stage_timings['detect_images']):
+                    results[index]['timings']['detect_ms'] = round(detect_ms, 2)
+                for stage in ('detect', 'align', 'embed'):
+                    timings[stage] += stage_timings[stage]
+            for (index, _), encoding in zip(pending, new_encodings):
+                if encoding is None:
+                    if cache is not None:
+                        cache.put(digests[index], None, self.version, location_id)
+                    continue
+                results[index]['face_found'] = True
+                encodings[index] = encoding
+        
+        if encodings:
+            match_started = time.perf_counter()
+            indexes = sorted(encodings)
+            matches = self.identify_encodings(np.stack([encodings[index] for index in indexes]), location_id)
+            timings['match'] = (time.perf_counter() - match_started) * 1000
+            for index, match in zip(indexes, matches):
+                results[index]['user_id'], results[index]['confidence'] = match
+                if cache is not None:
+                    cache.put(digests[index], encodings[index], self.version, location_id, match)
+                if match[0] is None and index in thumbnails:
+                    record_unknown_face(encodings[index], thumbnails[index], location_id)
+        
+        for stage in ('decode', 'detect', 'align', 'embed'):
+            if timings[stage]:
+                record_ms(f'face.{stage}', timings[stage])
+        timings = {f'{stage}_ms': round(value, 2) for stage, value in timings.items()}
+        timings['total_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return results, timings
+    
+    def _get_probe_cache(self) -> Optional[ProbeCache]:
+        if self.probe_cache is None and has_app_context():
+            self.probe_cache = get_probe_cache(current_app.config)
+        return self.probe_cache
+    
     def validate_face_image(self, image_path: str) -> bool:
         """Validate that image exists and is readable"""
         try:
@@ -114,39 +714,53 @@ class FaceRecognitionService:
             if not self._is_valid_image(image_file):
                 return {'success': False, 'message': 'Invalid image format'}
             
-            # Create user face directory
-            faces_folder = getattr(current_app.config, 'FACES_FOLDER', 'data/faces')
-            user_face_dir = os.path.join(faces_folder, str(user_id))
-            os.makedirs(user_face_dir, exist_ok=True)
-            
-            # Save original image
-            filename = f"{user.state_code}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-            image_path = os.path.join(user_face_dir, filename)
-            
-            # Resize and save image
-            image = Image.open(image_file)
-            image = image.convert('RGB')
-            image.thumbnail((400, 400), Image.Resampling.LANCZOS)
-            image.save(image_path, 'JPEG', quality=90)
-            
-            # Generate face encoding (simplified)
-            encoding = self.extract_face_encoding(image_path)
-            
-            if encoding is None:
-                os.remove(image_path)  # Clean up failed image
-                return {'success': False, 'message': 'Could not process face image'}
-            
-            # Save encoding to database
-            user.face_encoding = pickle.dumps(encoding)
-            user.face_image_path = image_path
-            db.session.commit()
-            
-            return {'success': True, 'message': 'Face image saved successfully (simplified recognition)'}
+            return self.enroll_face_image(user, image_file)
             
         except Exception as e:
             logger.error(f"Error saving face image: {str(e)}")
             return {'success': False, 'message': 'Error processing face image'}
     
+    def enroll_face_image(self, user, source):
+        """Store an image (path or file object) and enrol its face.
+        
+        Images go to the content-addressed store (``face_image_store``): an
+        identical re-upload reuses the stored file and its cached encoding,
+        skipping the decode and the embedding. Does the work that uploads
+        hand to the enrolment queue (see ``app.services.enrolment_queue``).
+        """
+        try:
+            image = store_face_image(source, self._max_pixels())
+        except UnidentifiedImageError:
+            return {'success': False, 'message': 'Invalid image file'}
+        except ImageTooLarge:
+            return {'success': False, 'message': 'Image resolution is too large'}
+        
+        if user.face_templates.filter_by(image_digest=image.digest).first() is not None:
+            db.session.commit()
+            return {'success': True, 'message': 'Face image already enrolled'}
+        
+        image_path = content_path(image.digest)
+        version = self.active_model_version()
+        encoding = image.get_encoding(version)
+        if encoding is None:
+            encoding = self.extract_face_encoding(image_path)
+            if encoding is None:
+                # Kept unreferenced until garbage collection
+                db.session.commit()
+                if self._get_pipeline() is None:
+                    return {'success': False, 'message': 'Face models are not installed'}
+                return {'success': False, 'message': 'Could not process face image'}
+            image.set_encoding(encoding, version)
+        
+        # Keep every enrolment image as a template; the gallery holds their centroid
+        centroid = user.add_face_template(encoding, image_path, image_digest=image.digest,
+                                          max_templates=current_app.config.get('FACE_MAX_TEMPLATES', 5),
+                                          model_version=version)
+        self.enroll_user(user, centroid)
+        db.session.commit()
+        
+        return {'success': True, 'message': 'Face image saved successfully'}
+    
     def _is_valid_image(self, file):
         """Validate image file"""
         if not file or file.filename == '':
@@ -0,0 +1,128 @@
+# Lightweight IoU/centroid face tracking across camera frames
+import itertools
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+class Track:
+    """A face followed across frames, and the identity found for it"""
+
+    def __init__(self, track_id: int, box, now: float):
+        self.id = track_id
+        self.box = np.asarray(box, dtype=np.float64)
+        self.first_seen = now
+        self.last_seen = now
+        self.hits = 1
+        self.user_id = None
+        self.confidence = 0.0
+        self.identified_at = None  # when the current identity was last confirmed
+        self.last_attempt = None  # when recognition last ran for this track
+        self.reported = set()  # user ids an event has been emitted for
+        self.kept_unknown = False  # a crop was kept for review while nobody matched
+
+    def __repr__(self):
+        return f'<Track {self.id} user={self.user_id} hits={self.hits}>'
+
+
+def box_iou(a, b) -> float:
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax2, ay2, bx2, by2 = a[0] + a[2], a[1] + a[3], b[0] + b[2], b[1] + b[3]
+    width = max(0.0, min(ax2, bx2) - max(a[0], b[0]))
+    height = max(0.0, min(ay2, by2) - max(a[1], b[1]))
+    intersection = width * height
+    union = a[2] * a[3] + b[2] * b[3] - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def centroid_distance(a, b) -> float:
+    """Distance between box centres, relative to the larger box's diagonal"""
+    offset = np.array([a[0] + a[2] / 2 - b[0] - b[2] / 2, a[1] + a[3] / 2 - b[1] - b[3] / 2])
+    scale = max(np.hypot(a[2], a[3]), np.hypot(b[2], b[3]), 1e-9)
+    return float(np.hypot(*offset) / scale)
+
+
+class FaceTracker:
+    """Associates each frame's face boxes with the tracks of earlier frames.
+
+    Boxes are matched to tracks greedily by IoU, then by centroid
+    distance for fast movers whose boxes no longer overlap; the rest start
+    new tracks. Tracks unseen for ``max_age`` seconds end. A track is
+    identified when it starts, retried every ``retry_seconds`` while it is
+    unknown and re-verified every ``reverify_seconds`` once known, so a
+    person standing in view costs detection only. Not thread-safe; callers
+    serialize updates per camera.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_centroid_distance: float = 0.5, max_age: float = 1.5,
+                 retry_seconds: float = 1.0, reverify_seconds: float = 10.0):
+        self.iou_threshold = iou_threshold
+        self.max_centroid_distance = max_centroid_distance
+        self.max_age = max_age
+        self.retry_seconds = retry_seconds
+        self.reverify_seconds = reverify_seconds
+        self.tracks = []
+        self.last_sequence = -1
+        self._ids = itertools.count(1)
+
+    def update(self, boxes: Sequence, now: float) -> List[Track]:
+        """The track for each of this frame's boxes, in the same order"""
+        self.tracks = [track for track in self.tracks if now - track.last_seen <= self.max_age]
+        assigned = [None] * len(boxes)
+        free = set(range(len(self.tracks)))
+
+        for score, threshold in ((box_iou, self.iou_threshold),
+                                 (lambda a, b: -centroid_distance(a, b), -self.max_centroid_distance)):
+            pairs = sorted(((score(box, self.tracks[t].box), b, t) for b, box in enumerate(boxes)
+                            if assigned[b] is None for t in free), reverse=True)
+            for value, b, t in pairs:
+                if value < threshold:
+                    break
+                if assigned[b] is None and t in free:
+                    assigned[b] = t
+                    free.discard(t)
+
+        result = []
+        for b, box in enumerate(boxes):
+            if assigned[b] is None:
+                track = Track(next(self._ids), box, now)
+                self.tracks.append(track)
+            else:
+                track = self.tracks[assigned[b]]
+                track.box = np.asarray(box, dtype=np.float64)
+                track.last_seen = now
+                track.hits += 1
+            result.append(track)
+        return result
+
+    def needs_identification(self, track: Track, now: float) -> bool:
+        if track.last_attempt is None:
+            return True
+        if track.user_id is None:
+            return now - track.last_attempt >= self.retry_seconds
+        return now - track.identified_at >= self.reverify_seconds
+
+    def claim(self, track: Track, now: float) -> bool:
+        """True if ``track`` is due for recognition, which then counts as started"""
+        if not self.needs_identification(track, now):
+            return False
+        track.last_attempt = now
+        if track.identified_at is not None:
+            track.identified_at = now
+        return True
+
+    def assign(self, track: Track, user_id: Optional[int], confidence: float, now: float) -> bool:
+        """Record a recognition result; True when it is the track's first sighting of ``user_id``.
+
+        A re-verification that disagrees clears the identity, so the track
+        is retried like an unknown face.
+        """
+        track.last_attempt = now
+        if user_id is None or (track.user_id is not None and user_id != track.user_id):
+            track.user_id, track.confidence, track.identified_at = None, 0.0, None
+            return False
+        track.user_id, track.confidence, track.identified_at = user_id, confidence, now
+        if user_id in track.reported:
+            return False
+        track.reported.add(user_id)
+        return True
@@ -0,0 +1,92 @@
+# Cheap motion and quality gate in front of face recognition on camera streams
+import threading
+from collections import Counter
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Skip reasons, in the order they are checked
+DARK, BRIGHT, STATIC, BLURRY = 'skipped_dark', 'skipped_bright', 'skipped_static', 'skipped_blurry'
+PASSED = 'passed'
+
+
+class FrameGate:
+    """Passes only frames that changed since the previous one and are usable.
+
+    Every check runs on a grayscale copy downscaled to ``width`` pixels,
+    which costs a small fraction of a detection pass:
+
+    * brightness - the mean must lie within ``brightness``;
+    * motion - at least ``motion_fraction`` of the pixels must differ by
+      more than ``pixel_delta`` grey levels from the camera's last frame;
+    * sharpness - the variance of the Laplacian must reach
+      ``min_sharpness`` (motion blur and bad focus score low).
+
+    Counters per key (camera) record what passed and why frames were
+    skipped. ``check`` is meant to be called from one thread per key.
+    """
+
+    def __init__(self, width: int = 160, motion_fraction: float = 0.01, pixel_delta: int = 15,
+                 min_sharpness: float = 60.0, brightness: Tuple[float, float] = (40.0, 220.0)):
+        self.width = width
+        self.motion_fraction = motion_fraction
+        self.pixel_delta = pixel_delta
+        self.min_sharpness = min_sharpness
+        self.brightness = brightness
+        self.stats = {}  # key -> Counter
+        self._previous = {}  # key -> last downscaled grey frame
+        self._lock = threading.Lock()
+
+    def check(self, key, image: np.ndarray) -> Optional[str]:
+        """None if ``image`` should be recognized, otherwise the skip reason"""
+        reason = self._reason(key, image)
+        with self._lock:
+            self.stats.setdefault(key, Counter())[reason or PASSED] += 1
+        return reason
+
+    def _reason(self, key, image: np.ndarray) -> Optional[str]:
+        small = self._downscale(image)
+        previous = self._previous.get(key)
+        self._previous[key] = small
+
+        mean = float(small.mean())
+        if mean < self.brightness[0]:
+            return DARK
+        if mean > self.brightness[1]:
+            return BRIGHT
+        if previous is not None and previous.shape == small.shape:
+            changed = np.count_nonzero(cv2.absdiff(small, previous) > self.pixel_delta)
+            if changed < self.motion_fraction * small.size:
+                return STATIC
+        if cv2.Laplacian(small, cv2.CV_32F).var() < self.min_sharpness:
+            return BLURRY
+        return None
+
+    def _downscale(self, image: np.ndarray) -> np.ndarray:
+        grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        height, width = grey.shape
+        if width > self.width:
+            grey = cv2.resize(grey, (self.width, max(1, round(height * self.width / width))),
+                              interpolation=cv2.INTER_AREA)
+        return grey
+
+    def reset(self, key):
+        """Forget a camera's last frame, e.g. after it reconnects"""
+        self._previous.pop(key, None)
+
+    def snapshot(self) -> dict:
+        """A copy of the per-key counters"""
+        with self._lock:
+            return {key: dict(counter) for key, counter in self.stats.items()}
+
+
+def create_gate(config) -> Optional[FrameGate]:
+    """The gate configured by the CAMERA_GATE_* settings; None when disabled"""
+    if not config.get('CAMERA_GATE_ENABLED', True):
+        return None
+    return FrameGate(width=config.get('CAMERA_GATE_WIDTH', 160),
+                     motion_fraction=config.get('CAMERA_MOTION_FRACTION', 0.01),
+                     min_sharpness=config.get('CAMERA_MIN_SHARPNESS', 60.0),
+                     brightness=(config.get('CAMERA_MIN_BRIGHTNESS', 40.0),
+                                 config.get('CAMERA_MAX_BRIGHTNESS', 220.0)))
@@ -0,0 +1,136 @@
+# Memory-mapped gallery snapshots shared across worker processes
+import os
+import struct
+import logging
+import numpy as np
+from collections import namedtuple
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILENAME = 'gallery.snapshot'
+SNAPSHOT_MAGIC = b'FGSNAP\x00\x00'
+SNAPSHOT_FORMAT = 1
+
+# magic, format, dim, count, gallery version, matrix offset, ids offset
+HEADER = struct.Struct('<8sIIQQQQ')
+HEADER_SIZE = 64  # keeps the float32 matrix 64-byte aligned
+
+GallerySnapshot = namedtuple('GallerySnapshot',
+                             ['path', 'version', 'dim', 'user_ids', 'encodings', 'identity'])
+
+
+def snapshot_path(folder: str) -> str:
+    return os.path.join(folder, SNAPSHOT_FILENAME)
+
+
+def snapshot_identity(path: str) -> Optional[tuple]:
+    """Cheap stat-based identity; changes whenever a new snapshot is published"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def write_snapshot(folder: str, user_ids: np.ndarray, encodings: np.ndarray, version: int,
+                   block: int = 65536) -> str:
+    """Write a snapshot and publish it with an atomic rename.
+
+    Layout: a fixed 64-byte header, the normalized float32 matrix with
+    rows sorted by user id, then the int32 user ids. Readers holding the
+    previous file keep their mapping until they reopen.
+    """
+    user_ids = np.asarray(user_ids, dtype=np.int32)
+    order = np.argsort(user_ids, kind='stable')
+    count, dim = encodings.shape
+    matrix_offset = HEADER_SIZE
+    ids_offset = matrix_offset + count * dim * 4
+
+    os.makedirs(folder, exist_ok=True)
+    path = snapshot_path(folder)
+    tmp_path = os.path.join(folder, f'.{SNAPSHOT_FILENAME}.{os.getpid()}.tmp')
+    try:
+        with open(tmp_path, 'wb') as f:
+            header = HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, dim, count, version,
+                                 matrix_offset, ids_offset)
+            f.write(header.ljust(HEADER_SIZE, b'\0'))
+            for start in range(0, count, block):
+                rows = order[start:start + block]
+                f.write(np.ascontiguousarray(encodings[rows], dtype='<f4').tobytes())
+            f.write(user_ids[order].astype('<i4').tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    _fsync_directory(folder)
+    logger.info(f"Published gallery snapshot with {count} encodings at version {version}")
+    return path
+
+
+def _fsync_directory(folder: str):
+    """Make the rename durable; not supported on every platform"""
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _parse_header(data: bytes) -> Optional[dict]:
+    if len(data) < HEADER.size:
+        return None
+    magic, fmt, dim, count, version, matrix_offset, ids_offset = HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or fmt != SNAPSHOT_FORMAT:
+        return None
+    return {'dim': dim, 'count': count, 'version': version,
+            'matrix_offset': matrix_offset, 'ids_offset': ids_offset}
+
+
+def read_snapshot_header(path: str) -> Optional[dict]:
+    """Parse a snapshot header, or None if missing or not a snapshot"""
+    try:
+        with open(path, 'rb') as f:
+            return _parse_header(f.read(HEADER_SIZE))
+    except OSError:
+        return None
+
+
+def open_snapshot(folder: str) -> Optional[GallerySnapshot]:
+    """Map the published snapshot read-only; pages are shared through the page cache"""
+    path = snapshot_path(folder)
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return None
+
+    # Header, identity and mappings all come from the same open file, so a
+    # concurrent publish cannot mix two versions
+    with f:
+        stat = os.fstat(f.fileno())
+        header = _parse_header(f.read(HEADER_SIZE))
+        if header is None:
+            return None
+
+        count, dim = header['count'], header['dim']
+        if stat.st_size < header['ids_offset'] + count * 4:
+            logger.error(f"Gallery snapshot {path} is truncated")
+            return None
+
+        if count == 0:
+            encodings = np.empty((0, dim), dtype=np.float32)
+            user_ids = np.empty(0, dtype=np.int32)
+        else:
+            encodings = np.memmap(f, dtype='<f4', mode='r', offset=header['matrix_offset'], shape=(count, dim))
+            user_ids = np.memmap(f, dtype='<i4', mode='r', offset=header['ids_offset'], shape=(count,))
+    identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    return GallerySnapshot(path, header['version'], dim, user_ids, encodings, identity)
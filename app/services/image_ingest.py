@@ -0,0 +1,104 @@
+# Image ingestion: bounded, reduced-resolution decoding of uploads
+import io
+import math
+import cv2
+import numpy as np
+from typing import Optional, Tuple
+from PIL import Image, ImageOps
+
+# Uploads with more pixels than this are rejected from their header alone
+DEFAULT_MAX_PIXELS = 40 * 1000 * 1000
+
+# Stored enrolment images are downscaled to fit this box
+FACE_IMAGE_SIZE = (400, 400)
+
+# cv2 decode flags by JPEG DCT scale factor
+REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                 (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+class ImageTooLarge(ValueError):
+    """The image's dimensions exceed the decoded pixel budget"""
+
+
+def read_bytes(source) -> bytes:
+    """The raw bytes of a path, bytes or file object"""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return f.read()
+    return source.read()
+
+
+def check_dimensions(image: Image.Image, max_pixels: int = DEFAULT_MAX_PIXELS):
+    """Reject an opened (not yet decoded) image whose pixel count exceeds ``max_pixels``"""
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageTooLarge(f"Image of {width}x{height} exceeds {max_pixels} pixels")
+
+
+def probe_image(data: bytes, max_pixels: int = DEFAULT_MAX_PIXELS) -> Tuple[str, Tuple[int, int]]:
+    """Format and size from the header only; raises for unreadable or oversized images"""
+    with Image.open(io.BytesIO(data)) as image:
+        check_dimensions(image, max_pixels)
+        return image.format, image.size
+
+
+def open_reduced(source, target_size: Tuple[int, int],
+                 max_pixels: int = DEFAULT_MAX_PIXELS) -> Image.Image:
+    """Decode an image to RGB at no less than twice the size it will be fitted into ``target_size``.
+
+    JPEGs are decoded by libjpeg at 1/2, 1/4 or 1/8 scale (``Image.draft``)
+    so a 12 MP phone photo headed for a 400px thumbnail never exists at
+    full resolution in memory. The pixel budget is checked from the header
+    before anything is decoded. EXIF orientation is applied.
+    """
+    image = Image.open(source)
+    try:
+        check_dimensions(image, max_pixels)
+        if image.format == 'JPEG':
+            # Twice the size the image will have once fitted into target_size
+            width, height = image.size
+            fit = min(target_size[0] / width, target_size[1] / height)
+            image.draft('RGB', (math.ceil(width * fit * 2), math.ceil(height * fit * 2)))
+        image.load()
+        decoded = ImageOps.exif_transpose(image).convert('RGB')
+    finally:
+        image.close()
+    return decoded
+
+
+def save_face_image(source, destination, max_pixels: int = DEFAULT_MAX_PIXELS):
+    """Decode an uploaded image, downscale it and save it as JPEG to a path or file object.
+
+    Raises ``ImageTooLarge`` past ``max_pixels``.
+    """
+    image = open_reduced(source, FACE_IMAGE_SIZE, max_pixels)
+    image.thumbnail(FACE_IMAGE_SIZE, Image.Resampling.LANCZOS)
+    image.save(destination, 'JPEG', quality=90)
+
+
+def decode_bgr(source, min_side: Optional[int] = None,
+               max_pixels: int = DEFAULT_MAX_PIXELS) -> Optional[np.ndarray]:
+    """Decode a path, bytes or file object into a BGR array for OpenCV.
+
+    With ``min_side``, JPEGs are decoded with the largest
+    ``IMREAD_REDUCED_*`` factor that keeps the shorter side at least that
+    long. Returns None for unreadable data; raises ``ImageTooLarge``.
+    """
+    data = read_bytes(source)
+    try:
+        image_format, (width, height) = probe_image(data, max_pixels)
+    except ImageTooLarge:
+        raise
+    except Exception:
+        return None
+
+    flag = cv2.IMREAD_COLOR
+    if min_side and image_format == 'JPEG':
+        for factor, reduced_flag in REDUCED_FLAGS:
+            if min(width, height) // factor >= min_side:
+                flag = reduced_flag
+                break
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
@@ -0,0 +1,79 @@
+# Cache of probe embeddings and match results, keyed by image digest
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Optional
+
+CachedProbe = namedtuple('CachedProbe', ['encoding', 'result'])
+
+
+class ProbeCache:
+    """Bounded LRU of probe embeddings with a time-to-live.
+
+    Kiosk retries and client resubmissions send the same bytes again; a
+    hit skips detection and embedding. An entry also remembers match
+    results per search scope (``location_id``), valid only at the gallery
+    version they were computed at. The embedding itself is kept across
+    versions since it does not depend on the gallery. Thread-safe.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 300.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # digest -> [expires, encoding, version, {scope: result}]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, digest: str, version: int, scope=None) -> Optional[CachedProbe]:
+        """The cached encoding (None if the image had no face) and, if still valid, the result"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self._entries[digest]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            result = entry[3].get(scope) if entry[2] == version else None
+            return CachedProbe(entry[1], result)
+
+    def put(self, digest: str, encoding, version: int, scope=None, result=None):
+        """Cache an encoding and the match result found for it at ``version``"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None or entry[2] != version:
+                entry = [self.clock() + self.ttl_seconds, encoding, version, {}]
+                self._entries[digest] = entry
+            entry[3][scope] = result
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_results(self):
+        """Drop the cached match results, keeping the embeddings"""
+        with self._lock:
+            for entry in self._entries.values():
+                entry[3] = {}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_caches = {}
+
+
+def get_probe_cache(config) -> Optional[ProbeCache]:
+    """The process-wide probe cache for the configured bounds; None when disabled"""
+    key = (config.get('FACE_PROBE_CACHE_SIZE', 256), config.get('FACE_PROBE_CACHE_TTL', 300.0))
+    if key[0] <= 0 or key[1] <= 0:
+        return None
+    if key not in _caches:
+        _caches[key] = ProbeCache(*key)
+    return _caches[key]
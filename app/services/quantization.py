@@ -0,0 +1,96 @@
+# Scalar-quantized gallery codes for a compact first-pass scan
+import numpy as np
+from typing import Optional, Tuple
+
+from app.services.face_gallery import top_k
+
+QUANTIZATION_MODES = ('none', 'float16', 'int8')
+
+# Rows widened to float32 at a time while scanning; the buffer stays in cache
+SCAN_BLOCK_ROWS = 1024
+
+
+class ScalarQuantizer:
+    """Compact codes for unit-length encodings.
+
+    ``float16`` halves the matrix; ``int8`` quarters it, storing each
+    vector as ``round(127 * x / max(|x|))`` with one float32 scale per
+    vector that brings the codes back to unit length, so scores stay
+    cosines of the quantized direction. The codes only produce
+    approximate scores, so callers re-rank a small candidate set against
+    the exact float32 rows.
+    """
+
+    def __init__(self, mode: str = 'int8'):
+        if mode not in QUANTIZATION_MODES or mode == 'none':
+            raise ValueError(f"Unknown quantization mode: {mode}")
+        self.mode = mode
+        self.codes = None
+        self.scales = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def fit(self, encodings: np.ndarray, block: int = 65536) -> 'ScalarQuantizer':
+        """Encode a (possibly memory-mapped) float32 matrix block by block"""
+        n, dim = encodings.shape
+        if self.mode == 'float16':
+            self.codes = np.empty((n, dim), dtype=np.float16)
+            for start in range(0, n, block):
+                self.codes[start:start + block] = encodings[start:start + block]
+            return self
+
+        self.codes = np.empty((n, dim), dtype=np.int8)
+        self.scales = np.empty(n, dtype=np.float32)
+        for start in range(0, n, block):
+            chunk = np.asarray(encodings[start:start + block], dtype=np.float32)
+            steps = np.abs(chunk).max(axis=1) / 127.0
+            steps[steps == 0] = 1.0
+            codes = np.rint(chunk / steps[:, None])
+            norms = np.linalg.norm(codes, axis=1)
+            norms[norms == 0] = 1.0
+            self.codes[start:start + block] = codes
+            self.scales[start:start + block] = 1.0 / norms
+        return self
+
+    def scan(self, probes: np.ndarray, k: int,
+             removed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top ``k`` rows per probe by their code scores, as ``(rows, scores)``.
+
+        NumPy has no low-precision matrix product, so each block of codes is
+        widened into a small float32 buffer and multiplied while it is still
+        in cache; int8 scores are scaled per row afterwards. Only the codes
+        are read from memory, a half or a quarter of the float32 traffic.
+        """
+        n, dim = self.codes.shape
+        probes = np.asarray(probes, dtype=np.float32)
+        scores = np.empty((len(probes), n), dtype=np.float32)
+        buffer = np.empty((min(SCAN_BLOCK_ROWS, n), dim), dtype=np.float32)
+        for start in range(0, n, SCAN_BLOCK_ROWS):
+            stop = min(start + SCAN_BLOCK_ROWS, n)
+            block = buffer[:stop - start]
+            np.copyto(block, self.codes[start:stop], casting='unsafe')
+            np.matmul(probes, block.T, out=scores[:, start:stop])
+        if self.scales is not None:
+            scores *= self.scales
+        if removed is not None:
+            scores[:, removed] = -np.inf
+        return top_k(scores, k)
+
+
+def rerank(probes: np.ndarray, matrix: np.ndarray, rows: np.ndarray, k: int,
+           removed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact float32 scores for candidate rows; returns the best k ``(rows, scores)``"""
+    exact = np.empty(rows.shape, dtype=np.float32)
+    for i, probe in enumerate(probes):
+        # Sorted gathers keep reads from a memory-mapped matrix sequential
+        order = np.argsort(rows[i])
+        exact[i, order] = np.asarray(matrix[rows[i][order]], dtype=np.float32) @ probe
+    if removed is not None:
+        exact[removed[rows]] = -np.inf
+    columns, scores = top_k(exact, k)
+    return np.take_along_axis(rows, columns, axis=1), scores
@@ -0,0 +1,279 @@
+# Background re-embedding of the gallery with a new model, swapped in atomically
+import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+import cv2
+import numpy as np
+from flask import current_app
+from sqlalchemy import func, or_
+
+from app import db
+from app.models import User, FaceImage, FaceTemplate, GalleryChange
+from app.models.face_encoding import centroid_encoding, pack_encoding, unpack_encoding
+from app.services.bulk_enrolment import PIPELINE_SETTINGS
+from app.services.face_image_store import content_path
+from app.services.face_pipeline import embedding_model_path, get_pipeline, load_image, model_version
+from app.services.face_recognition_service import FaceRecognitionService
+from app.services.image_ingest import DEFAULT_MAX_PIXELS
+from app.services.registry import create_face_service
+
+logger = logging.getLogger(__name__)
+
+
+_worker_service = None
+_worker_max_pixels = DEFAULT_MAX_PIXELS
+
+
+def _init_worker(settings: dict):
+    """Load the new model once per worker process"""
+    global _worker_service, _worker_max_pixels
+    cv2.setNumThreads(1)
+    pipeline = get_pipeline(settings)
+    if pipeline is None:
+        raise RuntimeError("Face models could not be loaded")
+    _worker_service = FaceRecognitionService(pipeline=pipeline)
+    _worker_max_pixels = settings.get('FACE_MAX_IMAGE_PIXELS') or DEFAULT_MAX_PIXELS
+
+
+def _embed_image(image_path: str) -> tuple:
+    """Worker: ``(packed encoding, None)``, ``(None, None)`` without a face, or ``(None, reason)``"""
+    try:
+        image = load_image(image_path, max_pixels=_worker_max_pixels)
+        if image is None:
+            return None, 'Unreadable image'
+        encoding = _worker_service.encode_images([image])[0][0]
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
+    return (pack_encoding(encoding) if encoding is not None else None), None
+
+
+def pending_users(version: str):
+    """Users whose live encoding is not from ``version`` and who have nothing staged for it"""
+    return User.query.filter(
+        User.face_encoding.isnot(None),
+        or_(User.face_encoding_version.is_(None), User.face_encoding_version != version),
+        or_(User.next_encoding_version.is_(None), User.next_encoding_version != version)
+    )
+
+
+def reembed_gallery(version: str, workers: Optional[int] = None, batch_size: int = 200,
+                    encode: Optional[Callable[[str], Optional[np.ndarray]]] = None, swap: bool = True,
+                    force: bool = False, progress: Optional[Callable[[int, int], None]] = None) -> dict:
+    """Re-encode every enrolment image with model ``version`` while the old gallery keeps serving.
+
+    New encodings are staged beside the live ones (``next_*`` columns), one
+    committed batch of ``batch_size`` users at a time, so an interrupted
+    job resumes where it stopped when run again. Images come from the
+    content store, or the stored path for templates that predate it, and
+    are encoded in a process pool; ``encode`` replaces the pool with an
+    in-process callable. Once no user is pending, ``swap_gallery``
+    switches every worker to the new encodings at once (see there for
+    ``force``).
+
+    A missing or unreadable image is a failure, not a missing face: a
+    user none of whose images could be read is left pending, to be
+    retried by the next run. ``progress(done, total)`` is called after
+    each batch.
+    """
+    started = time.perf_counter()
+    config = current_app.config
+    executor = None
+    if encode is None:
+        settings = {key: config.get(key) for key in PIPELINE_SETTINGS}
+        settings['FACE_EMBEDDING_MODEL'] = embedding_model_path(config, version)
+        missing = [path for path in (settings['FACE_DETECTOR_MODEL'], settings['FACE_EMBEDDING_MODEL'])
+                   if not path or not os.path.exists(path)]
+        if missing:
+            raise FileNotFoundError(f"Face models for version {version} not found: {', '.join(map(str, missing))}")
+        executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                       initializer=_init_worker, initargs=(settings,))
+
+    def encode_all(paths):
+        if executor is not None:
+            return list(executor.map(_embed_image, paths, chunksize=8))
+        encodings = [encode(path) for path in paths]
+        return [(pack_encoding(encoding) if encoding is not None else None, None) for encoding in encodings]
+
+    total = pending_users(version).count()
+    counts = Counter()
+    try:
+        # Passes over the pending users by id, so failed users are not retried
+        # within a pass; another pass picks up members who enrolled meanwhile
+        while True:
+            staged, last_id = 0, 0
+            while True:
+                users = pending_users(version).filter(User.id > last_id).order_by(User.id).limit(batch_size).all()
+                if not users:
+                    break
+                last_id = users[-1].id
+                batch = _reembed_batch(users, version, encode_all)
+                staged += batch['reembedded'] + batch['no_face']
+                counts.update(batch)
+                if progress is not None:
+                    progress(sum(counts.values()), max(total, sum(counts.values())))
+            if not staged:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    failed = pending_users(version).count()
+    swapped = swap and swap_gallery(version, force=force)
+    return {
+        'reembedded': counts['reembedded'],
+        'no_face': counts['no_face'],
+        'failed': failed,
+        'swapped': swapped,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+
+
+def _reembed_batch(users, version: str, encode_all) -> Counter:
+    """Stage new encodings for a batch of users in one commit.
+
+    Returns the number of users ``reembedded``, left with ``no_face`` and
+    ``failed`` (no image could be read; not staged).
+    """
+    user_ids = [user.id for user in users]
+    templates = {}
+    for template in FaceTemplate.query.filter(FaceTemplate.user_id.in_(user_ids)).order_by(FaceTemplate.id):
+        templates.setdefault(template.user_id, []).append(template)
+
+    # Users enrolled before templates existed only have their stored image
+    sources = []
+    for user in users:
+        for template in templates.get(user.id) or [None]:
+            if template is None:
+                sources.append((user, None, user.face_image_path))
+            else:
+                path = content_path(template.image_digest) if template.image_digest else template.image_path
+                sources.append((user, template, path))
+    readable = [index for index, (_, _, path) in enumerate(sources) if path and os.path.exists(path)]
+    results = [(None, 'Missing image file')] * len(sources)
+    for index, result in zip(readable, encode_all([sources[index][2] for index in readable])):
+        results[index] = result
+
+    staged = {user.id: [] for user in users}
+    errors = {user.id: [] for user in users}
+    template_updates = []
+    for (user, template, path), (blob, error) in zip(sources, results):
+        if error is not None:
+            logger.error(f"Could not re-embed {path} of user {user.id}: {error}")
+            errors[user.id].append(template)
+        elif blob is not None:
+            staged[user.id].append(unpack_encoding(blob))
+    for (user, template, _), (blob, error) in zip(sources, results):
+        if template is not None and (staged[user.id] or not errors[user.id]):
+            # A template whose image could not be read is dropped at the swap,
+            # unless none of the user's could be; then the user stays pending
+            template_updates.append({'id': template.id, 'next_encoding': blob, 'next_version': version})
+
+    counts = Counter(reembedded=0, no_face=0, failed=0)
+    try:
+        db.session.bulk_update_mappings(FaceTemplate, template_updates)
+        for user in users:
+            encodings = staged[user.id]
+            if not encodings and errors[user.id]:
+                counts['failed'] += 1
+                continue
+            if not encodings:
+                # Left without a face under the new model; dropped at the swap
+                logger.warning(f"No face found for user {user.id} with model {version}")
+                counts['no_face'] += 1
+            else:
+                counts['reembedded'] += 1
+            # Skipped if the user re-enrolled meanwhile; the enrolment cleared
+            # their staging, so they are pending again
+            User.query.filter(User.id == user.id, User.face_encoding == user.face_encoding).update({
+                User.next_face_encoding: pack_encoding(centroid_encoding(encodings)) if encodings else None,
+                User.next_encoding_version: version
+            }, synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    logger.info(f"Re-embedded {len(users)} users with model {version}")
+    return counts
+
+
+def swap_gallery(version: str, force: bool = False) -> bool:
+    """Make the staged ``version`` encodings live in one transaction.
+
+    The transaction also records a ``GalleryChange.RELOAD``, on which every
+    worker reloads its gallery and switches its pipeline to the new model;
+    until it commits they serve the old encodings. Cached encodings of
+    stored images from other models are dropped. Returns False while
+    users are still pending, when more than FACE_REEMBED_MAX_DROP_RATE of
+    the gallery would be left without a face, or when there is nothing to
+    swap. ``force`` swaps anyway, dropping the pending users too.
+    """
+    try:
+        pending = pending_users(version)
+        if not force and pending.first() is not None:
+            logger.info(f"Users are still pending re-embedding with model {version}; not swapping")
+            return False
+        reload = GalleryChange.latest_reload()
+        active = reload.model_version if reload is not None else model_version(current_app.config)
+        staged_users = User.query.filter(User.next_encoding_version == version)
+        if active == version and staged_users.first() is None and pending.first() is None:
+            return False
+
+        enrolled = User.query.filter(User.face_encoding.isnot(None)).count()
+        dropping = staged_users.filter(User.next_face_encoding.is_(None)).count() + pending.count()
+        max_drop_rate = current_app.config.get('FACE_REEMBED_MAX_DROP_RATE', 0.05)
+        if not force and enrolled and dropping / enrolled > max_drop_rate:
+            logger.error(f"{dropping} of {enrolled} users would be left without a face under model "
+                         f"{version}; not swapping (check the images and models, or force the swap)")
+            return False
+        if force:
+            # Their old encodings cannot be compared with the new model's
+            pending_ids = pending.with_entities(User.id)
+            FaceTemplate.query.filter(FaceTemplate.user_id.in_(pending_ids)).update({
+                FaceTemplate.next_encoding: None,
+                FaceTemplate.next_version: version
+            }, synchronize_session=False)
+            pending.update({
+                User.next_face_encoding: None,
+                User.next_encoding_version: version
+            }, synchronize_session=False)
+
+        staged = FaceTemplate.next_version == version
+        FaceTemplate.query.filter(staged, FaceTemplate.next_encoding.isnot(None)).update({
+            FaceTemplate.encoding: FaceTemplate.next_encoding,
+            FaceTemplate.model_version: FaceTemplate.next_version,
+            FaceTemplate.next_encoding: None,
+            FaceTemplate.next_version: None
+        }, synchronize_session=False)
+        # Templates the new model finds no face in cannot be matched any more
+        released = Counter(dict(db.session.query(FaceTemplate.image_digest, func.count(FaceTemplate.id)).filter(
+            staged, FaceTemplate.image_digest.isnot(None)
+        ).group_by(FaceTemplate.image_digest).all()))
+        FaceTemplate.query.filter(staged).delete(synchronize_session=False)
+        for digest, count in released.items():
+            FaceImage.release(digest, count)
+
+        dropped = staged_users.filter(User.next_face_encoding.is_(None)).count()
+        swapped = staged_users.update({
+            User.face_encoding: User.next_face_encoding,
+            User.face_encoding_version: version,
+            User.next_face_encoding: None,
+            User.next_encoding_version: None
+        }, synchronize_session=False)
+        FaceImage.query.filter(or_(FaceImage.model_version.is_(None), FaceImage.model_version != version)).update({
+            FaceImage.encoding: None,
+            FaceImage.model_version: None
+        }, synchronize_session=False)
+        GalleryChange.record_reload(version)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    logger.info(f"Swapped {swapped} users to model {version}; {dropped} had no face under it")
+
+    # Publish the new snapshot now rather than in the first worker to notice
+    create_face_service().load_known_faces(use_snapshot=False)
+    return True
@@ -0,0 +1,188 @@
+# App-scoped services, built once per worker process instead of per request
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Optional
+
+from flask import current_app, has_app_context
+
+from app import db
+from app.services.face_recognition_service import FaceRecognitionService
+
+logger = logging.getLogger(__name__)
+
+EXTENSION = 'services'
+
+# Registries with a failed warm-up; forked workers restart their retries
+_registries = weakref.WeakSet()
+
+
+class ServiceRegistry:
+    """Holds the services shared by every request an app serves.
+
+    The face service, with its models and gallery, is warmed on first use
+    or explicitly by ``warm``. When ``create_app`` warms it in a gunicorn
+    master started with ``--preload``, forked workers share the models
+    and the mapped gallery snapshot copy-on-write. A failed warm-up is
+    retried in the background every FACE_WARM_RETRY_SECONDS, and requests
+    do not retry it before then. ``status`` reports readiness for health
+    checks without loading anything.
+    """
+
+    def __init__(self, app=None):
+        self.face_service = None
+        self.started_at = time.time()
+        self.warmed_at = None
+        self.warm_ms = None
+        self.error = None
+        self.models_loaded = False
+        self.retry_at = None  # time.monotonic() of the next warm-up attempt after a failure
+        self._timer = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions[EXTENSION] = self
+
+    def get_face_service(self) -> FaceRecognitionService:
+        """The shared face service, warming it on first use or once a failed load is due a retry.
+
+        Until then the service that failed to load is returned as it is.
+        """
+        if not self.ready:
+            self.warm(force=False)
+        return self.face_service
+
+    def warm(self, force: bool = True) -> bool:
+        """Load the face models and gallery; True once the gallery is loaded.
+
+        A failed load (e.g. before the database is migrated) is retried
+        after FACE_WARM_RETRY_SECONDS; before that only ``force`` (the
+        default) tries again.
+        """
+        with self._lock:
+            if self.ready:
+                return True
+            if not force and self.retry_at is not None and time.monotonic() < self.retry_at:
+                return False
+            started = time.perf_counter()
+            with self.app.app_context():
+                service = self.face_service or create_face_service(self.app.config)
+                try:
+                    # Load the models into the process-wide cache
+                    self.models_loaded = service._get_pipeline() is not None
+                    self.error = None if service.load_known_faces() else 'Face gallery could not be loaded'
+                except Exception as e:
+                    self.error = str(e)
+                    logger.error(f"Error warming face recognition: {self.error}")
+            self.face_service = service
+            self.warm_ms = round((time.perf_counter() - started) * 1000, 2)
+            self.warmed_at = time.time()
+            if self.error is None:
+                self.retry_at = None
+                _registries.discard(self)
+                logger.info(f"Face recognition warmed in {self.warm_ms} ms with {len(service.gallery)} encodings")
+            else:
+                self._schedule_retry()
+            return self.ready
+
+    def _schedule_retry(self):
+        """Retry a failed warm-up in the background; 0 seconds leaves it to the next use"""
+        delay = self.app.config.get('FACE_WARM_RETRY_SECONDS', 30)
+        self.retry_at = time.monotonic() + delay
+        _registries.add(self)
+        if delay > 0 and (self._timer is None or not self._timer.is_alive()):
+            self._timer = threading.Timer(delay, self._retry)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _retry(self):
+        self._timer = None
+        try:
+            self.warm()
+        except Exception as e:
+            logger.error(f"Error retrying face recognition warm-up: {str(e)}")
+
+    def cancel_retry(self):
+        """Stop a scheduled background retry"""
+        timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+
+    @property
+    def ready(self) -> bool:
+        return self.face_service is not None and self.error is None
+
+    def status(self) -> dict:
+        """Readiness details for health checks"""
+        service = self.face_service
+        return {
+            'ready': self.ready,
+            'warmed': service is not None,
+            'models_loaded': self.models_loaded,
+            'gallery_size': len(service.gallery) if service is not None else 0,
+            'gallery_version': service.version if service is not None else None,
+            'warm_ms': self.warm_ms,
+            'retry_in_seconds': (round(max(self.retry_at - time.monotonic(), 0.0), 1)
+                                 if self.retry_at is not None and not self.ready else None),
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'error': self.error
+        }
+
+
+def _restart_retries():
+    """Timers do not survive a fork: give each forked worker its own retries"""
+    for registry in list(_registries):
+        registry._lock = threading.Lock()
+        registry._timer = None
+        if not registry.ready:
+            registry._schedule_retry()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_retries)
+
+
+def warm_for_fork(app):
+    """Warm ``app``'s services before workers fork from it.
+
+    Database connections opened while loading the gallery are closed,
+    so forked workers do not share them.
+    """
+    registry = get_registry(app)
+    registry.warm()
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def get_registry(app=None) -> Optional[ServiceRegistry]:
+    """The registry of ``app`` (the current app by default)"""
+    if app is None:
+        if not has_app_context():
+            return None
+        app = current_app._get_current_object()
+    return app.extensions.get(EXTENSION)
+
+
+def create_face_service(config=None) -> FaceRecognitionService:
+    """A new face service set up from ``config`` (the current app's by default) like the shared one.
+
+    For commands that need their own gallery; they then agree with the web
+    workers about what counts as a match.
+    """
+    if config is None:
+        config = current_app.config if has_app_context() else {}
+    return FaceRecognitionService(tolerance=config.get('FACE_RECOGNITION_TOLERANCE', 1.13))
+
+
+def get_face_service() -> FaceRecognitionService:
+    """The app's shared face service; a private one outside an app with a registry"""
+    registry = get_registry()
+    if registry is None:
+        return create_face_service()
+    return registry.get_face_service()
@@ -0,0 +1,159 @@
+# Low-overhead stage timings: perf_counter_ns spans feeding per-process histograms
+import bisect
+import contextvars
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+# Bucket upper bounds in nanoseconds, 50us to 10s; slower spans land in +Inf
+BUCKET_BOUNDS_NS = [int(ms * 1e6) for ms in (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500,
+                                             1000, 2500, 5000, 10000)]
+
+# Stage -> milliseconds of the request being traced, if one is
+_trace = contextvars.ContextVar('timing_trace', default=None)
+
+
+class Histogram:
+    """Counts of durations per fixed bucket, with their sum and maximum"""
+
+    __slots__ = ('counts', 'count', 'total_ns', 'max_ns')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_NS) + 1)
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def observe(self, duration_ns: int):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS_NS, duration_ns)] += 1
+        self.count += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the ``fraction`` quantile, in ms (capped at the maximum)"""
+        if not self.count:
+            return 0.0
+        rank, seen = fraction * self.count, 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                bound = BUCKET_BOUNDS_NS[index] if index < len(BUCKET_BOUNDS_NS) else self.max_ns
+                return min(bound, self.max_ns) / 1e6
+        return self.max_ns / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ns / self.count / 1e6, 3) if self.count else 0.0,
+            'p50_ms': round(self.percentile(0.5), 3),
+            'p90_ms': round(self.percentile(0.9), 3),
+            'p99_ms': round(self.percentile(0.99), 3),
+            'max_ms': round(self.max_ns / 1e6, 3),
+            'total_ms': round(self.total_ns / 1e6, 3),
+            'buckets': dict(zip([str(bound / 1e6) for bound in BUCKET_BOUNDS_NS] + ['+Inf'], self.counts)),
+        }
+
+
+class Timings:
+    """Histograms by stage name for this process, e.g. ``face.embed`` or ``attendance.commit``"""
+
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, duration_ns: int):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(duration_ns)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())}
+        return {'pid': os.getpid(), 'since': self.started_at, 'stages': stages}
+
+    def prometheus(self, prefix: str = 'recognition_stage_seconds') -> str:
+        """The histograms in the Prometheus text exposition format"""
+        lines = [f'# TYPE {prefix} histogram']
+        with self._lock:
+            for name, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKET_BOUNDS_NS + [None], histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound is None else repr(bound / 1e9)
+                    lines.append(f'{prefix}_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'{prefix}_sum{{stage="{name}"}} {histogram.total_ns / 1e9}')
+                lines.append(f'{prefix}_count{{stage="{name}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.started_at = time.time()
+
+
+_timings = Timings()
+
+
+def get_timings() -> Timings:
+    """The process-wide histograms"""
+    return _timings
+
+
+def record(name: str, duration_ns: int):
+    """Add a measured duration to the process histograms and the current trace"""
+    _timings.observe(name, duration_ns)
+    stages = _trace.get()
+    if stages is not None:
+        stages[name] = round(stages.get(name, 0.0) + duration_ns / 1e6, 3)
+
+
+def record_ms(name: str, duration_ms: float):
+    record(name, int(duration_ms * 1e6))
+
+
+class span:
+    """Time a block under ``name``: ``with span('face.search'): ...``"""
+
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter_ns() - self.started)
+        return False
+
+
+class trace:
+    """Collect the spans of the enclosed block (e.g. one request) by stage, in ms.
+
+    ``with trace() as stages: ...`` leaves ``stages`` holding each stage's
+    total; with ``enabled=False`` nothing is collected and ``stages`` is None.
+    """
+
+    __slots__ = ('enabled', 'stages', '_token')
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.stages: Optional[dict] = None
+
+    def __enter__(self) -> Optional[dict]:
+        if self.enabled:
+            self.stages = {}
+            self._token = _trace.set(self.stages)
+        return self.stages
+
+    def __exit__(self, *exc_info):
+        if self.enabled:
+            _trace.reset(self._token)
+        return False
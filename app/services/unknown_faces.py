@@ -0,0 +1,286 @@
+# Unrecognized faces kept for review, grouped by online clustering
+import os
+import re
+import threading
+import time
+import uuid
+import logging
+from collections import namedtuple
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+from flask import current_app, has_app_context
+
+from app.services.face_gallery import normalize_encodings
+
+logger = logging.getLogger(__name__)
+
+CLUSTERS_FILENAME = 'clusters.npz'
+# <captured at, ms>-<location id, 0 for none>-<random>
+FACE_ID = re.compile(r'^(\d{13})-(\d+)-([0-9a-f]{8})$')
+
+UnknownFace = namedtuple('UnknownFace', 'id captured_at location_id')
+Cluster = namedtuple('Cluster', 'label faces centroid')
+
+
+def parse_face_id(face_id: str) -> Optional[UnknownFace]:
+    match = FACE_ID.match(face_id)
+    if match is None:
+        return None
+    location_id = int(match.group(2))
+    return UnknownFace(face_id, int(match.group(1)) / 1000.0, location_id or None)
+
+
+class UnknownFaceStore:
+    """Faces that matched nobody, as an ``.npy`` embedding and a JPEG thumbnail each.
+
+    Everything a face needs besides its files (capture time, location) is
+    in its id, so listing the folder is enough to load or prune it. The
+    store keeps at most ``max_faces`` faces no older than ``max_age``
+    seconds; it prunes itself every ``prune_every`` additions.
+    """
+
+    def __init__(self, folder: str, max_faces: int = 10000, max_age: float = 14 * 86400,
+                 prune_every: int = 100, clock=time.time):
+        self.folder = folder
+        self.max_faces = max_faces
+        self.max_age = max_age
+        self.prune_every = prune_every
+        self.clock = clock
+        self._added = 0
+        self._lock = threading.Lock()
+
+    def add(self, encoding: np.ndarray, thumbnail: np.ndarray, location_id: Optional[int] = None) -> str:
+        """Keep an unrecognized face; returns its id"""
+        face_id = f'{int(self.clock() * 1000):013d}-{location_id or 0}-{uuid.uuid4().hex[:8]}'
+        os.makedirs(self.folder, exist_ok=True)
+        cv2.imwrite(os.path.join(self.folder, face_id + '.jpg'), thumbnail, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        # Written last and renamed into place: a face is listed once its
+        # embedding is complete
+        path = os.path.join(self.folder, face_id + '.npy')
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(encoding, dtype=np.float32).ravel())
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._added += 1
+            due = self._added % self.prune_every == 0
+        if due:
+            self.prune()
+        return face_id
+
+    def faces(self) -> List[UnknownFace]:
+        """Stored faces, oldest first"""
+        try:
+            names = os.listdir(self.folder)
+        except FileNotFoundError:
+            return []
+        faces = (parse_face_id(name[:-4]) for name in names if name.endswith('.npy'))
+        return sorted((face for face in faces if face is not None), key=lambda face: face.id)
+
+    def load(self, face_ids: List[str]) -> np.ndarray:
+        """Embeddings of ``face_ids`` as one ``(n, dim)`` matrix"""
+        return np.stack([np.load(self.path(face_id, '.npy')) for face_id in face_ids])
+
+    def path(self, face_id: str, extension: str = '.jpg') -> str:
+        return os.path.join(self.folder, face_id + extension)
+
+    def remove(self, face_ids) -> int:
+        removed = 0
+        for face_id in face_ids:
+            for extension in ('.npy', '.jpg'):
+                try:
+                    os.remove(self.path(face_id, extension))
+                except FileNotFoundError:
+                    continue
+            removed += 1
+        return removed
+
+    def prune(self) -> int:
+        """Drop faces past ``max_age``, then the oldest past ``max_faces``"""
+        faces = self.faces()
+        cutoff = self.clock() - self.max_age
+        expired = [face.id for face in faces if face.captured_at < cutoff]
+        kept = len(faces) - len(expired)
+        if kept > self.max_faces:
+            expired += [face.id for face in faces[len(expired):len(expired) + kept - self.max_faces]]
+        removed = self.remove(expired)
+        if removed:
+            logger.info(f"Pruned {removed} unknown faces")
+        return removed
+
+
+class UnknownFaceClusters:
+    """Online (leader) clustering of the unknown faces, persisted beside them.
+
+    Each run only assigns the faces added since the previous one: a face
+    joins the cluster whose centroid is nearest if it is within
+    ``max_distance``, otherwise it starts a new cluster. Centroids are
+    running means of their members' unit embeddings. Faces pruned from
+    the store leave their clusters, and empty clusters are dropped.
+    """
+
+    def __init__(self, store: UnknownFaceStore, max_distance: float = 1.13):
+        self.store = store
+        self.max_distance = max_distance
+        self.labels = np.empty(0, dtype=np.int64)
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+        self.sizes = np.empty(0, dtype=np.int64)  # faces ever assigned, for the running means
+        self.assignments = {}  # face id -> label
+        self.next_label = 1  # labels are never reused, so a reviewed label stays dismissed
+        self._load()
+
+    @property
+    def state_path(self) -> str:
+        return os.path.join(self.store.folder, CLUSTERS_FILENAME)
+
+    def _load(self):
+        try:
+            with np.load(self.state_path) as state:
+                self.labels, self.centroids, self.sizes = state['labels'], state['centroids'], state['sizes']
+                self.assignments = dict(zip(state['face_ids'].tolist(), state['face_labels'].tolist()))
+                self.next_label = int(state['next_label'])
+        except (FileNotFoundError, KeyError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.error(f"Ignoring unreadable unknown face clusters: {str(e)}")
+
+    def save(self):
+        """Write the state with an atomic rename"""
+        path = f'{self.state_path}.{os.getpid()}.tmp'
+        with open(path, 'wb') as f:
+            np.savez(f, labels=self.labels, centroids=self.centroids, sizes=self.sizes,
+                     next_label=self.next_label, face_ids=np.array(list(self.assignments), dtype=str),
+                     face_labels=np.array(list(self.assignments.values()), dtype=np.int64))
+        os.replace(path, self.state_path)
+
+    def update(self) -> int:
+        """Cluster faces added since the last run and forget pruned ones; returns faces assigned"""
+        faces = self.store.faces()
+        present = {face.id for face in faces}
+        self.assignments = {face_id: label for face_id, label in self.assignments.items() if face_id in present}
+        new = [face.id for face in faces if face.id not in self.assignments]
+        if new:
+            self._assign(new, normalize_encodings(self.store.load(new)))
+
+        live = np.isin(self.labels, np.fromiter(set(self.assignments.values()), dtype=np.int64))
+        self.labels, self.centroids, self.sizes = self.labels[live], self.centroids[live], self.sizes[live]
+        self.save()
+        return len(new)
+
+    def _assign(self, face_ids: List[str], encodings: np.ndarray):
+        threshold = 1.0 - self.max_distance ** 2 / 2.0  # cosine similarity at that distance
+        count = len(self.labels)
+        capacity = max(16, count + len(face_ids))
+        centroids = np.zeros((capacity, encodings.shape[1]), dtype=np.float32)
+        if count:
+            centroids[:count] = self.centroids
+        sizes = np.zeros(capacity, dtype=np.int64)
+        sizes[:count] = self.sizes
+        labels = np.zeros(capacity, dtype=np.int64)
+        labels[:count] = self.labels
+
+        for face_id, encoding in zip(face_ids, encodings):
+            similarities = centroids[:count] @ encoding
+            best = int(np.argmax(similarities)) if count else -1
+            if best >= 0 and similarities[best] >= threshold:
+                mean = centroids[best] * sizes[best] + encoding
+                centroids[best] = mean / max(np.linalg.norm(mean), 1e-12)
+                sizes[best] += 1
+            else:
+                best = count
+                centroids[best], sizes[best], labels[best] = encoding, 1, self.next_label
+                self.next_label += 1
+                count += 1
+            self.assignments[face_id] = int(labels[best])
+        self.labels, self.centroids, self.sizes = labels[:count], centroids[:count], sizes[:count]
+
+    def clusters(self, min_size: int = 1) -> List[Cluster]:
+        """Clusters with at least ``min_size`` stored faces, largest first"""
+        members: Dict[int, List[UnknownFace]] = {}
+        for face_id, label in self.assignments.items():
+            members.setdefault(label, []).append(parse_face_id(face_id))
+        rows = {int(label): row for row, label in enumerate(self.labels)}
+        clusters = [Cluster(label, sorted(faces, key=lambda face: face.id), self.centroids[rows[label]])
+                    for label, faces in members.items() if len(faces) >= min_size and label in rows]
+        return sorted(clusters, key=lambda cluster: (-len(cluster.faces), cluster.label))
+
+    def get(self, label: int) -> Optional[Cluster]:
+        return next((cluster for cluster in self.clusters() if cluster.label == label), None)
+
+    def dismiss(self, label: int) -> int:
+        """Delete a reviewed cluster and its faces; returns the faces removed"""
+        face_ids = [face_id for face_id, assigned in self.assignments.items() if assigned == label]
+        removed = self.store.remove(face_ids)
+        for face_id in face_ids:
+            del self.assignments[face_id]
+        keep = self.labels != label
+        self.labels, self.centroids, self.sizes = self.labels[keep], self.centroids[keep], self.sizes[keep]
+        self.save()
+        return removed
+
+
+def enrolment_suggestions(clusters: List[Cluster], face_service, max_distance: float) -> List[dict]:
+    """What an admin could do about each recurring unknown face.
+
+    A cluster whose centroid is within ``max_distance`` of an enrolled
+    member is probably that member under conditions their enrolment does
+    not cover: suggest adding its faces as templates. Any other cluster is
+    someone attending without a usable enrolment: suggest enrolling them.
+    """
+    suggestions = []
+    nearest = face_service.nearest_users(np.stack([cluster.centroid for cluster in clusters])) if clusters else []
+    for cluster, (user_id, distance) in zip(clusters, nearest):
+        suggestions.append({
+            'label': cluster.label,
+            'faces': len(cluster.faces),
+            'face_ids': [face.id for face in cluster.faces],
+            'first_seen': datetime.fromtimestamp(cluster.faces[0].captured_at),
+            'last_seen': datetime.fromtimestamp(cluster.faces[-1].captured_at),
+            'location_ids': sorted({face.location_id for face in cluster.faces if face.location_id}),
+            'action': 'add_templates' if distance is not None and distance <= max_distance else 'enrol',
+            'nearest_user_id': user_id,
+            'nearest_distance': round(distance, 4) if distance is not None else None
+        })
+    return suggestions
+
+
+_stores = {}
+
+
+def get_unknown_store(config) -> Optional[UnknownFaceStore]:
+    """The process-wide store for UNKNOWN_FACES_FOLDER; None when disabled"""
+    key = (config['UNKNOWN_FACES_FOLDER'], config.get('UNKNOWN_FACES_MAX_COUNT', 10000),
+           config.get('UNKNOWN_FACES_MAX_AGE_DAYS', 14))
+    if key[1] <= 0:
+        return None
+    if key not in _stores:
+        _stores[key] = UnknownFaceStore(key[0], max_faces=key[1], max_age=key[2] * 86400)
+    return _stores[key]
+
+
+def load_clusters(config) -> Optional[UnknownFaceClusters]:
+    """The clusters of the configured unknown face store; None when it is disabled"""
+    store = get_unknown_store(config)
+    if store is None:
+        return None
+    return UnknownFaceClusters(store, max_distance=config.get('UNKNOWN_FACES_CLUSTER_DISTANCE', 1.13))
+
+
+def record_unknown_face(encoding: np.ndarray, thumbnail, location_id: Optional[int] = None) -> Optional[str]:
+    """Keep a face that matched nobody, if the store is enabled; never raises.
+
+    ``thumbnail`` is a BGR crop or a callable producing one, so callers
+    only pay for the crop when the store is on.
+    """
+    if not has_app_context():
+        return None
+    store = get_unknown_store(current_app.config)
+    if store is None:
+        return None
+    try:
+        return store.add(encoding, thumbnail() if callable(thumbnail) else thumbnail, location_id)
+    except Exception as e:
+        logger.error(f"Error storing unknown face: {str(e)}")
+        return None
@@ -0,0 +1,110 @@
+"""CPU time and peak memory of storing an upload as a 400px face image.
+
+Compares a full-resolution decode followed by a LANCZOS thumbnail (the
+previous behaviour) with the reduced-resolution JPEG decode used now.
+Each method runs in a fresh process so its peak RSS is measured alone.
+
+    python benchmarks/bench_image_decode.py --width 4032 --height 3024
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+FACE_IMAGE_SIZE = (400, 400)
+
+
+def synthetic_photo(width, height, seed=0):
+    """A JPEG with photo-like detail (gradients plus sensor-like noise)"""
+    rng = np.random.default_rng(seed)
+    rows, columns = np.mgrid[0:height, 0:width]
+    pixels = np.dstack([columns * 255 // width, rows * 255 // height, (rows + columns) % 256])
+    pixels = np.clip(pixels + rng.normal(0, 12, pixels.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, 'JPEG', quality=92)
+    return buffer.getvalue()
+
+
+def full_decode(path, output):
+    with Image.open(path) as image:
+        image = image.convert('RGB')
+        image.thumbnail(FACE_IMAGE_SIZE, Image.Resampling.LANCZOS)
+        image.save(output, 'JPEG', quality=90)
+
+
+def reduced_decode(path, output):
+    from app.services.image_ingest import save_face_image
+    save_face_image(path, output)
+
+
+METHODS = {'full_decode': full_decode, 'reduced_decode': reduced_decode}
+
+
+def peak_rss_kb():
+    """High-water RSS of this process; ru_maxrss can carry the parent's over fork+exec on Linux"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_method(method, path, repeats):
+    """Child process: time ``repeats`` runs and report peak RSS"""
+    if method == 'reduced_decode':
+        import app.services.image_ingest  # noqa: F401 - exclude import cost from RSS delta
+    baseline = peak_rss_kb()
+    output = os.path.join(os.path.dirname(path), f'{method}.jpg')
+    timings = []
+    for _ in range(repeats):
+        started = time.process_time()
+        METHODS[method](path, output)
+        timings.append((time.process_time() - started) * 1000)
+    peak = peak_rss_kb()
+    print(json.dumps({'cpu_ms_median': round(float(np.median(timings)), 1),
+                      'peak_rss_delta_mb': round((peak - baseline) / 1024, 1)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--width', type=int, default=4032)
+    parser.add_argument('--height', type=int, default=3024)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--method', choices=sorted(METHODS), help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.method:
+        run_method(args.method, args.path, args.repeats)
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'photo.jpg')
+        with open(path, 'wb') as f:
+            f.write(synthetic_photo(args.width, args.height))
+        report = {'image': f'{args.width}x{args.height}', 'jpeg_kb': os.path.getsize(path) // 1024}
+        for method in METHODS:
+            output = subprocess.run([sys.executable, __file__, '--method', method, '--path', path,
+                                     '--repeats', str(args.repeats)],
+                                    capture_output=True, text=True, check=True).stdout
+            report[method] = json.loads(output.strip().splitlines()[-1])
+        report['cpu_speedup'] = round(report['full_decode']['cpu_ms_median'] /
+                                      report['reduced_decode']['cpu_ms_median'], 1)
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Per-stage latency and throughput of the CPU face pipeline.
+
+Runs detection, alignment and embedding over a folder of face photos on
+one core (one OpenCV thread), on all cores through OpenCV's own threads,
+and on all cores with one single-threaded process per core (how
+``flask bulk-enrol`` uses them). Embedding is also measured at several
+batch sizes to show what batching crops into one forward pass buys.
+
+    python benchmarks/bench_pipeline.py --images data/faces --count 200
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config.config import Config
+from app.services.face_pipeline import PIPELINE_STAGES, FacePipeline, YuNetDetector, load_image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def load_images(folder, count):
+    paths = sorted(os.path.join(root, name) for root, _, names in os.walk(folder)
+                   for name in names if name.lower().endswith(IMAGE_EXTENSIONS))
+    images = [image for image in (load_image(path) for path in paths[:count]) if image is not None]
+    if not images:
+        raise SystemExit(f"No readable images in {folder}")
+    # Repeat the sample up to the requested count
+    return [images[i % len(images)] for i in range(count)]
+
+
+def build_pipeline(args, batch_size):
+    detector = YuNetDetector(args.detector, score_threshold=args.threshold)
+    return FacePipeline(detector, args.embedding, batch_size=batch_size)
+
+
+def percentiles(samples):
+    samples = np.asarray(samples)
+    return {'mean': round(float(samples.mean()), 3), 'p50': round(float(np.percentile(samples, 50)), 3),
+            'p99': round(float(np.percentile(samples, 99)), 3)}
+
+
+def measure_stages(pipeline, images, batch):
+    """Per-image stage latencies (ms) and end-to-end images/s with ``batch`` images per call"""
+    pipeline.encode(images[:batch])  # warm up
+    per_image = {stage: [] for stage in PIPELINE_STAGES}
+    faces = 0
+    started = time.perf_counter()
+    for start in range(0, len(images), batch):
+        chunk = images[start:start + batch]
+        detected, _, timings = pipeline.encode(chunk, largest_only=True)
+        faces += sum(len(found) for found in detected)
+        for stage in PIPELINE_STAGES:
+            per_image[stage].append(timings[stage] / len(chunk))
+    elapsed = time.perf_counter() - started
+    result = {stage: percentiles(samples) for stage, samples in per_image.items()}
+    result['images_per_second'] = round(len(images) / elapsed, 1)
+    result['faces_found'] = faces
+    return result
+
+
+def measure_embedding(pipeline, images, batch_sizes, repeats=3):
+    """Embedding throughput (crops/s) for each forward-pass batch size"""
+    crops = [pipeline.align(image, found[0]) for image, found in
+             ((image, pipeline.detect(image)) for image in images) if found]
+    if not crops:
+        return {}
+    results = {}
+    for batch_size in batch_sizes:
+        pipeline.batch_size = batch_size
+        pipeline.embed(crops[:batch_size])
+        best = min(_timed(pipeline.embed, crops) for _ in range(repeats))
+        results[str(batch_size)] = round(len(crops) / best, 1)
+    return results
+
+
+def _timed(function, *args):
+    started = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - started
+
+
+_worker = None
+
+
+def _init_worker(args, batch_size):
+    global _worker
+    cv2.setNumThreads(1)
+    _worker = build_pipeline(args, batch_size)
+
+
+def _encode_chunk(chunk):
+    _worker.encode(chunk, largest_only=True)
+    return len(chunk)
+
+
+def measure_processes(args, images, batch, workers):
+    """End-to-end images/s with one single-threaded pipeline per process"""
+    chunks = [images[start:start + batch] for start in range(0, len(images), batch)]
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(args, batch)) as executor:
+        list(executor.map(_encode_chunk, chunks[:workers]))  # load models and warm up
+        started = time.perf_counter()
+        done = sum(executor.map(_encode_chunk, chunks))
+    return {'images_per_second': round(done / (time.perf_counter() - started), 1), 'workers': workers}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', required=True, help='Folder of face photos')
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--detector', default=Config.FACE_DETECTOR_MODEL)
+    parser.add_argument('--embedding', default=Config.FACE_EMBEDDING_MODEL)
+    parser.add_argument('--threshold', type=float, default=Config.FACE_DETECTION_THRESHOLD)
+    parser.add_argument('--batch', type=int, default=8, help='Images per pipeline call')
+    parser.add_argument('--embed-batches', default='1,8,32', help='Forward-pass batch sizes to compare')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.count)
+    batch_sizes = [int(size) for size in args.embed_batches.split(',')]
+    report = {'cpu_count': os.cpu_count(), 'images': len(images),
+              'image_size': list(images[0].shape[:2]), 'opencv': cv2.__version__}
+
+    cv2.setNumThreads(1)
+    pipeline = build_pipeline(args, batch_sizes[-1])
+    report['single_core'] = measure_stages(pipeline, images, args.batch)
+    report['single_core']['embed_crops_per_second'] = measure_embedding(pipeline, images, batch_sizes)
+
+    cv2.setNumThreads(os.cpu_count())
+    pipeline = build_pipeline(args, batch_sizes[-1])
+    report['all_cores_threads'] = measure_stages(pipeline, images, args.batch)
+    report['all_cores_threads']['embed_crops_per_second'] = measure_embedding(pipeline, images, batch_sizes)
+
+    report['all_cores_processes'] = measure_processes(args, images, args.batch, args.workers)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
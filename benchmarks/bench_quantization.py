@@ -0,0 +1,94 @@
+"""Accuracy and throughput of quantized gallery scans versus float32.
+
+Builds a synthetic gallery of identities, probes it with noisy captures
+of enrolled members and of strangers, and reports for each mode the
+memory each scan reads, probe throughput, and how often the top-1
+identity and the accept/reject decision agree with exact float32 search.
+
+    python benchmarks/bench_quantization.py --size 200000 --probes 256
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.face_gallery import FaceGallery
+from app.services.quantization import QUANTIZATION_MODES
+
+
+def synthetic_gallery(size, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.arange(1, size + 1), rng.standard_normal((size, dim)).astype(np.float32)
+
+
+def synthetic_probes(encodings, count, noise, seed=1):
+    """Half noisy captures of enrolled members, half strangers"""
+    rng = np.random.default_rng(seed)
+    members = rng.choice(len(encodings), count // 2, replace=False)
+    known = encodings[members] + noise * rng.standard_normal((len(members), encodings.shape[1]))
+    strangers = rng.standard_normal((count - len(members), encodings.shape[1]))
+    return np.vstack([known, strangers]).astype(np.float32)
+
+
+def run(size, dim, probe_count, batch, noise, tolerance, rerank_candidates, repeats):
+    user_ids, encodings = synthetic_gallery(size, dim)
+    probes = synthetic_probes(encodings, probe_count, noise)
+
+    results = []
+    reference = None
+    for mode in QUANTIZATION_MODES:
+        gallery = FaceGallery(dim)
+        gallery.quantization, gallery.rerank_candidates = mode, rerank_candidates
+        gallery.build(user_ids, encodings)
+
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            ids, distances = [], []
+            for start in range(0, len(probes), batch):
+                batch_ids, batch_distances = gallery.search(probes[start:start + batch], k=1)
+                ids.append(batch_ids[:, 0])
+                distances.append(batch_distances[:, 0])
+            timings.append(time.perf_counter() - started)
+        ids, distances = np.concatenate(ids), np.concatenate(distances)
+        decisions = np.where(distances <= tolerance, ids, -1)
+
+        if reference is None:
+            reference = (ids, distances, decisions)
+        result = {
+            'mode': mode,
+            'gallery_mb': round(gallery.nbytes / 2 ** 20, 1),
+            'probes_per_second': round(len(probes) / min(timings), 1),
+            'top1_agreement': float(np.mean(ids == reference[0])),
+            'decision_agreement': float(np.mean(decisions == reference[2])),
+            'max_distance_error': float(np.max(np.abs(distances - reference[1]))),
+        }
+        result['speedup'] = round(result['probes_per_second'] / results[0]['probes_per_second'], 2) if results else 1.0
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=128)
+    parser.add_argument('--probes', type=int, default=256)
+    parser.add_argument('--batch', type=int, default=1, help='Probes per search call')
+    parser.add_argument('--noise', type=float, default=0.3)
+    parser.add_argument('--tolerance', type=float, default=0.6)
+    parser.add_argument('--rerank', type=int, default=32)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    results = run(args.size, args.dim, args.probes, args.batch, args.noise, args.tolerance,
+                  args.rerank, args.repeats)
+    print(json.dumps({'size': args.size, 'batch': args.batch, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+"""Load time, memory, latency and throughput of FaceRecognitionService on synthetic galleries.
+
+For each gallery size, enrols that many synthetic members in a scratch
+SQLite database and measures:
+
+- the gallery load from the database (which also publishes the shared
+  snapshot) and from the snapshot, as a freshly started worker would;
+- the memory the loaded gallery holds;
+- 1:1 ``verify`` latency and 1:N ``identify_encodings`` latency for one
+  probe at a time (p50/p99);
+- ``identify_encodings`` throughput with batched probes.
+
+Half of the probes are noisy captures of members, half strangers, so the
+top-1 and false-accept rates double as a sanity check. Results are
+printed as JSON and optionally written to ``--output``. With
+``--baseline`` the run is compared with an earlier results file and
+exits non-zero on a regression beyond ``--max-regression``:
+
+    python benchmarks/bench_recognition.py --output bench.json
+    python benchmarks/bench_recognition.py --sizes 1000,10000 --baseline bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import User
+from app.models.face_encoding import pack_encoding
+from app.services.face_recognition_service import FaceRecognitionService
+from config.config import TestingConfig, config
+
+INSERT_CHUNK = 10000
+
+# Metric -> True when higher is better; compared against --baseline
+TRACKED_METRICS = {
+    'db_load_ms': False,
+    'snapshot_load_ms': False,
+    'verify_p50_ms': False,
+    'verify_p99_ms': False,
+    'identify_p50_ms': False,
+    'identify_p99_ms': False,
+    'batch_probes_per_second': True,
+}
+
+
+def unit_rows(count, dim, rng):
+    rows = rng.standard_normal((count, dim)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def synthetic_probes(encodings, count, noise, rng):
+    """Half captures of enrolled members about ``noise`` away from their encoding, half strangers.
+
+    Returns the probes and the member each should match (-1 for strangers).
+    """
+    members = rng.choice(len(encodings), count // 2, replace=len(encodings) < count // 2)
+    dim = encodings.shape[1]
+    known = encodings[members] + noise / np.sqrt(dim) * rng.standard_normal((len(members), dim))
+    strangers = unit_rows(count - len(members), dim, rng)
+    expected = np.concatenate([members, np.full(len(strangers), -1)])
+    return np.vstack([known, strangers]).astype(np.float32), expected
+
+
+def populate(encodings):
+    """Insert one active member per encoding; returns their user ids in order"""
+    table = User.__table__
+    for start in range(0, len(encodings), INSERT_CHUNK):
+        db.session.execute(table.insert(), [{
+            'state_code': f'BM/{index:09d}',
+            'full_name': f'Member {index}',
+            'email': f'member{index}@bench.invalid',
+            'password_hash': '-',
+            'pin_hash': '-',
+            'is_active': True,
+            'face_encoding': pack_encoding(encodings[index])
+        } for index in range(start, min(start + INSERT_CHUNK, len(encodings)))])
+    db.session.commit()
+    return np.array([user_id for (user_id,) in db.session.query(User.id).order_by(User.id)], dtype=np.int64)
+
+
+def rss_bytes():
+    """Current resident set size, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def percentiles(samples_ns):
+    samples = np.asarray(samples_ns, dtype=np.float64) / 1e6
+    return round(float(np.percentile(samples, 50)), 3), round(float(np.percentile(samples, 99)), 3)
+
+
+def bench_size(size, args):
+    rng = np.random.default_rng(args.seed)
+    encodings = unit_rows(size, args.dim, rng)
+    probes, expected = synthetic_probes(encodings, args.probes, args.noise, rng)
+
+    with tempfile.TemporaryDirectory() as folder:
+        class BenchmarkConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(folder, 'bench.db')
+            UPLOAD_FOLDER = FACES_FOLDER = UNKNOWN_FACES_FOLDER = ENCODINGS_FOLDER = folder
+            FACE_RECOGNITION_TOLERANCE = args.tolerance
+            FACE_INDEX_BACKEND = args.index_backend
+            FACE_QUANTIZATION = args.quantization
+            FACE_PROBE_CACHE_SIZE = 0
+
+        config['benchmark'] = BenchmarkConfig
+        app = create_app('benchmark')
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            user_ids = populate(encodings)
+            populate_seconds = time.perf_counter() - started
+
+            rss_before = rss_bytes()
+            service = FaceRecognitionService(tolerance=args.tolerance)
+            started = time.perf_counter_ns()
+            if not service.load_known_faces(use_snapshot=False):
+                raise SystemExit(f"Could not load the {size} member gallery")
+            db_load_ns = time.perf_counter_ns() - started
+            service.gallery.search(probes[:1], k=1)  # touch the mapped snapshot
+            rss_after = rss_bytes()
+
+            worker = FaceRecognitionService(tolerance=args.tolerance)
+            started = time.perf_counter_ns()
+            worker.load_known_faces()
+            snapshot_load_ns = time.perf_counter_ns() - started
+
+            members = np.flatnonzero(expected >= 0)
+            verify_ns = []
+            for index in members[:args.verify_probes]:
+                started = time.perf_counter_ns()
+                service.verify(int(user_ids[expected[index]]), probes[index])
+                verify_ns.append(time.perf_counter_ns() - started)
+
+            identify_ns, matches = [], []
+            for probe in probes:
+                started = time.perf_counter_ns()
+                matches.append(service.identify_encodings(probe[None, :])[0][0])
+                identify_ns.append(time.perf_counter_ns() - started)
+
+            started = time.perf_counter()
+            for start in range(0, len(probes), args.batch):
+                service.identify_encodings(probes[start:start + args.batch])
+            batch_seconds = time.perf_counter() - started
+
+            db.session.remove()
+            db.engine.dispose()
+
+    matched = np.array([match if match is not None else -1 for match in matches])
+    wanted = np.where(expected >= 0, user_ids[np.maximum(expected, 0)], -1)
+    verify_p50, verify_p99 = percentiles(verify_ns)
+    identify_p50, identify_p99 = percentiles(identify_ns)
+    return {
+        'size': size,
+        'populate_seconds': round(populate_seconds, 2),
+        'db_load_ms': round(db_load_ns / 1e6, 2),
+        'snapshot_load_ms': round(snapshot_load_ns / 1e6, 2),
+        'gallery_mb': round(service.gallery.nbytes / 2 ** 20, 2),
+        'rss_delta_mb': round((rss_after - rss_before) / 2 ** 20, 2) if rss_before is not None else None,
+        'verify_p50_ms': verify_p50,
+        'verify_p99_ms': verify_p99,
+        'identify_p50_ms': identify_p50,
+        'identify_p99_ms': identify_p99,
+        'batch_size': args.batch,
+        'batch_probes_per_second': round(len(probes) / batch_seconds, 1),
+        'top1_accuracy': round(float(np.mean(matched[expected >= 0] == wanted[expected >= 0])), 4),
+        'false_accept_rate': round(float(np.mean(matched[expected < 0] != -1)), 4),
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpu_count': os.cpu_count()}
+
+
+def regressions(results, baseline, max_regression, min_change_ms):
+    """Tracked metrics worse than the baseline's by more than ``max_regression`` (a fraction).
+
+    Timings that moved by less than ``min_change_ms`` are noise, whatever the fraction.
+    """
+    previous = {result['size']: result for result in baseline.get('results', [])}
+    found = []
+    for result in results:
+        before = previous.get(result['size'])
+        if before is None:
+            continue
+        for metric, higher_is_better in TRACKED_METRICS.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None or (metric.endswith('_ms') and abs(new - old) < min_change_ms):
+                continue
+            change = (old - new) / old if higher_is_better else (new - old) / old
+            if change > max_regression:
+                found.append({'size': result['size'], 'metric': metric, 'baseline': old, 'value': new,
+                              'regression': round(change, 3)})
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000', help='Comma-separated gallery sizes')
+    parser.add_argument('--dim', type=int, default=128)
+    parser.add_argument('--probes', type=int, default=1000, help='Probes for identify latency and throughput')
+    parser.add_argument('--verify-probes', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=64, help='Probes per batched identify call')
+    parser.add_argument('--noise', type=float, default=0.35, help='Typical distance of a capture from its member')
+    parser.add_argument('--tolerance', type=float, default=0.6)
+    parser.add_argument('--index-backend', default='flat', choices=['flat', 'ivf', 'hnsw'])
+    parser.add_argument('--quantization', default='none')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    parser.add_argument('--baseline', help='Results file of an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='Allowed slowdown as a fraction of the baseline')
+    parser.add_argument('--min-change-ms', type=float, default=1.0,
+                        help='Timing changes smaller than this are never regressions')
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(size) for size in args.sizes.split(',')):
+        results.append(bench_size(size, args))
+        print(f"{size} members: identify p50 {results[-1]['identify_p50_ms']}ms, "
+              f"p99 {results[-1]['identify_p99_ms']}ms", file=sys.stderr)
+
+    report = {'environment': environment(), 'settings': {key: value for key, value in vars(args).items()
+                                                         if key not in ('output', 'baseline')},
+              'results': results}
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = regressions(results, json.load(f), args.max_regression,
+                                              args.min_change_ms)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,17 +9,131 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///corps_attendance.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
-    # Face Recognition Settings
-    FACE_RECOGNITION_TOLERANCE = float(os.environ.get('FACE_RECOGNITION_TOLERANCE', 0.6))
-    MAX_FACE_DISTANCE = float(os.environ.get('MAX_FACE_DISTANCE', 0.4))
+    # Face Recognition Settings: euclidean distances between unit-length SFace
+    # embeddings (cosine similarity s is sqrt(2 - 2s)); 1.13 is SFace's published
+    # cosine threshold of 0.363. Recalibrate when changing the embedding model
+    FACE_RECOGNITION_TOLERANCE = float(os.environ.get('FACE_RECOGNITION_TOLERANCE', 1.13))
+    MAX_FACE_DISTANCE = float(os.environ.get('MAX_FACE_DISTANCE', 0.89))
+    
+    # CPU face pipeline: YuNet detector and an ONNX embedding model (e.g. SFace)
+    # run by cv2.dnn. Without the model files nothing can be encoded or matched
+    FACE_DETECTOR_MODEL = os.environ.get('FACE_DETECTOR_MODEL') or \
+        os.path.join(os.getcwd(), 'data', 'models', 'face_detection_yunet_2023mar.onnx')
+    FACE_EMBEDDING_MODEL = os.environ.get('FACE_EMBEDDING_MODEL') or \
+        os.path.join(os.getcwd(), 'data', 'models', 'face_recognition_sface_2021dec.onnx')
+    FACE_DETECTION_THRESHOLD = float(os.environ.get('FACE_DETECTION_THRESHOLD', 0.9))
+    FACE_EMBEDDING_BATCH = int(os.environ.get('FACE_EMBEDDING_BATCH', 32))  # crops per forward pass
+    FACE_PIPELINE_THREADS = int(os.environ.get('FACE_PIPELINE_THREADS', 0))  # 0 = OpenCV default
+    # Tag stored with each encoding (defaults to the embedding model's file name);
+    # `flask reembed-faces --model-version V` moves the gallery to V.onnx beside it
+    FACE_MODEL_VERSION = os.environ.get('FACE_MODEL_VERSION')
+    # The swap is refused when more than this fraction of the gallery would be
+    # left without a face under the new model (`--force` overrides)
+    FACE_REEMBED_MAX_DROP_RATE = float(os.environ.get('FACE_REEMBED_MAX_DROP_RATE', 0.05))
+    
+    # Approximate nearest-neighbour index for large galleries ('flat', 'ivf' or 'hnsw')
+    FACE_INDEX_BACKEND = os.environ.get('FACE_INDEX_BACKEND', 'flat')
+    FACE_INDEX_MIN_SIZE = int(os.environ.get('FACE_INDEX_MIN_SIZE', 50000))  # brute force below this
+    FACE_IVF_NLIST = int(os.environ.get('FACE_IVF_NLIST', 1024))
+    FACE_IVF_NPROBE = int(os.environ.get('FACE_IVF_NPROBE', 16))
+    FACE_HNSW_M = int(os.environ.get('FACE_HNSW_M', 16))
+    FACE_HNSW_EF_CONSTRUCTION = int(os.environ.get('FACE_HNSW_EF_CONSTRUCTION', 200))
+    FACE_HNSW_EF_SEARCH = int(os.environ.get('FACE_HNSW_EF_SEARCH', 64))
+    
+    # Compact first-pass scan ('none', 'float16' or 'int8'); the best
+    # FACE_RERANK_CANDIDATES per probe are re-scored exactly in float32
+    FACE_QUANTIZATION = os.environ.get('FACE_QUANTIZATION', 'none')
+    FACE_RERANK_CANDIDATES = int(os.environ.get('FACE_RERANK_CANDIDATES', 32))
+    
+    # Several enrolment images per user: the gallery scans one centroid per
+    # user and re-checks the best FACE_TEMPLATE_CANDIDATES against their
+    # individual templates when the centroid is within FACE_TEMPLATE_MARGIN
+    # of the tolerance
+    FACE_MAX_TEMPLATES = int(os.environ.get('FACE_MAX_TEMPLATES', 5))
+    FACE_TEMPLATE_CANDIDATES = int(os.environ.get('FACE_TEMPLATE_CANDIDATES', 3))
+    FACE_TEMPLATE_MARGIN = float(os.environ.get('FACE_TEMPLATE_MARGIN', 0.1))
+    
+    # Enrolment queue: uploads are stored and encoded by FACE_ENROLMENT_WORKERS
+    # threads per web process (0 leaves them to `flask enrolment-worker`)
+    FACE_ENROLMENT_WORKERS = int(os.environ.get('FACE_ENROLMENT_WORKERS', 2))
+    FACE_ENROLMENT_JOB_TIMEOUT = int(os.environ.get('FACE_ENROLMENT_JOB_TIMEOUT', 300))  # seconds
+    FACE_ENROLMENT_MAX_ATTEMPTS = int(os.environ.get('FACE_ENROLMENT_MAX_ATTEMPTS', 3))
+    # How often worker threads requeue stalled jobs and drain the queue
+    FACE_ENROLMENT_SWEEP_INTERVAL = float(os.environ.get('FACE_ENROLMENT_SWEEP_INTERVAL', 60))  # seconds
+    
+    # Live gallery updates: how often workers poll the change log, and the
+    # backlog size past which a full reload is cheaper than replaying it
+    FACE_GALLERY_REFRESH_SECONDS = float(os.environ.get('FACE_GALLERY_REFRESH_SECONDS', 1.0))
+    FACE_GALLERY_MAX_DELTA = int(os.environ.get('FACE_GALLERY_MAX_DELTA', 10000))
+    # Change ids below a worker's version re-read on refresh, for transactions
+    # that commit out of id order
+    FACE_GALLERY_CHANGE_WINDOW = int(os.environ.get('FACE_GALLERY_CHANGE_WINDOW', 1000))
+    # Private changes a worker holds before republishing the shared snapshot
+    FACE_SNAPSHOT_MAX_DELTA = int(os.environ.get('FACE_SNAPSHOT_MAX_DELTA', 5000))
     
     # File Upload Settings
     UPLOAD_FOLDER = os.path.join(os.getcwd(), 'data', 'uploads')
     FACES_FOLDER = os.path.join(os.getcwd(), 'data', 'faces')
     ENCODINGS_FOLDER = os.path.join(os.getcwd(), 'data', 'encodings')
     UNKNOWN_FACES_FOLDER = os.path.join(os.getcwd(), 'data', 'unknown_faces')
+    # Faces nobody matched are kept for review (0 disables) for a limited time, and
+    # `flask cluster-unknown-faces` groups those within UNKNOWN_FACES_CLUSTER_DISTANCE.
+    # A group within UNKNOWN_FACES_SUGGEST_DISTANCE of a member is suggested as
+    # extra templates for them, any other group as a new enrolment
+    UNKNOWN_FACES_MAX_COUNT = int(os.environ.get('UNKNOWN_FACES_MAX_COUNT', 10000))
+    UNKNOWN_FACES_MAX_AGE_DAYS = float(os.environ.get('UNKNOWN_FACES_MAX_AGE_DAYS', 14))
+    UNKNOWN_FACES_CLUSTER_DISTANCE = float(os.environ.get('UNKNOWN_FACES_CLUSTER_DISTANCE', 1.13))
+    UNKNOWN_FACES_MIN_CLUSTER = int(os.environ.get('UNKNOWN_FACES_MIN_CLUSTER', 3))
+    UNKNOWN_FACES_SUGGEST_DISTANCE = float(os.environ.get('UNKNOWN_FACES_SUGGEST_DISTANCE', 1.22))
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+    # Images are refused from their header above this many pixels (decompression bombs)
+    FACE_MAX_IMAGE_PIXELS = int(os.environ.get('FACE_MAX_IMAGE_PIXELS', 40 * 1000 * 1000))
+    # Unreferenced face images and stray files younger than this survive garbage collection
+    FACE_IMAGE_GC_GRACE_HOURS = float(os.environ.get('FACE_IMAGE_GC_GRACE_HOURS', 24))
+    # Probe embeddings and match results kept by image digest for retried captures
+    FACE_PROBE_CACHE_SIZE = int(os.environ.get('FACE_PROBE_CACHE_SIZE', 256))
+    FACE_PROBE_CACHE_TTL = float(os.environ.get('FACE_PROBE_CACHE_TTL', 300))
+    # `flask find-duplicates`: members closer than this distance are reported;
+    # the gallery is compared in FACE_DUPLICATE_BLOCK-row tiles (4 bytes per score)
+    FACE_DUPLICATE_DISTANCE = float(os.environ.get('FACE_DUPLICATE_DISTANCE', 0.89))
+    FACE_DUPLICATE_BLOCK = int(os.environ.get('FACE_DUPLICATE_BLOCK', 2048))
+    # Load the face models and gallery when the app is created rather than on the
+    # first request; with `gunicorn --preload` workers then share them copy-on-write
+    FACE_WARM_ON_START = os.environ.get('FACE_WARM_ON_START', 'false').lower() in ['true', 'on', '1']
+    # A failed warm-up is retried in the background after this many seconds (0
+    # retries on the next use instead)
+    FACE_WARM_RETRY_SECONDS = float(os.environ.get('FACE_WARM_RETRY_SECONDS', 30))
+    # /api/metrics serves per-stage timing histograms to admins and to scrapers
+    # sending `Authorization: Bearer <token>` (unset: admins only). Requests to /mark_face_attendance sending
+    # the debug header get their own stage timings in the response
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    TIMING_DEBUG_HEADER = os.environ.get('TIMING_DEBUG_HEADER', 'X-Debug-Timings')
+    # Most images accepted by one /api/face_recognition/identify_batch request
+    FACE_BATCH_MAX_IMAGES = int(os.environ.get('FACE_BATCH_MAX_IMAGES', 32))
+    
+    # Camera ingest (`flask camera-ingest`): frames kept per second and camera,
+    # ring size per camera, and the age past which a frame is not worth recognizing
+    CAMERA_CAPTURE_FPS = float(os.environ.get('CAMERA_CAPTURE_FPS', 5))
+    CAMERA_BUFFER_FRAMES = int(os.environ.get('CAMERA_BUFFER_FRAMES', 4))
+    CAMERA_MAX_FRAME_AGE = float(os.environ.get('CAMERA_MAX_FRAME_AGE', 1.0))
+    CAMERA_WORKERS = int(os.environ.get('CAMERA_WORKERS', 2))
+    CAMERA_SCHEDULE_POLL_SECONDS = float(os.environ.get('CAMERA_SCHEDULE_POLL_SECONDS', 30))
+    CAMERA_RECONNECT_SECONDS = float(os.environ.get('CAMERA_RECONNECT_SECONDS', 5))
+    # Frames are only recognized if they moved and are bright and sharp enough
+    # (checked on a CAMERA_GATE_WIDTH-pixel greyscale copy)
+    CAMERA_GATE_ENABLED = os.environ.get('CAMERA_GATE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    CAMERA_GATE_WIDTH = int(os.environ.get('CAMERA_GATE_WIDTH', 160))
+    CAMERA_MOTION_FRACTION = float(os.environ.get('CAMERA_MOTION_FRACTION', 0.01))
+    CAMERA_MIN_SHARPNESS = float(os.environ.get('CAMERA_MIN_SHARPNESS', 60))
+    CAMERA_MIN_BRIGHTNESS = float(os.environ.get('CAMERA_MIN_BRIGHTNESS', 40))
+    CAMERA_MAX_BRIGHTNESS = float(os.environ.get('CAMERA_MAX_BRIGHTNESS', 220))
+    # Faces are tracked across frames; a track is identified once, retried while
+    # unknown and re-verified at a low rate
+    CAMERA_TRACK_IOU = float(os.environ.get('CAMERA_TRACK_IOU', 0.3))
+    CAMERA_TRACK_MAX_AGE = float(os.environ.get('CAMERA_TRACK_MAX_AGE', 1.5))
+    CAMERA_TRACK_RETRY_SECONDS = float(os.environ.get('CAMERA_TRACK_RETRY_SECONDS', 1.0))
+    CAMERA_TRACK_REVERIFY_SECONDS = float(os.environ.get('CAMERA_TRACK_REVERIFY_SECONDS', 10))
     
     # Security
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-string-change-in-production'
@@ -67,6 +181,9 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    FACE_ENROLMENT_WORKERS = 0  # tests run queued jobs explicitly
+    UNKNOWN_FACES_MAX_COUNT = 0  # enabled by the tests that use it
+    FACE_WARM_RETRY_SECONDS = 0  # no background retry threads
 
 class ProductionConfig(Config):
     DEBUG = False
@@ -0,0 +1,39 @@
+"""add gallery_changes log
+
+Revision ID: 3f1c2a9b7d10
+Revises: 
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9b7d10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases bootstrapped with db.create_all() may already have the table
+    if 'gallery_changes' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    op.create_table('gallery_changes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('operation', sa.String(length=10), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('gallery_changes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_gallery_changes_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('gallery_changes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_gallery_changes_user_id'))
+
+    op.drop_table('gallery_changes')
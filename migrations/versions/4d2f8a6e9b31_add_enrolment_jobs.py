@@ -0,0 +1,51 @@
+"""add enrolment_jobs queue
+
+Revision ID: 4d2f8a6e9b31
+Revises: e7a93b5c1d24
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d2f8a6e9b31'
+down_revision = 'e7a93b5c1d24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases bootstrapped with db.create_all() may already have the table
+    if 'enrolment_jobs' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    op.create_table('enrolment_jobs',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('upload_path', sa.String(length=255), nullable=False),
+    sa.Column('original_filename', sa.String(length=255), nullable=True),
+    sa.Column('message', sa.String(length=255), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('worker', sa.String(length=100), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('enrolment_jobs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_enrolment_jobs_created_at'), ['created_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_enrolment_jobs_status'), ['status'], unique=False)
+        batch_op.create_index(batch_op.f('ix_enrolment_jobs_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('enrolment_jobs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_enrolment_jobs_user_id'))
+        batch_op.drop_index(batch_op.f('ix_enrolment_jobs_status'))
+        batch_op.drop_index(batch_op.f('ix_enrolment_jobs_created_at'))
+
+    op.drop_table('enrolment_jobs')
@@ -0,0 +1,52 @@
+"""add content-addressed face_images
+
+Revision ID: 9a7c3e1f5b42
+Revises: 4d2f8a6e9b31
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a7c3e1f5b42'
+down_revision = '4d2f8a6e9b31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # Databases bootstrapped with db.create_all() may already have the table
+    if 'face_images' not in inspector.get_table_names():
+        op.create_table('face_images',
+        sa.Column('digest', sa.String(length=64), nullable=False),
+        sa.Column('source_digest', sa.String(length=64), nullable=True),
+        sa.Column('byte_size', sa.Integer(), nullable=False),
+        sa.Column('encoding', sa.LargeBinary(), nullable=True),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('digest')
+        )
+        with op.batch_alter_table('face_images', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_face_images_created_at'), ['created_at'], unique=False)
+            batch_op.create_index(batch_op.f('ix_face_images_source_digest'), ['source_digest'], unique=False)
+
+    # Existing templates keep their per-user files; they have no digest
+    if 'image_digest' not in [column['name'] for column in inspector.get_columns('face_templates')]:
+        with op.batch_alter_table('face_templates', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('image_digest', sa.String(length=64), nullable=True))
+            batch_op.create_index(batch_op.f('ix_face_templates_image_digest'), ['image_digest'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('face_templates', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_face_templates_image_digest'))
+        batch_op.drop_column('image_digest')
+
+    with op.batch_alter_table('face_images', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_face_images_source_digest'))
+        batch_op.drop_index(batch_op.f('ix_face_images_created_at'))
+
+    op.drop_table('face_images')
@@ -0,0 +1,50 @@
+"""add embedding model versions and staged re-embeddings
+
+Revision ID: b6d1f3a8c2e5
+Revises: 9a7c3e1f5b42
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d1f3a8c2e5'
+down_revision = '9a7c3e1f5b42'
+branch_labels = None
+depends_on = None
+
+# Existing encodings keep a NULL version: whatever model was configured
+NEW_COLUMNS = {
+    'users': [sa.Column('face_encoding_version', sa.String(length=64), nullable=True),
+              sa.Column('next_face_encoding', sa.LargeBinary(), nullable=True),
+              sa.Column('next_encoding_version', sa.String(length=64), nullable=True)],
+    'face_templates': [sa.Column('model_version', sa.String(length=64), nullable=True),
+                       sa.Column('next_encoding', sa.LargeBinary(), nullable=True),
+                       sa.Column('next_version', sa.String(length=64), nullable=True)],
+    'face_images': [sa.Column('model_version', sa.String(length=64), nullable=True)],
+    'gallery_changes': [sa.Column('model_version', sa.String(length=64), nullable=True)],
+}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+    for table, columns in NEW_COLUMNS.items():
+        if table not in tables:
+            continue
+        # Databases bootstrapped with db.create_all() may already have them
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        missing = [column for column in columns if column.name not in existing]
+        if missing:
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                for column in missing:
+                    batch_op.add_column(column)
+
+
+def downgrade():
+    for table, columns in NEW_COLUMNS.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in reversed(columns):
+                batch_op.drop_column(column.name)
@@ -0,0 +1,133 @@
+"""store face encodings as versioned float32 binary
+
+Revision ID: c52d8e4f9a13
+Revises: 8b4e61d2c0a7
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import json
+import pickle
+import struct
+import numpy as np
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52d8e4f9a13'
+down_revision = '8b4e61d2c0a7'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+# Mirrors app/models/face_encoding.py (format 1, float32) so the migration
+# does not depend on application code that may change later
+ENCODING_HEADER = struct.Struct('<2sBBHH')
+
+
+def _pack(vector):
+    vector = np.ascontiguousarray(np.ravel(vector), dtype='<f4')
+    return ENCODING_HEADER.pack(b'FE', 1, 1, vector.shape[0], 0) + vector.tobytes()
+
+
+def _unpack(blob):
+    _, _, _, dim, _ = ENCODING_HEADER.unpack_from(blob)
+    return np.frombuffer(blob, dtype='<f4', count=dim, offset=ENCODING_HEADER.size)
+
+
+def _is_packed(value):
+    """True for a blob already written in the binary format (header and float32 vector)"""
+    if not isinstance(value, bytes) or len(value) < ENCODING_HEADER.size:
+        return False
+    magic, fmt, dtype, dim, _ = ENCODING_HEADER.unpack_from(value)
+    return (magic, fmt, dtype) == (b'FE', 1, 1) and len(value) == ENCODING_HEADER.size + 4 * dim
+
+
+def _from_legacy(value):
+    """Legacy rows hold either JSON text (set_face_encoding) or a pickled ndarray"""
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    if isinstance(value, bytes):
+        try:
+            return np.asarray(pickle.loads(value), dtype=np.float32)
+        except Exception:
+            value = value.decode('utf-8')
+    return np.asarray(json.loads(value), dtype=np.float32)
+
+
+def _convert(column_from, column_to, transform):
+    """Copy users.<column_from> into users.<column_to> in id-ordered batches"""
+    bind = op.get_bind()
+    # Untyped columns hand back whatever the driver stored (str or bytes)
+    users = sa.table('users', sa.column('id', sa.Integer), sa.column(column_from), sa.column(column_to))
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(users.c.id, users.c[column_from])
+            .where(users.c.id > last_id, users.c[column_from].isnot(None))
+            .order_by(users.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for user_id, value in rows:
+            try:
+                updates.append({'user_id': user_id, 'value': transform(value)})
+            except Exception:
+                # Unreadable encodings are dropped; the member simply re-enrols
+                pass
+        if updates:
+            bind.execute(
+                users.update().where(users.c.id == sa.bindparam('user_id'))
+                .values({column_to: sa.bindparam('value')}),
+                updates
+            )
+        last_id = rows[-1][0]
+
+
+def _to_binary(value):
+    """Pack a legacy encoding; rows already in the binary format are kept as they are"""
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    if _is_packed(value):
+        return value
+    return _pack(_from_legacy(value))
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'users' not in inspector.get_table_names():
+        return
+    # Databases bootstrapped with db.create_all() already store binary encodings
+    columns = {column['name']: column['type'] for column in inspector.get_columns('users')}
+    if isinstance(columns.get('face_encoding'), sa.LargeBinary):
+        return
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('face_encoding_bin', sa.LargeBinary(), nullable=True))
+
+    _convert('face_encoding', 'face_encoding_bin', _to_binary)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('face_encoding')
+        batch_op.alter_column('face_encoding_bin', new_column_name='face_encoding',
+                              existing_type=sa.LargeBinary(), existing_nullable=True)
+
+
+def downgrade():
+    if 'users' not in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('face_encoding_text', sa.Text(), nullable=True))
+
+    _convert('face_encoding', 'face_encoding_text',
+             lambda value: json.dumps(_unpack(bytes(value)).tolist()))
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('face_encoding')
+        batch_op.alter_column('face_encoding_text', new_column_name='face_encoding',
+                              existing_type=sa.Text(), existing_nullable=True)
@@ -0,0 +1,53 @@
+"""add face_templates for multiple enrolment images per user
+
+Revision ID: e7a93b5c1d24
+Revises: c52d8e4f9a13
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a93b5c1d24'
+down_revision = 'c52d8e4f9a13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tables = sa.inspect(op.get_bind()).get_table_names()
+    # Databases bootstrapped with db.create_all() may already have the table
+    if 'face_templates' not in tables:
+        op.create_table('face_templates',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('encoding', sa.LargeBinary(), nullable=False),
+        sa.Column('image_path', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        with op.batch_alter_table('face_templates', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_face_templates_user_id'), ['user_id'], unique=False)
+
+    if 'users' not in tables:
+        return
+
+    # Each existing encoding becomes its user's first template; with a single
+    # template the stored centroid is unchanged
+    op.execute(
+        "INSERT INTO face_templates (user_id, encoding, image_path, created_at) "
+        "SELECT id, face_encoding, face_image_path, updated_at FROM users "
+        "WHERE face_encoding IS NOT NULL "
+        "AND id NOT IN (SELECT user_id FROM face_templates)"
+    )
+
+
+def downgrade():
+    # users.face_encoding keeps the centroid, so matching still works
+    with op.batch_alter_table('face_templates', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_face_templates_user_id'))
+
+    op.drop_table('face_templates')
@@ -1,4 +1,6 @@
 import os
+import json
+import click
 from app import create_app, db
 from app.models import User, Attendance, Location, CDSchedule, Announcement
 from flask_migrate import upgrade
@@ -29,6 +31,217 @@ def deploy():
     # Create default admin user if not exists
     create_default_admin()
 
+@app.cli.command()
+@click.argument('source', type=click.Path(exists=True))
+@click.option('--workers', default=None, type=int, help='Encoding processes (defaults to the CPU count).')
+@click.option('--batch-size', default=500, help='Images written per database transaction.')
+@click.option('--report', default=None, type=click.Path(), help='Write failed images to this CSV file.')
+def bulk_enrol(source, workers, batch_size, report):
+    """Enrol faces from a directory or a state_code,image_path CSV.
+    
+    Safe to rerun after an interruption; images already enrolled are skipped.
+    """
+    import csv
+    import time
+    from app.services.bulk_enrolment import enrol_images, read_manifest
+    
+    items = read_manifest(source)
+    print(f"Found {len(items)} images in {source}.")
+    started = time.perf_counter()
+    
+    def progress(done, total, failed):
+        if done % 100 and done != total:
+            return
+        rate = done / max(time.perf_counter() - started, 1e-9)
+        remaining = (total - done) / rate if rate else 0
+        print(f"{done}/{total} images processed, {failed} failed, {rate:.1f}/s, ~{remaining:.0f}s left")
+    
+    result = enrol_images(items, workers=workers, batch_size=batch_size, progress=progress)
+    print(f"Enrolled {result['enrolled']} images, skipped {result['skipped']} already enrolled, "
+          f"{result['failed']} failed in {result['seconds']}s.")
+    if report and result['failures']:
+        with open(report, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['state_code', 'image_path', 'reason'])
+            writer.writerows(result['failures'])
+        print(f"Failures written to {report}.")
+
+@app.cli.command()
+@click.option('--poll-interval', default=1.0, help='Seconds to wait when the queue is empty.')
+@click.option('--once', is_flag=True, help='Exit when the queue is empty.')
+def enrolment_worker(poll_interval, once):
+    """Encode queued face uploads (use with FACE_ENROLMENT_WORKERS=0)."""
+    from app.services.enrolment_queue import run_worker
+    
+    processed = run_worker(poll_interval=poll_interval, once=once)
+    print(f"Processed {processed} enrolment jobs.")
+
+@app.cli.command()
+@click.option('--grace-hours', default=None, type=float, help='Defaults to FACE_IMAGE_GC_GRACE_HOURS.')
+@click.option('--recount', is_flag=True, help='Rebuild reference counts from the face templates first.')
+def gc_face_images(grace_hours, recount):
+    """Delete stored face images no template uses any more."""
+    from app.services.face_image_store import collect_garbage
+    
+    if grace_hours is None:
+        grace_hours = app.config['FACE_IMAGE_GC_GRACE_HOURS']
+    stats = collect_garbage(grace_seconds=grace_hours * 3600, recount=recount)
+    if recount:
+        print(f"Corrected {stats['corrected']} reference counts.")
+    print(f"Removed {stats['images']} unreferenced images and {stats['files']} files "
+          f"({stats['bytes'] / 1e6:.1f} MB).")
+
+@app.cli.command()
+@click.option('--workers', default=None, type=int, help='Recognition threads (defaults to CAMERA_WORKERS).')
+@click.option('--source', 'sources', multiple=True, metavar='CAMERA_ID=PATH',
+              help='Read a camera id from a video file or URL instead (repeatable).')
+def camera_ingest(workers, sources):
+    """Recognize faces from the cameras of locations scheduled now."""
+    from app.services.camera_ingest import CameraIngest, FrameRecognizer, OpenCVSource
+    
+    overrides = dict(source.split('=', 1) for source in sources)
+    ingest = CameraIngest(app, FrameRecognizer(), workers=workers,
+                          open_source=lambda camera_id: OpenCVSource(overrides.get(camera_id, camera_id)))
+    try:
+        ingest.run()
+    except KeyboardInterrupt:
+        pass
+    for location_id, counters in sorted(ingest.stats().items()):
+        print(f"Location {location_id}: " + ', '.join(f'{name} {count}' for name, count in sorted(counters.items())))
+
+@app.cli.command()
+@click.option('--max-distance', default=None, type=float, help='Defaults to FACE_DUPLICATE_DISTANCE.')
+@click.option('--block-size', default=None, type=int, help='Rows per tile (defaults to FACE_DUPLICATE_BLOCK).')
+@click.option('--workers', default=None, type=int, help='Tile threads (defaults to the CPU count).')
+@click.option('--report', default='duplicates.csv', type=click.Path(), help='CSV file for suspected duplicates.')
+def find_duplicates(max_distance, block_size, workers, report):
+    """Report members whose enrolled faces are suspiciously alike."""
+    from app.services.duplicate_detection import scan_gallery, write_report
+    from app.services.registry import create_face_service
+    
+    face_service = create_face_service(app.config)
+    face_service.load_known_faces()
+    if max_distance is None:
+        max_distance = app.config['FACE_DUPLICATE_DISTANCE']
+    
+    def progress(done, total):
+        if done % 1000 == 0 or done == total:
+            print(f"{done}/{total} tiles scanned")
+    
+    pairs = scan_gallery(face_service.gallery, max_distance, workers=workers, progress=progress,
+                         block_size=block_size or app.config['FACE_DUPLICATE_BLOCK'])
+    write_report(pairs, report)
+    print(f"Found {len(pairs)} suspected duplicate pairs among {len(face_service.gallery)} members; "
+          f"written to {report}.")
+
+@app.cli.command()
+@click.option('--model-version', required=True, help='Embedding model to move to (<version>.onnx beside '
+              'FACE_EMBEDDING_MODEL).')
+@click.option('--workers', default=None, type=int, help='Encoding processes (defaults to the CPU count).')
+@click.option('--batch-size', default=200, help='Users staged per database transaction.')
+@click.option('--no-swap', is_flag=True, help='Only stage the new encodings; swap on a later run.')
+@click.option('--force', is_flag=True, help='Swap even if users are pending or too many have no face; '
+              'they are dropped from the gallery.')
+def reembed_faces(model_version, workers, batch_size, no_swap, force):
+    """Re-encode the gallery with another model, then swap it in atomically.
+    
+    The old gallery keeps serving meanwhile. Safe to rerun after an
+    interruption; users already staged are skipped.
+    """
+    import time
+    from app.services.reembedding import reembed_gallery
+    
+    started = time.perf_counter()
+    
+    def progress(done, total):
+        rate = done / max(time.perf_counter() - started, 1e-9)
+        print(f"{done}/{total} users re-embedded, {rate:.1f}/s, ~{(total - done) / rate:.0f}s left")
+    
+    result = reembed_gallery(model_version, workers=workers, batch_size=batch_size, swap=not no_swap,
+                             force=force, progress=progress)
+    print(f"Re-embedded {result['reembedded']} users, {result['no_face']} without a face, "
+          f"{result['failed']} whose images could not be read, in {result['seconds']}s.")
+    if result['swapped']:
+        print(f"The gallery now serves model {model_version}.")
+    elif not no_swap:
+        print("Nothing was swapped: users are still pending, too many have no face under the new model "
+              "(see FACE_REEMBED_MAX_DROP_RATE), or the gallery is already on this model.")
+
+@app.cli.command()
+def cluster_unknown_faces():
+    """Group stored unknown faces and suggest enrolments for recurring ones."""
+    from app.services.registry import create_face_service
+    from app.services.unknown_faces import enrolment_suggestions, load_clusters
+    
+    clusters = load_clusters(app.config)
+    if clusters is None:
+        print("UNKNOWN_FACES_MAX_COUNT is 0; unknown faces are not kept.")
+        return
+    pruned = clusters.store.prune()
+    assigned = clusters.update()
+    print(f"Pruned {pruned} old unknown faces, clustered {assigned} new ones; "
+          f"{len(clusters.assignments)} faces in {len(clusters.labels)} clusters.")
+    
+    face_service = create_face_service(app.config)
+    face_service.load_known_faces()
+    suggestions = enrolment_suggestions(clusters.clusters(min_size=app.config['UNKNOWN_FACES_MIN_CLUSTER']),
+                                        face_service, app.config['UNKNOWN_FACES_SUGGEST_DISTANCE'])
+    for suggestion in suggestions:
+        target = f"add templates to user {suggestion['nearest_user_id']}" \
+            if suggestion['action'] == 'add_templates' else 'enrol a new member'
+        print(f"Cluster {suggestion['label']}: {suggestion['faces']} faces at locations "
+              f"{suggestion['location_ids'] or '-'}; {target}")
+
+@app.cli.command()
+def build_face_index():
+    """Build and persist the approximate face index."""
+    from app.services.ann_index import create_index, save_index
+    from app.services.registry import create_face_service
+    
+    face_service = create_face_service(app.config)
+    face_service.load_known_faces()
+    index = create_index(app.config)
+    if index is None:
+        print("FACE_INDEX_BACKEND is 'flat'; nothing to build.")
+        return
+    
+    gallery = face_service.gallery
+    index.build(gallery.user_ids, gallery.encodings)
+    save_index(index, app.config['ENCODINGS_FOLDER'])
+    print(f"Built {index.backend} index over {len(gallery)} encodings.")
+
+@app.cli.command()
+@click.option('--probes', default=1000, help='Number of probe encodings to sample.')
+@click.option('--k', default=10, help='Neighbours to compare per probe.')
+@click.option('--noise', default=0.02, help='Gaussian noise added to sampled probes.')
+@click.option('--tolerance', default=None, type=float, help='Defaults to FACE_RECOGNITION_TOLERANCE.')
+def face_index_recall(probes, k, noise, tolerance):
+    """Measure approximate index recall against brute force."""
+    import numpy as np
+    from app.services.ann_index import create_index, measure_recall
+    from app.services.face_gallery import FaceGallery
+    from app.services.registry import create_face_service
+    
+    face_service = create_face_service(app.config)
+    face_service.load_known_faces()
+    gallery = FaceGallery().build(face_service.gallery.user_ids, face_service.gallery.encodings)
+    if len(gallery) == 0:
+        print("No enrolled faces to measure against.")
+        return
+    
+    index = create_index(app.config)
+    if index is None:
+        print("FACE_INDEX_BACKEND is 'flat'; brute force has recall 1.0.")
+        return
+    index.build(gallery.user_ids, gallery.encodings)
+    
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(gallery), min(probes, len(gallery)), replace=False)
+    sample = gallery.encodings[rows] + noise * rng.standard_normal((len(rows), gallery.dim))
+    if tolerance is None:
+        tolerance = app.config['FACE_RECOGNITION_TOLERANCE']
+    print(json.dumps(measure_recall(index, gallery, sample, k=k, tolerance=tolerance), indent=2))
+
 def create_default_admin():
     """Create default admin user"""
     admin = User.query.filter_by(email='admin@corps.gov.ng').first()
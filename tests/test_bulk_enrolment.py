@@ -0,0 +1,137 @@
+import unittest
+import os
+import sys
+import tempfile
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import User, FaceImage, FaceTemplate, GalleryChange
+from app.services.bulk_enrolment import enrol_images, read_manifest
+from app.services.face_recognition_service import FaceRecognitionService
+from app.services.gallery_snapshot import read_snapshot_header, snapshot_path
+
+
+class BulkEnrolmentTestCase(unittest.TestCase):
+    """Test cases for bulk face enrolment"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.folder = tempfile.TemporaryDirectory()
+        self.app.config['ENCODINGS_FOLDER'] = os.path.join(self.folder.name, 'encodings')
+        self.app.config['FACES_FOLDER'] = os.path.join(self.folder.name, 'faces')
+        self.source = os.path.join(self.folder.name, 'batch')
+        os.makedirs(self.source)
+        db.create_all()
+        # Stands in for the face models, which tests run without; forked
+        # encoding workers inherit the patch
+        extract = mock.patch.object(FaceRecognitionService, 'extract_face_encoding',
+                                    side_effect=lambda path: np.random.default_rng(0).standard_normal(128))
+        pipeline = mock.patch('app.services.bulk_enrolment.get_pipeline', return_value=mock.Mock())
+        for patch in (extract, pipeline):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.folder.cleanup()
+
+    def _create_user(self, state_code):
+        user = User(state_code=state_code, full_name=state_code, email=f'{state_code.replace("/", "")}@example.com')
+        user.set_password('testpass')
+        user.set_pin('1234')
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def _write_image(self, path, shade=None):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shade = len(path) if shade is None else shade
+        Image.new('RGB', (800, 600), (120, 90, shade)).save(path)
+
+    def test_directory_and_csv_manifests(self):
+        """Test both manifest layouts"""
+        self._write_image(os.path.join(self.source, 'LA_23A_0001.jpg'))
+        self._write_image(os.path.join(self.source, 'LA_23A_0002', 'front.png'))
+        self._write_image(os.path.join(self.source, 'LA_23A_0002', 'side.jpg'))
+        with open(os.path.join(self.source, 'notes.txt'), 'w') as f:
+            f.write('ignored')
+        self.assertEqual([item.state_code for item in read_manifest(self.source)],
+                         ['LA/23A/0001', 'LA/23A/0002', 'LA/23A/0002'])
+
+        manifest = os.path.join(self.folder.name, 'batch.csv')
+        with open(manifest, 'w') as f:
+            f.write('state_code,image_path\nLA/23A/0001,batch/LA_23A_0001.jpg\n')
+        items = read_manifest(manifest)
+        self.assertEqual(items[0].state_code, 'LA/23A/0001')
+        self.assertTrue(os.path.exists(items[0].source_path))
+
+    def test_enrol_is_resumable_and_publishes_snapshot(self):
+        """Test enrolment, failure reporting and a rerun that skips finished images"""
+        first, second = self._create_user('LA/23A/0001'), self._create_user('LA/23A/0002')
+        self._write_image(os.path.join(self.source, 'LA_23A_0001.jpg'))
+        self._write_image(os.path.join(self.source, 'LA_23A_0002', 'front.jpg'))
+        self._write_image(os.path.join(self.source, 'LA_23A_0002', 'side.jpg'))
+        self._write_image(os.path.join(self.source, 'LA_23A_9999.jpg'))
+        with open(os.path.join(self.source, 'LA_23A_0003.jpg'), 'w') as f:
+            f.write('not an image')
+        self._create_user('LA/23A/0003')
+
+        calls = []
+        result = enrol_images(read_manifest(self.source), workers=2, batch_size=2,
+                              progress=lambda *args: calls.append(args))
+        self.assertEqual((result['enrolled'], result['skipped'], result['failed']), (3, 0, 2))
+        self.assertEqual(calls[-1][:2], (4, 4))
+        self.assertEqual(FaceTemplate.query.filter_by(user_id=second.id).count(), 2)
+        db.session.expire_all()
+        self.assertIsNotNone(first.get_face_encoding())
+        self.assertTrue(os.path.exists(second.face_image_path))
+        self.assertEqual(FaceImage.query.count(), 3)
+
+        header = read_snapshot_header(snapshot_path(self.app.config['ENCODINGS_FOLDER']))
+        self.assertEqual(header['count'], 2)
+        self.assertEqual(header['version'], GalleryChange.latest_version())
+
+        rerun = enrol_images(read_manifest(self.source), workers=1)
+        self.assertEqual((rerun['enrolled'], rerun['skipped']), (0, 3))
+        self.assertEqual(FaceTemplate.query.count(), 3)
+
+    def test_identical_images_share_the_stored_file(self):
+        """Test that the same picture enrolled for two members is stored and encoded once"""
+        first, second = self._create_user('LA/23A/0001'), self._create_user('LA/23A/0002')
+        self._write_image(os.path.join(self.source, 'LA_23A_0001.jpg'), shade=60)
+        self._write_image(os.path.join(self.source, 'LA_23A_0002.jpg'), shade=60)
+        result = enrol_images(read_manifest(self.source), workers=1)
+        self.assertEqual(result['enrolled'], 2)
+
+        image = FaceImage.query.one()
+        self.assertEqual(image.ref_count, 2)
+        self.assertIsNotNone(image.get_encoding())
+        self.assertEqual({template.image_digest for template in FaceTemplate.query}, {image.digest})
+        db.session.expire_all()
+        self.assertEqual(first.face_image_path, second.face_image_path)
+
+    def test_workers_fail_without_models(self):
+        """Test that encoding workers refuse to start when the face models are missing"""
+        self._create_user('LA/23A/0001')
+        self._write_image(os.path.join(self.source, 'LA_23A_0001.jpg'))
+        with mock.patch('app.services.bulk_enrolment.get_pipeline', return_value=None):
+            with self.assertRaises(BrokenProcessPool):
+                enrol_images(read_manifest(self.source), workers=1)
+        self.assertEqual(FaceTemplate.query.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
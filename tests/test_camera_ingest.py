@@ -0,0 +1,233 @@
+import unittest
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+import cv2
+import numpy as np
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import User, Location, CDSchedule
+from app.services.attendance_service import AttendanceService
+from app.services.face_pipeline import DetectedFace
+from app.services.camera_ingest import (CameraIngest, Frame, FrameBuffer, FrameRecognizer, OpenCVSource,
+                                        SyntheticSource, active_cameras)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def frame(location_id, sequence, captured_at):
+    return Frame(location_id, str(location_id), sequence, captured_at, None)
+
+
+class FrameBufferTestCase(unittest.TestCase):
+    """Test cases for the shared frame buffer"""
+
+    def test_overwrite_newest_first_and_stale_frames(self):
+        """Test that full rings overwrite, takes skip to the newest frame and old frames are dropped"""
+        clock = FakeClock()
+        buffer = FrameBuffer(capacity=3, max_age=1.0, clock=clock)
+        for sequence in range(5):
+            buffer.put(frame(1, sequence, clock.now))
+        buffer.put(frame(2, 0, clock.now))
+
+        self.assertEqual(buffer.take(timeout=0).sequence, 4)
+        self.assertEqual(buffer.take(timeout=0).location_id, 2)
+        self.assertIsNone(buffer.take(timeout=0))
+        self.assertEqual(buffer.stats[1], {'captured': 5, 'overwritten': 2, 'stale': 2, 'taken': 1})
+
+        buffer.put(frame(1, 5, clock.now))
+        clock.now += 2
+        self.assertIsNone(buffer.take(timeout=0))
+        self.assertEqual(buffer.stats[1]['stale'], 3)
+
+    def test_round_robin_and_close(self):
+        """Test that cameras take turns and close releases waiting workers"""
+        buffer = FrameBuffer(capacity=2, max_age=60)
+        now = time.monotonic()
+        for sequence in range(3):
+            buffer.put(frame(1, sequence, now))
+            buffer.put(frame(2, sequence, now))
+        self.assertEqual([buffer.take(0).location_id, buffer.take(0).location_id], [1, 2])
+
+        waiter = threading.Thread(target=buffer.take)
+        waiter.start()
+        buffer.close()
+        waiter.join(timeout=2)
+        self.assertFalse(waiter.is_alive())
+
+
+class CameraIngestTestCase(unittest.TestCase):
+    """Test cases for camera scheduling, capture and recognition"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app = create_app('testing')
+        self.encodings_dir = tempfile.TemporaryDirectory()
+        self.app.config.update(ENCODINGS_FOLDER=self.encodings_dir.name, CAMERA_CAPTURE_FPS=0,
+                               CAMERA_BUFFER_FRAMES=4, CAMERA_MAX_FRAME_AGE=0.2, CAMERA_RECONNECT_SECONDS=0.05,
+                               CAMERA_GATE_ENABLED=False)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.encodings_dir.cleanup()
+
+    def _location(self, name, camera_id, start=-1, end=1, is_cancelled=False):
+        location = Location(name=name, local_government='Ikeja', state='Lagos', camera_id=camera_id)
+        db.session.add(location)
+        db.session.flush()
+        now = datetime.now()
+        db.session.add(CDSchedule(location_id=location.id, schedule_date=date.today(),
+                                  start_time=(now + timedelta(hours=start)).time(),
+                                  end_time=(now + timedelta(hours=end)).time(), is_cancelled=is_cancelled))
+        db.session.commit()
+        return location
+
+    def test_active_cameras_follow_schedule(self):
+        """Test that only cameras of locations scheduled right now are selected"""
+        if not (1 <= datetime.now().hour <= 22):
+            self.skipTest('schedule windows would cross midnight')
+        running = self._location('Hall A', '0')
+        self._location('Hall B', None)
+        self._location('Hall C', 'rtsp://cam-c/stream', is_cancelled=True)
+        self._location('Hall D', '2', start=-3, end=-2)
+        self.assertEqual(active_cameras(), {running.id: '0'})
+
+    def test_slow_recognition_drops_stale_frames(self):
+        """Test that a slow pool keeps up with the newest frames of every camera"""
+        ages = []
+
+        def slow_handle(frame):
+            ages.append(time.monotonic() - frame.captured_at)
+            time.sleep(0.02)
+
+        image = np.zeros((48, 64, 3), dtype=np.uint8)
+        ingest = CameraIngest(self.app, slow_handle, workers=1,
+                              open_source=lambda camera_id: SyntheticSource([image], fps=500, loop=True))
+        ingest.start()
+        ingest.sync_cameras({1: 'cam-1', 2: 'cam-2'})
+        time.sleep(0.5)
+        ingest.sync_cameras({2: 'cam-2'})
+        self.assertEqual(set(ingest.captures), {2})
+        ingest.stop()
+
+        stats = ingest.stats()
+        for location_id in (1, 2):
+            self.assertGreater(stats[location_id]['processed'], 3)
+            self.assertGreater(stats[location_id]['overwritten'] + stats[location_id]['stale'],
+                               stats[location_id]['processed'])
+        self.assertLess(max(ages), 0.2)
+        self.assertEqual(ingest.captures, {})
+
+    def test_capture_reopens_sources_that_end(self):
+        """Test that a source that runs out is reopened"""
+        opened = []
+
+        def open_source(camera_id):
+            opened.append(camera_id)
+            return SyntheticSource([np.zeros((8, 8, 3), dtype=np.uint8)] * 2)
+
+        ingest = CameraIngest(self.app, lambda frame: None, workers=1, open_source=open_source)
+        ingest.start()
+        ingest.sync_cameras({1: 'video.mp4'})
+        time.sleep(0.3)
+        ingest.stop()
+        self.assertGreater(len(opened), 1)
+
+    def test_recognizer_identifies_each_track_once(self):
+        """Test that a member in view for many frames is recognized and marked once"""
+        location = self._location('Hall A', '0')
+        encoding = np.random.default_rng(1).standard_normal(128).astype(np.float32)
+        user = User(state_code='LA/23A/0001', full_name='Test User', email='test@example.com',
+                    local_government='Ikeja')
+        user.set_password('testpass')
+        user.set_pin('1234')
+        user.set_face_encoding(encoding)
+        db.session.add(user)
+        db.session.commit()
+
+        pipeline = mock.Mock()
+        pipeline.embed.side_effect = lambda crops: np.stack([encoding] * len(crops))
+        recognizer = FrameRecognizer()
+
+        def show(sequence, captured_at, x):
+            pipeline.detect.return_value = [DetectedFace(np.array([x, 50, 80, 80]), np.zeros((5, 2)), 0.99)]
+            recognizer(Frame(location.id, '0', sequence, captured_at, None))
+
+        with mock.patch('app.services.camera_ingest.get_pipeline', return_value=pipeline), \
+                mock.patch.object(AttendanceService, 'mark_attendance',
+                                  return_value={'success': True, 'message': 'marked'}) as mark:
+            for sequence in range(5):
+                show(sequence, 10 + sequence * 0.2, 100 + sequence * 10)
+            show(2, 12, 140)  # late frame from another worker
+            # The member leaves and comes back: a new track, recognized again
+            show(5, 20, 300)
+        self.assertEqual(pipeline.detect.call_count, 7)
+        self.assertEqual(pipeline.embed.call_count, 2)
+        self.assertEqual(recognizer.snapshot()[location.id], {'faces': 6, 'recognitions': 2, 'events': 2})
+        self.assertEqual(mark.call_count, 1)
+        self.assertEqual(mark.call_args[0][0], user.id)
+        self.assertEqual(mark.call_args[1]['method'], 'face')
+
+    def test_failed_marks_are_retried_and_reset_daily(self):
+        """Test that only a successful mark is remembered, and only for the day"""
+        location = self._location('Hall A', '0')
+        user = User(state_code='LA/23A/0001', full_name='Test User', email='test@example.com')
+        user.set_password('testpass')
+        user.set_pin('1234')
+        db.session.add(user)
+        db.session.commit()
+        recognizer = FrameRecognizer()
+        frame = Frame(location.id, '0', 0, 0.0, None)
+
+        outcomes = [{'success': False, 'message': 'System error occurred'},
+                    {'success': True, 'message': 'marked'}, {'success': True, 'message': 'marked'}]
+        with mock.patch.object(AttendanceService, 'mark_attendance', side_effect=outcomes) as mark:
+            for _ in range(3):
+                recognizer.on_match(frame, user.id, 0.9)
+            self.assertEqual(mark.call_count, 2)
+            with mock.patch('app.services.camera_ingest.date') as fake_date:
+                fake_date.today.return_value = date.today() + timedelta(days=1)
+                recognizer.on_match(frame, user.id, 0.9)
+                recognizer.on_match(frame, user.id, 0.9)
+        self.assertEqual(mark.call_count, 3)
+
+    def test_video_file_source(self):
+        """Test that a recording can stand in for a camera"""
+        path = os.path.join(self.encodings_dir.name, 'clip.avi')
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 50, (64, 48))
+        if not writer.isOpened():
+            self.skipTest('no MJPG encoder in this OpenCV build')
+        for value in range(5):
+            writer.write(np.full((48, 64, 3), value * 40, dtype=np.uint8))
+        writer.release()
+
+        source = OpenCVSource(path)
+        self.assertAlmostEqual(source.interval, 0.02, places=3)
+        frames = [source.read() for _ in range(6)]
+        source.release()
+        self.assertEqual([image.shape for image in frames[:5]], [(48, 64, 3)] * 5)
+        self.assertIsNone(frames[5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import csv
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import User
+from app.services.duplicate_detection import find_duplicates, write_report
+from app.services.face_gallery import normalize_encodings, similarity_to_distance
+
+
+class DuplicateDetectionTestCase(unittest.TestCase):
+    """Test cases for the all-pairs duplicate scan"""
+
+    def test_tiled_scan_matches_brute_force(self):
+        """Test that tiles cover every pair exactly once and keep only close ones"""
+        rng = np.random.default_rng(3)
+        encodings = rng.standard_normal((300, 128)).astype(np.float32)
+        for source, copy in ((5, 290), (17, 18), (40, 170), (170, 171)):
+            encodings[copy] = encodings[source] + 0.02 * rng.standard_normal(128)
+        user_ids = np.arange(1000, 1300)
+
+        unit = normalize_encodings(encodings)
+        distances = similarity_to_distance(unit @ unit.T)
+        rows, columns = np.nonzero(np.triu(distances <= 0.5, k=1))
+        expected = sorted(zip(user_ids[rows].tolist(), user_ids[columns].tolist()))
+
+        for block_size, workers in ((64, 4), (300, 1), (1000, 2)):
+            calls = []
+            pairs = find_duplicates(user_ids, encodings, 0.5, block_size=block_size, workers=workers,
+                                    progress=lambda done, total: calls.append((done, total)))
+            self.assertEqual(sorted((pair.user_id, pair.other_user_id) for pair in pairs), expected)
+            self.assertEqual([pair.distance for pair in pairs], sorted(pair.distance for pair in pairs))
+            tiles = -(-300 // block_size)
+            self.assertEqual(calls[-1], (tiles * (tiles + 1) // 2,) * 2)
+        self.assertEqual(len(expected), 5)  # 40-170-171 form a chain of three
+
+        self.assertEqual(find_duplicates([], np.empty((0, 128)), 0.5), [])
+        # Even a threshold that admits every pair never pairs a row with itself
+        self.assertEqual(len(find_duplicates(user_ids[:10], encodings[:10], 2.0, block_size=4)), 45)
+
+    def test_report(self):
+        """Test that the report names both members of each pair"""
+        app = create_app('testing')
+        with app.app_context():
+            db.create_all()
+            users = []
+            for number in (1, 2):
+                user = User(state_code=f'LA/23A/000{number}', full_name=f'Member {number}',
+                            email=f'member{number}@example.com')
+                user.set_password('testpass')
+                user.set_pin('1234')
+                db.session.add(user)
+                users.append(user)
+            db.session.commit()
+
+            encoding = np.ones((2, 128), dtype=np.float32)
+            pairs = find_duplicates([users[1].id, users[0].id], encoding, 0.1)
+            with tempfile.TemporaryDirectory() as folder:
+                path = os.path.join(folder, 'duplicates.csv')
+                self.assertEqual(write_report(pairs, path), 1)
+                with open(path, newline='') as f:
+                    rows = list(csv.DictReader(f))
+            db.session.remove()
+            db.drop_all()
+
+        self.assertEqual(rows[0]['state_code'], 'LA/23A/0001')
+        self.assertEqual(rows[0]['other_full_name'], 'Member 2')
+        self.assertAlmostEqual(float(rows[0]['distance']), 0.0, places=2)
+        self.assertAlmostEqual(float(rows[0]['confidence']), 1.0, places=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+import io
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import User, EnrolmentJob, FaceTemplate
+from app.services.enrolment_queue import _sweep, process_next, run_worker
+from app.services.face_recognition_service import FaceRecognitionService
+
+
+class EnrolmentQueueTestCase(unittest.TestCase):
+    """Test cases for queued face enrolment"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app = create_app('testing')
+        self.folder = tempfile.TemporaryDirectory()
+        for key in ('UPLOAD_FOLDER', 'FACES_FOLDER', 'ENCODINGS_FOLDER'):
+            self.app.config[key] = os.path.join(self.folder.name, key.lower())
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        # Stands in for the face models, which tests run without
+        extract = mock.patch.object(FaceRecognitionService, 'extract_face_encoding',
+                                    side_effect=lambda path: np.random.default_rng(0).standard_normal(128))
+        extract.start()
+        self.addCleanup(extract.stop)
+
+        self.user = User(state_code='LA/23A/0001', full_name='Test User', email='test@example.com')
+        self.user.set_password('testpass')
+        self.user.set_pin('1234')
+        db.session.add(self.user)
+        db.session.commit()
+        self.client.post('/auth/login', data={'email': 'test@example.com', 'password': 'testpass'})
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.folder.cleanup()
+
+    def _upload(self, data=None, filename='face.jpg'):
+        if data is None:
+            buffer = io.BytesIO()
+            Image.new('RGB', (640, 480), (150, 110, 90)).save(buffer, 'JPEG')
+            data = buffer.getvalue()
+        return self.client.post('/api/face_recognition/upload',
+                                data={'image': (io.BytesIO(data), filename)},
+                                content_type='multipart/form-data')
+
+    def test_upload_returns_job_and_worker_enrols(self):
+        """Test that the upload only queues and the worker completes the enrolment"""
+        response = self._upload()
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()['job_id']
+
+        job = db.session.get(EnrolmentJob, job_id)
+        self.assertEqual(job.status, EnrolmentJob.QUEUED)
+        self.assertTrue(os.path.exists(job.upload_path))
+        self.assertIsNone(self.user.face_encoding)
+
+        self.assertEqual(run_worker(once=True), 1)
+        status = self.client.get(response.get_json()['status_url']).get_json()
+        self.assertEqual(status['status'], EnrolmentJob.DONE)
+        self.assertEqual(status['attempts'], 1)
+        self.assertFalse(os.path.exists(job.upload_path))
+        self.assertEqual(FaceTemplate.query.filter_by(user_id=self.user.id).count(), 1)
+
+    def test_rejected_and_failed_uploads(self):
+        """Test validation at upload time and failure reporting from the worker"""
+        self.assertEqual(self._upload(filename='face.txt').status_code, 400)
+        self.assertEqual(self._upload(data=b'').status_code, 400)
+        self.assertEqual(self._upload(data=b'not an image').status_code, 400)
+
+        job_id = self._upload().get_json()['job_id']
+        self.app.config['FACE_MAX_IMAGE_PIXELS'] = 1000
+        self.assertEqual(self._upload().status_code, 400)
+        process_next()
+        status = self.client.get(f'/api/face_recognition/jobs/{job_id}').get_json()
+        self.assertEqual(status['status'], EnrolmentJob.FAILED)
+        self.assertEqual(status['message'], 'Image resolution is too large')
+        self.assertEqual(self.client.get('/api/face_recognition/jobs/unknown').status_code, 404)
+
+    def test_stalled_jobs_are_requeued(self):
+        """Test that a job left running by a dead worker is picked up again"""
+        job_id = self._upload().get_json()['job_id']
+        job = db.session.get(EnrolmentJob, job_id)
+        job.status, job.attempts = EnrolmentJob.RUNNING, 1
+        job.started_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+
+        self.assertEqual(process_next().id, job_id)
+        self.assertEqual(db.session.get(EnrolmentJob, job_id).status, EnrolmentJob.DONE)
+
+    def test_sweeper_requeues_stalled_jobs(self):
+        """Test that the worker threads' periodic sweep runs a stalled job again"""
+        job_id = self._upload().get_json()['job_id']
+        EnrolmentJob.query.filter_by(id=job_id).update({
+            EnrolmentJob.status: EnrolmentJob.RUNNING, EnrolmentJob.attempts: 1,
+            EnrolmentJob.started_at: datetime.utcnow() - timedelta(hours=1)})
+        db.session.commit()
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        with mock.patch('app.services.enrolment_queue.time.sleep',
+                        side_effect=lambda interval: executor.shutdown()) as sleep:
+            _sweep(self.app, executor, 60)
+        sleep.assert_called_once_with(60)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(EnrolmentJob, job_id).status, EnrolmentJob.DONE)
+
+    def test_errored_job_is_dispatched_again(self):
+        """Test that a job requeued after an error goes back to the worker threads"""
+        job_id = self._upload().get_json()['job_id']
+        outcomes = [RuntimeError('detector crashed'), {'success': True, 'message': 'Enrolled'}]
+        with mock.patch.object(FaceRecognitionService, 'enroll_face_image', side_effect=outcomes), \
+                mock.patch('app.services.enrolment_queue._dispatch') as dispatch:
+            process_next()
+            self.assertEqual(db.session.get(EnrolmentJob, job_id).status, EnrolmentJob.QUEUED)
+            dispatch.assert_called_once_with(job_id)
+            process_next()
+        job = db.session.get(EnrolmentJob, job_id)
+        self.assertEqual((job.status, job.attempts), (EnrolmentJob.DONE, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
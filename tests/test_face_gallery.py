@@ -0,0 +1,255 @@
+import unittest
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.face_gallery import FaceGallery, normalize_encodings
+from app.services.ann_index import INDEX_DIRNAME, HNSWIndex, IVFIndex, load_index, measure_recall, save_index
+from app.services.gallery_snapshot import open_snapshot, write_snapshot
+from app.models.face_encoding import pack_encoding, unpack_encoding, unpack_encodings
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+class FaceGalleryTestCase(unittest.TestCase):
+    """Test cases for the vectorized face gallery"""
+
+    def setUp(self):
+        """Set up a small random gallery"""
+        self.rng = np.random.default_rng(42)
+        self.encodings = self.rng.standard_normal((500, 128)).astype(np.float32)
+        self.user_ids = np.arange(1000, 1500)
+        self.gallery = FaceGallery().build(self.user_ids, self.encodings)
+
+    def test_gallery_is_normalized(self):
+        """Test that gallery rows are unit length float32"""
+        self.assertEqual(self.gallery.encodings.dtype, np.float32)
+        self.assertTrue(self.gallery.encodings.flags['C_CONTIGUOUS'])
+        np.testing.assert_allclose(np.linalg.norm(self.gallery.encodings, axis=1), 1.0, rtol=1e-5)
+
+    def test_search_matches_brute_force(self):
+        """Test that batched top-k search agrees with a per-probe loop"""
+        probes = self.encodings[:20] + 0.05 * self.rng.standard_normal((20, 128))
+        ids, distances = self.gallery.search(probes, k=5)
+        self.assertEqual(ids.shape, (20, 5))
+
+        unit = normalize_encodings(probes)
+        for row, probe in enumerate(unit):
+            expected = np.linalg.norm(self.gallery.encodings - probe, axis=1)
+            order = np.argsort(expected)[:5]
+            np.testing.assert_array_equal(ids[row], self.user_ids[order])
+            np.testing.assert_allclose(distances[row], expected[order], atol=1e-4)
+
+    def test_match_applies_tolerance(self):
+        """Test that matches above tolerance are rejected"""
+        results = self.gallery.match(self.encodings[:3], tolerance=0.6)
+        self.assertEqual([user_id for user_id, _ in results], [1000, 1001, 1002])
+
+        stranger = self.rng.standard_normal((1, 128))
+        self.assertIsNone(self.gallery.match(stranger, tolerance=0.6)[0][0])
+
+    def test_upsert_and_remove(self):
+        """Test incremental add, replace and remove"""
+        new_encoding = self.rng.standard_normal(128)
+        self.gallery.upsert(9999, new_encoding)
+        self.assertEqual(len(self.gallery), 501)
+        self.assertEqual(self.gallery.match(new_encoding, 0.6)[0][0], 9999)
+
+        self.gallery.upsert(1000, new_encoding)
+        self.assertEqual(len(self.gallery), 501)
+        self.assertIsNone(self.gallery.match(self.encodings[0], 0.6)[0][0])
+
+        self.assertTrue(self.gallery.remove(1000))
+        self.assertFalse(self.gallery.remove(1000))
+        self.assertNotIn(1000, self.gallery)
+        self.assertEqual(self.gallery.match(self.encodings[499], 0.6)[0][0], 1499)
+        self.assertEqual(self.gallery.match(new_encoding, 0.6)[0][0], 9999)
+
+    def test_snapshot_round_trip(self):
+        """Test that a snapshot maps back to the same gallery without copying"""
+        self.gallery.upsert(7, self.rng.standard_normal(128))
+        with tempfile.TemporaryDirectory() as folder:
+            write_snapshot(folder, self.gallery.user_ids, self.gallery.encodings, version=12)
+            snapshot = open_snapshot(folder)
+            mapped = FaceGallery().open_base(snapshot.user_ids, snapshot.encodings)
+
+            self.assertEqual(snapshot.version, 12)
+            self.assertEqual(len(mapped), 501)
+            self.assertTrue(np.all(np.diff(snapshot.user_ids) > 0))
+            probes = self.encodings[:10]
+            np.testing.assert_array_equal(mapped.search(probes, k=3)[0], self.gallery.search(probes, k=3)[0])
+
+            mapped.remove(1000)
+            mapped.upsert(1001, self.encodings[0])
+            self.assertEqual(mapped.match(self.encodings[0], 0.6)[0][0], 1001)
+            self.assertFalse(snapshot.encodings.flags.writeable)
+            del snapshot, mapped
+
+    def test_quantized_search_matches_exact(self):
+        """Test that int8 and float16 scans re-rank to the exact top-k"""
+        probes = self.encodings[:20] + 0.05 * self.rng.standard_normal((20, 128))
+        expected_ids, expected_distances = self.gallery.search(probes, k=3)
+        for mode, bytes_per_value in (('float16', 2), ('int8', 1)):
+            self.gallery.set_quantization(mode, rerank_candidates=16)
+            self.assertTrue(self.gallery.quantized)
+            self.assertEqual(self.gallery._quantizer.codes.nbytes, self.encodings.nbytes * bytes_per_value // 4)
+            ids, distances = self.gallery.search(probes, k=3)
+            np.testing.assert_array_equal(ids, expected_ids)
+            np.testing.assert_allclose(distances, expected_distances, atol=1e-5)
+
+        self.gallery.remove(1000)
+        self.assertNotEqual(self.gallery.match(self.encodings[0], 0.6)[0][0], 1000)
+        self.gallery.set_quantization('none')
+        self.assertFalse(self.gallery.quantized)
+
+    def test_rerank_settles_code_order_at_the_threshold(self):
+        """Test that a probe the int8 codes rank the wrong way round gets the exact decision"""
+        unit = normalize_encodings(self.encodings)
+        pairs = self.rng.choice(len(unit), (200, 2))
+        probes = unit[pairs[:, 0]] + unit[pairs[:, 1]] + 1e-3 * self.rng.standard_normal((200, 128))
+        expected_ids, expected_distances = self.gallery.search(probes, k=1)
+
+        codes = FaceGallery()
+        codes.set_quantization('int8', rerank_candidates=1)
+        codes.build(self.user_ids, self.encodings)
+        code_ids = codes.search(probes, k=1)[0]
+        flipped = np.flatnonzero(code_ids[:, 0] != expected_ids[:, 0])
+        self.assertGreater(len(flipped), 0)
+
+        # Accept the exact best match only, rejecting the one the codes prefer
+        probe = probes[flipped[0]]
+        tolerance = float(expected_distances[flipped[0], 0]) + 1e-6
+        self.assertIsNone(codes.match(probe, tolerance)[0][0])
+        codes.set_quantization('int8', rerank_candidates=32)
+        self.assertEqual(codes.match(probe, tolerance)[0][0], expected_ids[flipped[0], 0])
+        ids, distances = codes.search(probes, k=1)
+        np.testing.assert_array_equal(ids, expected_ids)
+        np.testing.assert_allclose(distances, expected_distances, atol=1e-4)
+
+    def test_empty_gallery(self):
+        """Test that an empty gallery returns no matches"""
+        ids, distances = FaceGallery().search(self.encodings[:2], k=3)
+        self.assertEqual(ids.shape, (2, 0))
+        self.assertEqual(FaceGallery().match(self.encodings[:1], 0.6)[0][0], None)
+
+
+class FaceEncodingStorageTestCase(unittest.TestCase):
+    """Test cases for the binary face encoding format"""
+
+    def test_round_trip(self):
+        """Test that float32 and float16 blobs decode back to the encoding"""
+        encoding = np.random.default_rng(1).standard_normal(128)
+        blob = pack_encoding(encoding)
+        self.assertEqual(len(blob), 8 + 128 * 4)
+        np.testing.assert_array_equal(unpack_encoding(blob), encoding.astype(np.float32))
+
+        half = pack_encoding(encoding, dtype='float16')
+        self.assertEqual(len(half), 8 + 128 * 2)
+        np.testing.assert_allclose(unpack_encoding(half), encoding, atol=1e-2)
+
+    def test_batch_decode(self):
+        """Test that batch decoding handles mixed layouts and flags bad rows"""
+        encodings = np.random.default_rng(2).standard_normal((3, 128)).astype(np.float32)
+        blobs = [pack_encoding(encodings[0]), b'not an encoding',
+                 pack_encoding(encodings[1], dtype='float16'), pack_encoding(encodings[2])]
+        matrix, valid = unpack_encodings(blobs, 128)
+        self.assertEqual(valid.tolist(), [True, False, True, True])
+        np.testing.assert_array_equal(matrix[[0, 3]], encodings[[0, 2]])
+        np.testing.assert_allclose(matrix[2], encodings[1], atol=1e-2)
+        with self.assertRaises(ValueError):
+            unpack_encoding(blobs[1])
+
+
+class IVFIndexTestCase(unittest.TestCase):
+    """Test cases for the approximate IVF index"""
+
+    def setUp(self):
+        """Set up a clustered gallery and an index over it"""
+        rng = np.random.default_rng(7)
+        centers = rng.standard_normal((40, 128))
+        encodings = centers[rng.integers(0, 40, 4000)] + 0.3 * rng.standard_normal((4000, 128))
+        self.gallery = FaceGallery().build(np.arange(4000), encodings)
+        self.index = IVFIndex(nlist=32, nprobe=4).build(self.gallery.user_ids, self.gallery.encodings)
+        self.probes = self.gallery.encodings[:200] + 0.01 * rng.standard_normal((200, 128))
+
+    def test_recall_against_brute_force(self):
+        """Test that the index finds nearly all exact neighbours"""
+        report = measure_recall(self.index, self.gallery, self.probes, k=5)
+        self.assertGreater(report['recall_at_k'], 0.9)
+        self.assertGreater(report['decision_agreement'], 0.95)
+
+    def test_changes_after_index_build(self):
+        """Test that dirty users are corrected for when searching through the index"""
+        self.gallery.attach_index(self.index)
+        replacement = -self.gallery.encodings[0]
+        self.gallery.upsert(0, replacement)
+        self.gallery.remove(1)
+        self.gallery.upsert(5000, self.probes[1])
+
+        ids, _ = self.gallery.search(self.probes[:3], k=1)
+        self.assertNotEqual(ids[0, 0], 0)
+        self.assertEqual(ids[1, 0], 5000)
+        self.assertEqual(ids[2, 0], 2)
+        self.assertEqual(self.gallery.search(replacement, k=1)[0][0, 0], 0)
+
+        stale = self.index.stale_ids(self.gallery.user_ids, self.gallery.encodings)
+        self.assertEqual(sorted(stale.tolist()), [0, 1, 5000])
+
+    def test_save_and_load(self):
+        """Test that a persisted index returns identical results"""
+        with tempfile.TemporaryDirectory() as folder:
+            save_index(self.index, folder)
+            loaded = load_index(folder)
+        self.assertEqual(loaded.fingerprint, self.index.fingerprint)
+        np.testing.assert_array_equal(loaded.search(self.probes, k=3)[0],
+                                      self.index.search(self.probes, k=3)[0])
+
+    def test_save_keeps_mapped_files(self):
+        """Test that saving never rewrites or immediately removes files a worker may have mapped"""
+        with tempfile.TemporaryDirectory() as folder:
+            index_folder = os.path.join(folder, INDEX_DIRNAME)
+            self.index.save(index_folder)
+            loaded = load_index(folder)
+            path = loaded.encodings.filename
+            inode = os.stat(path).st_ino
+            self.index.save(index_folder)
+            self.assertNotEqual(os.stat(path).st_ino, inode)
+            np.testing.assert_array_equal(loaded.encodings, self.index.encodings)
+
+            rebuilt = IVFIndex(nlist=16, nprobe=4).build(self.gallery.user_ids[1:], self.gallery.encodings[1:])
+            rebuilt.save(index_folder)
+            self.assertTrue(os.path.exists(path))
+            self.assertEqual(load_index(folder).fingerprint, rebuilt.fingerprint)
+            rebuilt.save(index_folder, retain_seconds=0)
+            self.assertEqual(sorted(os.listdir(index_folder)), sorted(
+                [f'ivf-{rebuilt.fingerprint}.encodings.npy', f'ivf-{rebuilt.fingerprint}.npz', 'meta.json']))
+            del loaded
+
+    @unittest.skipIf(hnswlib is None, 'hnswlib is not installed')
+    def test_hnsw_save_publishes_by_rename(self):
+        """Test that an HNSW graph is saved under its fingerprint and only replaced through meta.json"""
+        with tempfile.TemporaryDirectory() as folder:
+            index_folder = os.path.join(folder, INDEX_DIRNAME)
+            first = HNSWIndex(m=8, ef_construction=50).build(self.gallery.user_ids, self.gallery.encodings)
+            first.save(index_folder)
+            rebuilt = HNSWIndex(m=8, ef_construction=50).build(self.gallery.user_ids[1:],
+                                                               self.gallery.encodings[1:])
+            rebuilt.save(index_folder)
+            self.assertTrue(os.path.exists(os.path.join(index_folder, f'hnsw-{first.fingerprint}.bin')))
+            loaded = load_index(folder)
+            self.assertEqual(loaded.fingerprint, rebuilt.fingerprint)
+            self.assertEqual(len(loaded), len(self.gallery) - 1)
+
+            rebuilt.save(index_folder, retain_seconds=0)
+            self.assertEqual(sorted(os.listdir(index_folder)), [f'hnsw-{rebuilt.fingerprint}.bin', 'meta.json'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+import unittest
+import io
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import User, FaceImage, FaceTemplate
+from app.services.face_image_store import collect_garbage, content_path, store_face_image, store_root
+from app.services.face_recognition_service import FaceRecognitionService
+
+
+def jpeg_bytes(color, size=(640, 480)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class FaceImageStoreTestCase(unittest.TestCase):
+    """Test cases for the content-addressed face image store"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app = create_app('testing')
+        self.folder = tempfile.TemporaryDirectory()
+        for key in ('FACES_FOLDER', 'ENCODINGS_FOLDER'):
+            self.app.config[key] = os.path.join(self.folder.name, key.lower())
+        self.app.config['FACE_MAX_TEMPLATES'] = 2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(state_code='LA/23A/0001', full_name='Test User', email='test@example.com')
+        self.user.set_password('testpass')
+        self.user.set_pin('1234')
+        db.session.add(self.user)
+        db.session.commit()
+
+        self.service = FaceRecognitionService()
+        self.rng = np.random.default_rng(0)
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.folder.cleanup()
+
+    def _enroll(self, data, user=None):
+        with mock.patch.object(FaceRecognitionService, 'extract_face_encoding',
+                               side_effect=lambda path: self.rng.standard_normal(128)) as extract:
+            result = self.service.enroll_face_image(user or self.user, io.BytesIO(data))
+        return result, extract.call_count
+
+    def test_store_layout_and_deduplication(self):
+        """Test that images are addressed by digest under fan-out folders and stored once"""
+        first = store_face_image(io.BytesIO(jpeg_bytes((120, 90, 60))))
+        db.session.commit()
+        path = content_path(first.digest)
+        self.assertEqual(os.path.relpath(path, store_root()),
+                         os.path.join(first.digest[:2], first.digest[2:4], f'{first.digest}.jpg'))
+        self.assertTrue(os.path.exists(path))
+        with Image.open(path) as stored:
+            self.assertEqual(stored.size, (400, 300))
+
+        # Same bytes resolve without decoding
+        with mock.patch('app.services.face_image_store.save_face_image') as save:
+            again = store_face_image(jpeg_bytes((120, 90, 60)))
+        save.assert_not_called()
+        self.assertEqual(again.digest, first.digest)
+
+        # A larger upload of the same picture normalizes to the same content
+        larger = store_face_image(jpeg_bytes((120, 90, 60), size=(1280, 960)))
+        self.assertEqual(larger.digest, first.digest)
+        self.assertEqual(FaceImage.query.count(), 1)
+
+    def test_reupload_reuses_cached_encoding(self):
+        """Test that an identical upload skips the embedding"""
+        data = jpeg_bytes((150, 110, 90))
+        result, encoded = self._enroll(data)
+        self.assertTrue(result['success'])
+        self.assertEqual(encoded, 1)
+
+        result, encoded = self._enroll(data)
+        self.assertEqual(result['message'], 'Face image already enrolled')
+        self.assertEqual(encoded, 0)
+        self.assertEqual(self.user.face_templates.count(), 1)
+
+        other = User(state_code='LA/23A/0002', full_name='Other User', email='other@example.com')
+        other.set_password('testpass')
+        other.set_pin('1234')
+        db.session.add(other)
+        db.session.commit()
+        result, encoded = self._enroll(data, user=other)
+        self.assertTrue(result['success'])
+        self.assertEqual(encoded, 0)
+        np.testing.assert_allclose(other.face_templates.first().get_encoding(),
+                                   self.user.face_templates.first().get_encoding())
+        self.assertEqual(FaceImage.query.one().ref_count, 2)
+
+    def test_enrolment_fails_without_models(self):
+        """Test that nothing is encoded or enrolled when the face models are missing"""
+        result = self.service.enroll_face_image(self.user, io.BytesIO(jpeg_bytes((40, 50, 60))))
+        self.assertEqual(result, {'success': False, 'message': 'Face models are not installed'})
+        self.assertIsNone(FaceImage.query.one().encoding)
+        self.assertEqual(self.user.face_templates.count(), 0)
+        self.assertIsNone(self.user.face_encoding)
+
+    def test_trimmed_templates_are_collected(self):
+        """Test that references drop with trimmed templates and garbage collection frees them"""
+        uploads = [jpeg_bytes(color) for color in ((10, 20, 30), (90, 60, 30), (200, 180, 160))]
+        for data in uploads:
+            self.assertTrue(self._enroll(data)[0]['success'])
+        self.assertEqual(self.user.face_templates.count(), 2)
+
+        counts = {image.digest: image.ref_count for image in FaceImage.query}
+        self.assertEqual(sorted(counts.values()), [0, 1, 1])
+        dropped = next(digest for digest, count in counts.items() if count == 0)
+
+        # Nothing is old enough yet
+        self.assertEqual(collect_garbage(grace_seconds=3600)['images'], 0)
+        self.assertTrue(os.path.exists(content_path(dropped)))
+
+        FaceImage.query.update({FaceImage.created_at: datetime.utcnow() - timedelta(days=2)})
+        db.session.commit()
+        stats = collect_garbage(grace_seconds=3600)
+        self.assertEqual(stats['images'], 1)
+        self.assertFalse(os.path.exists(content_path(dropped)))
+        self.assertIsNone(db.session.get(FaceImage, dropped))
+        for template in self.user.face_templates:
+            self.assertTrue(os.path.exists(template.image_path))
+
+    def test_orphans_and_recount(self):
+        """Test sweeping files without records and repairing drifted counts"""
+        self._enroll(jpeg_bytes((60, 60, 60)))
+        image = FaceImage.query.one()
+
+        orphan = content_path('f' * 64)
+        legacy = os.path.join(self.app.config['FACES_FOLDER'], str(self.user.id), 'LA_23A_0001_old.jpg')
+        for path in (orphan, legacy):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(b'x' * 10)
+            os.utime(path, (0, 0))
+
+        FaceImage.query.update({FaceImage.ref_count: 0})
+        db.session.commit()
+        stats = collect_garbage(grace_seconds=0, recount=True)
+        self.assertEqual(stats['corrected'], 1)
+        self.assertEqual(stats['images'], 0)
+        self.assertEqual(stats['files'], 2)
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(os.path.exists(legacy))
+        self.assertTrue(os.path.exists(content_path(image.digest)))
+        self.assertEqual(FaceTemplate.query.one().image_digest, image.digest)
+
+    def test_concurrent_identical_upload(self):
+        """Test that an image inserted by a concurrent upload after our lookup is reused"""
+        data = jpeg_bytes((90, 30, 30))
+        real_get = db.session.get
+        raced = []
+
+        def get_before_other_upload(model, key, **kwargs):
+            if model is FaceImage and not raced:
+                # The other upload commits its row after our lookup missed it
+                raced.append(key)
+                db.session.execute(FaceImage.__table__.insert().values(
+                    digest=key, byte_size=1, ref_count=0, created_at=datetime.utcnow()))
+                return None
+            return real_get(model, key, **kwargs)
+
+        with mock.patch.object(db.session, 'get', side_effect=get_before_other_upload):
+            result, _ = self._enroll(data)
+        self.assertTrue(result['success'])
+        self.assertTrue(raced)
+        image = FaceImage.query.one()
+        self.assertEqual((image.digest, image.byte_size, image.ref_count), (raced[0], 1, 1))
+        self.assertIsNotNone(image.source_digest)
+
+    def test_collection_rechecks_references(self):
+        """Test that an image some template still uses is kept even if its count drifted"""
+        self._enroll(jpeg_bytes((20, 80, 20)))
+        image = FaceImage.query.one()
+        FaceImage.query.update({FaceImage.ref_count: 0})
+        db.session.commit()
+        stats = collect_garbage(grace_seconds=-60)
+        self.assertEqual(stats['images'], 0)
+        self.assertTrue(os.path.exists(content_path(image.digest)))
+        self.assertEqual(FaceImage.query.count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import unittest
+import os
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import cv2
+import numpy as np
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.face_pipeline import FacePipeline, REFERENCE_LANDMARKS, get_pipeline, similarity_transform
+
+try:
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+except ImportError:
+    onnx = None
+
+
+def build_embedding_model(dim=128, batch='N', seed=0):
+    """A small convolutional network with the 3x112x112 -> dim interface of SFace"""
+    rng = np.random.default_rng(seed)
+    weights = [
+        numpy_helper.from_array(rng.standard_normal((16, 3, 4, 4)).astype(np.float32), 'conv_w'),
+        numpy_helper.from_array(rng.standard_normal((16, dim)).astype(np.float32), 'fc_w'),
+        numpy_helper.from_array(rng.standard_normal(dim).astype(np.float32), 'fc_b'),
+    ]
+    nodes = [
+        helper.make_node('Conv', ['input', 'conv_w'], ['conv'], strides=[4, 4]),
+        helper.make_node('Relu', ['conv'], ['relu']),
+        helper.make_node('GlobalAveragePool', ['relu'], ['pool']),
+        helper.make_node('Flatten', ['pool'], ['flat']),
+        helper.make_node('Gemm', ['flat', 'fc_w', 'fc_b'], ['output']),
+    ]
+    graph = helper.make_graph(
+        nodes, 'embedding',
+        [helper.make_tensor_value_info('input', TensorProto.FLOAT, [batch, 3, 112, 112])],
+        [helper.make_tensor_value_info('output', TensorProto.FLOAT, [batch, dim])],
+        weights)
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 8
+    return cv2.dnn.readNetFromONNX(np.frombuffer(model.SerializeToString(), dtype=np.uint8))
+
+
+class StubDetector:
+    """Reports one face per image at a fixed scale and offset of the reference template"""
+
+    def __init__(self, scale=2.0, offset=(40.0, 30.0)):
+        landmarks = REFERENCE_LANDMARKS * scale + offset
+        self.row = np.concatenate([[offset[0], offset[1], 112 * scale, 112 * scale],
+                                   landmarks.ravel(), [0.99]]).astype(np.float32)
+
+    def detect(self, image):
+        if not image.any():
+            return np.empty((0, 15), dtype=np.float32)
+        return self.row[None, :]
+
+
+class StatefulNet:
+    """Embeds each crop as its mean pixel, with a pause between setInput and forward for races"""
+
+    def setInput(self, blob):
+        self.blob = blob
+
+    def forward(self):
+        time.sleep(0.001)
+        return self.blob.reshape(len(self.blob), -1).mean(axis=1, keepdims=True)
+
+
+class FacePipelineTestCase(unittest.TestCase):
+    """Test cases for the OpenCV face pipeline"""
+
+    def setUp(self):
+        """Set up synthetic face images"""
+        rng = np.random.default_rng(7)
+        self.images = [rng.integers(1, 255, (320, 320, 3), dtype=np.uint8) for _ in range(5)]
+
+    def test_similarity_transform(self):
+        """Test that a known rotation, scale and shift is recovered"""
+        angle = np.deg2rad(12)
+        rotation = 1.7 * np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+        points = REFERENCE_LANDMARKS @ rotation.T + [5, -3]
+        matrix = similarity_transform(REFERENCE_LANDMARKS, points)
+        np.testing.assert_allclose(matrix[:, :2], rotation, atol=1e-9)
+        np.testing.assert_allclose(matrix[:, 2], [5, -3], atol=1e-9)
+
+    def test_alignment_crops_reference_region(self):
+        """Test that alignment undoes the detector's scale and offset"""
+        rows, columns = np.mgrid[0:320, 0:320]
+        image = np.dstack([columns // 2, rows // 2, np.full_like(rows, 128)]).astype(np.uint8)
+        pipeline = FacePipeline(StubDetector(), None)
+        crop = FacePipeline.align(image, pipeline.detect(image)[0])
+
+        # The stub places the template at twice the size, 40px right and 30px down
+        self.assertEqual(crop.shape, (112, 112, 3))
+        self.assertLess(np.abs(crop[..., 0].astype(int) - (np.arange(112) + 20)).max(), 2)
+        self.assertLess(np.abs(crop[..., 1].astype(int) - (np.arange(112)[:, None] + 15)).max(), 2)
+
+    @unittest.skipIf(onnx is None, 'onnx is not installed')
+    def test_batched_forward_matches_single(self):
+        """Test that crops batched into one pass embed as they do one at a time"""
+        pipeline = FacePipeline(StubDetector(), build_embedding_model(), batch_size=4)
+        images = self.images + [np.zeros((200, 200, 3), dtype=np.uint8)]
+        faces, encodings, timings = pipeline.encode(images, largest_only=True)
+
+        self.assertEqual([len(face) for face in faces], [1, 1, 1, 1, 1, 0])
+        self.assertEqual(encodings[0].shape, (1, 128))
+        self.assertEqual(encodings[-1].shape[0], 0)
+        self.assertEqual(set(timings), {'detect', 'detect_images', 'align', 'embed'})
+        self.assertEqual(len(timings['detect_images']), len(images))
+
+        single = FacePipeline(StubDetector(), build_embedding_model(), batch_size=1)
+        for image, encoding in zip(images[:5], encodings):
+            np.testing.assert_allclose(single.encode([image])[1][0], encoding, rtol=1e-4, atol=1e-4)
+
+    @unittest.skipIf(onnx is None, 'onnx is not installed')
+    def test_fixed_batch_model_falls_back(self):
+        """Test that a model exported with batch 1 still embeds every crop"""
+        pipeline = FacePipeline(StubDetector(), build_embedding_model(batch=1), batch_size=8)
+        crops = [FacePipeline.align(image, pipeline.detect(image)[0]) for image in self.images]
+        self.assertEqual(pipeline.embed(crops).shape, (5, 128))
+
+    def test_threads_share_pipeline(self):
+        """Test that concurrent callers of one pipeline each get their own crops' embeddings"""
+        pipeline = FacePipeline(StubDetector(), StatefulNet(), batch_size=2)
+        expected = [pipeline.encode([image])[1][0] for image in self.images]
+        results, errors = {}, []
+
+        def encode(index):
+            try:
+                for _ in range(20):
+                    results.setdefault(index, []).append(pipeline.encode([self.images[index]])[1][0])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=encode, args=(index,)) for index in range(len(self.images))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        for index, encodings in results.items():
+            for encoding in encodings:
+                np.testing.assert_array_equal(encoding, expected[index])
+
+    def test_models_installed_later_are_loaded(self):
+        """Test that missing models are not cached, so installing them needs no restart"""
+        with tempfile.TemporaryDirectory() as folder:
+            config = {'FACE_DETECTOR_MODEL': os.path.join(folder, 'detector.onnx'),
+                      'FACE_EMBEDDING_MODEL': os.path.join(folder, 'embedding.onnx')}
+            self.assertIsNone(get_pipeline(config))
+
+            for path in config.values():
+                open(path, 'wb').close()
+            with mock.patch.dict('app.services.face_pipeline._pipelines'), \
+                    mock.patch('app.services.face_pipeline.YuNetDetector', return_value=StubDetector()), \
+                    mock.patch('app.services.face_pipeline.FacePipeline') as pipeline_class:
+                pipeline = get_pipeline(config)
+                self.assertIs(pipeline, pipeline_class.return_value)
+                self.assertIs(get_pipeline(config), pipeline)
+                self.assertEqual(pipeline_class.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
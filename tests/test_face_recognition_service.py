@@ -0,0 +1,240 @@
+import unittest
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import User, GalleryChange, Location, CDSchedule, FaceTemplate
+from datetime import date
+from app.services.face_recognition_service import FaceRecognitionService
+from app.services.face_gallery import normalize_encodings
+from app.services.gallery_snapshot import open_snapshot
+
+
+class FaceRecognitionServiceTestCase(unittest.TestCase):
+    """Test cases for the face recognition service gallery handling"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.encodings_dir = tempfile.TemporaryDirectory()
+        self.app.config['ENCODINGS_FOLDER'] = self.encodings_dir.name
+        db.create_all()
+        self.rng = np.random.default_rng(3)
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.encodings_dir.cleanup()
+
+    def _create_user(self, number, encoding=None, is_active=True, local_government=None):
+        user = User(
+            state_code=f'TEST{number:03d}',
+            full_name=f'Test User {number}',
+            email=f'test{number}@example.com',
+            local_government=local_government,
+            is_active=is_active
+        )
+        user.set_password('testpass')
+        user.set_pin('1234')
+        if encoding is not None:
+            user.set_face_encoding(encoding)
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def test_load_skips_inactive_users(self):
+        """Test that only active users with encodings are loaded"""
+        self._create_user(1, self.rng.standard_normal(128))
+        self._create_user(2, self.rng.standard_normal(128), is_active=False)
+        self._create_user(3)
+
+        service = FaceRecognitionService()
+        service.load_known_faces()
+        self.assertEqual(len(service.gallery), 1)
+
+    def test_refresh_applies_changes_from_other_workers(self):
+        """Test that a second service instance picks up changes via the version counter"""
+        first_encoding = self.rng.standard_normal(128)
+        user = self._create_user(1, first_encoding)
+        worker = FaceRecognitionService()
+        worker.load_known_faces()
+
+        # Another worker enrolls a new user and deactivates the first
+        other = FaceRecognitionService()
+        new_encoding = self.rng.standard_normal(128)
+        new_user = self._create_user(2, new_encoding)
+        other.enroll_user(new_user)
+        user.is_active = False
+        other.unenroll_user(user.id)
+        db.session.commit()
+        self.assertEqual(GalleryChange.latest_version(), 2)
+
+        worker.refresh(force=True)
+        self.assertEqual(worker.version, 2)
+        self.assertNotIn(user.id, worker.gallery)
+        self.assertEqual(worker.identify_encodings([new_encoding])[0][0], new_user.id)
+
+    def test_refresh_applies_changes_committed_out_of_order(self):
+        """Test that a change whose id is below the worker's version is still applied"""
+        user = self._create_user(1, self.rng.standard_normal(128))
+        late_encoding = self.rng.standard_normal(128)
+        late_user = self._create_user(2)
+        worker = FaceRecognitionService()
+        worker.load_known_faces()
+        db.session.add(GalleryChange(id=10, user_id=user.id, operation=GalleryChange.UPSERT))
+        db.session.commit()
+        worker.refresh(force=True)
+        self.assertEqual(worker.version, 10)
+        self.assertNotIn(late_user.id, worker.gallery)
+
+        # Ids 8 and 9 were taken before id 10 but their transactions commit after it
+        late_user.set_face_encoding(late_encoding)
+        db.session.add(GalleryChange(id=8, user_id=late_user.id, operation=GalleryChange.UPSERT))
+        db.session.add(GalleryChange(id=9, user_id=user.id, operation=GalleryChange.REMOVE))
+        user.is_active = False
+        db.session.commit()
+        worker.refresh(force=True)
+        self.assertEqual(worker.version, 10)
+        self.assertNotIn(user.id, worker.gallery)
+        self.assertEqual(worker.identify_encodings([late_encoding])[0][0], late_user.id)
+
+    def test_rolled_back_enrolment_leaves_gallery_untouched(self):
+        """Test that the live gallery only changes once the enrolment commits"""
+        service = FaceRecognitionService()
+        service.load_known_faces()
+        encoding = self.rng.standard_normal(128)
+        user = self._create_user(1)
+        user.set_face_encoding(encoding)
+        service.enroll_user(user, encoding)
+        self.assertNotIn(user.id, service.gallery)
+        db.session.rollback()
+        self.assertNotIn(user.id, service.gallery)
+
+        user.set_face_encoding(encoding)
+        service.enroll_user(user, encoding)
+        db.session.commit()
+        self.assertIn(user.id, service.gallery)
+
+    def test_verify_against_claimed_user(self):
+        """Test 1:1 verification without loading a gallery"""
+        encoding = self.rng.standard_normal(128)
+        user = self._create_user(1, encoding)
+        service = FaceRecognitionService()
+
+        self.assertLess(service.verify(user.id, encoding + 0.01 * self.rng.standard_normal(128)), 0.1)
+        self.assertGreater(service.verify(user.id, self.rng.standard_normal(128)), service.tolerance)
+        self.assertEqual(service.verify(user.id, None), float('inf'))
+        self.assertEqual(service.verify(self._create_user(2).id, encoding), float('inf'))
+
+    def test_scoped_gallery_for_scheduled_location(self):
+        """Test that venue matching only searches members of its local government"""
+        ikeja_encoding, amac_encoding = self.rng.standard_normal((2, 128))
+        ikeja_user = self._create_user(1, ikeja_encoding, local_government='Ikeja')
+        self._create_user(2, amac_encoding, local_government='AMAC')
+        scheduled = Location(name='Secretariat', local_government='Ikeja', state='Lagos')
+        unscheduled = Location(name='Council', local_government='AMAC', state='FCT')
+        db.session.add_all([scheduled, unscheduled])
+        db.session.commit()
+        db.session.add(CDSchedule(location_id=scheduled.id, schedule_date=date.today()))
+        db.session.commit()
+
+        service = FaceRecognitionService()
+        service.load_known_faces()
+        scoped = service.get_scoped_gallery(scheduled.id)
+        self.assertEqual(scoped.user_ids.tolist(), [ikeja_user.id])
+        self.assertIs(service.get_scoped_gallery(scheduled.id), scoped)
+        self.assertIsNone(service.get_scoped_gallery(unscheduled.id))
+
+        results = service.identify_encodings([ikeja_encoding, amac_encoding], location_id=scheduled.id)
+        self.assertEqual([user_id for user_id, _ in results], [ikeja_user.id, None])
+
+    def test_workers_share_memory_mapped_snapshot(self):
+        """Test that later workers map the snapshot published by the first"""
+        encodings = self.rng.standard_normal((3, 128))
+        users = [self._create_user(number, encoding) for number, encoding in enumerate(encodings)]
+
+        first = FaceRecognitionService()
+        first.load_known_faces()
+        second = FaceRecognitionService()
+        second.load_known_faces()
+        self.assertIsInstance(second.gallery.encodings, np.memmap)
+        self.assertEqual(second.identify_encodings(encodings)[2][0], users[2].id)
+
+        # Enough private changes make a worker fold them into a new snapshot
+        self.app.config['FACE_SNAPSHOT_MAX_DELTA'] = 0
+        replacement = self.rng.standard_normal(128)
+        users[0].set_face_encoding(replacement)
+        first.enroll_user(users[0], replacement)
+        db.session.commit()
+        first.refresh(force=True)
+        self.assertEqual(first.gallery.delta_size, 0)
+
+        second.refresh(force=True)
+        self.assertEqual(second.version, first.version)
+        self.assertEqual(second.gallery.delta_size, 0)
+        self.assertEqual(second.identify_encodings([replacement])[0][0], users[0].id)
+
+
+    def test_quantized_worker_publishes_exact_snapshot(self):
+        """Test that a quantized gallery publishes exact rows and re-ranks against their mapping"""
+        encodings = self.rng.standard_normal((3, 128))
+        users = [self._create_user(number, encoding) for number, encoding in enumerate(encodings)]
+        self.app.config['FACE_QUANTIZATION'] = 'int8'
+        service = FaceRecognitionService()
+        service.load_known_faces()
+        self.assertTrue(service.gallery.quantized)
+        self.assertEqual(service.identify_encodings(encodings)[1][0], users[1].id)
+
+        snapshot = open_snapshot(self.encodings_dir.name)
+        np.testing.assert_allclose(snapshot.encodings, normalize_encodings(encodings), rtol=1e-6)
+        self.assertIsInstance(service.gallery._base_matrix, np.memmap)
+        del snapshot
+
+    def test_borderline_centroid_falls_back_to_templates(self):
+        """Test that a probe near one enrolment image matches despite a distant centroid"""
+        self.app.config['FACE_TEMPLATE_MARGIN'] = 0.2
+        frontal, profile = self.rng.standard_normal((2, 128))
+        user = self._create_user(1)
+        user.add_face_template(frontal, 'frontal.jpg')
+        user.add_face_template(profile, 'profile.jpg')
+        db.session.commit()
+        self.assertEqual(user.face_templates.count(), 2)
+        self.assertEqual(user.face_image_path, 'profile.jpg')
+
+        service = FaceRecognitionService(tolerance=0.6)
+        service.load_known_faces()
+        probe = frontal + 0.05 * self.rng.standard_normal(128)
+        self.assertGreater(service.gallery.match(probe, service.tolerance)[0][1], service.tolerance)
+        self.assertEqual(service.identify_encodings([probe])[0][0], user.id)
+        self.assertLess(service.verify(user.id, probe), service.tolerance)
+
+        self.app.config['FACE_TEMPLATE_MARGIN'] = 0.0
+        self.assertIsNone(service.identify_encodings([probe])[0][0])
+
+    def test_oldest_templates_are_dropped(self):
+        """Test that enrolment keeps at most max_templates per user"""
+        user = self._create_user(1)
+        encodings = self.rng.standard_normal((4, 128))
+        for encoding in encodings:
+            user.add_face_template(encoding, max_templates=2)
+        db.session.commit()
+
+        kept = [template.get_encoding() for template in user.face_templates]
+        np.testing.assert_allclose(kept, encodings[2:].astype(np.float32))
+        self.assertEqual(FaceTemplate.query.count(), 2)
+        unit = encodings[2:] / np.linalg.norm(encodings[2:], axis=1, keepdims=True)
+        np.testing.assert_allclose(user.get_face_encoding(), unit.mean(axis=0), rtol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import os
+import sys
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.face_tracker import FaceTracker, box_iou, centroid_distance
+
+
+class FaceTrackerTestCase(unittest.TestCase):
+    """Test cases for tracking faces across frames"""
+
+    def test_box_geometry(self):
+        """Test IoU and relative centroid distance"""
+        self.assertAlmostEqual(box_iou((0, 0, 10, 10), (0, 0, 10, 10)), 1.0)
+        self.assertAlmostEqual(box_iou((0, 0, 10, 10), (5, 0, 10, 10)), 50 / 150)
+        self.assertEqual(box_iou((0, 0, 10, 10), (20, 20, 10, 10)), 0.0)
+        self.assertAlmostEqual(centroid_distance((0, 0, 30, 40), (30, 40, 30, 40)), 1.0)
+
+    def test_association_and_expiry(self):
+        """Test that boxes follow their tracks by overlap, then by centroid, and tracks expire"""
+        tracker = FaceTracker(max_age=1.0)
+        left, right = tracker.update([(0, 0, 100, 100), (300, 0, 100, 100)], now=0.0)
+        self.assertNotEqual(left.id, right.id)
+
+        # Order changes and a fast move that no longer overlaps
+        moved = tracker.update([(310, 0, 100, 100), (10, 30, 100, 100)], now=0.5)
+        self.assertEqual([track.id for track in moved], [right.id, left.id])
+        jumped = tracker.update([(310, 0, 100, 100), (60, 30, 40, 40)], now=0.6)
+        self.assertEqual(jumped[1].id, left.id)
+        self.assertEqual(left.hits, 3)
+
+        # A face far away from every track starts a new one
+        stranger = tracker.update([(800, 400, 100, 100)], now=0.7)[0]
+        self.assertNotIn(stranger.id, (left.id, right.id))
+
+        # Unseen for longer than max_age
+        again = tracker.update([(310, 0, 100, 100)], now=2.0)[0]
+        self.assertNotEqual(again.id, right.id)
+        self.assertEqual(len(tracker.tracks), 1)
+
+    def test_identification_schedule(self):
+        """Test first, retry and re-verification attempts"""
+        tracker = FaceTracker(retry_seconds=1.0, reverify_seconds=10.0)
+        track = tracker.update([(0, 0, 100, 100)], now=0.0)[0]
+        self.assertTrue(tracker.claim(track, 0.0))
+        self.assertFalse(tracker.claim(track, 0.1))  # already in progress
+
+        self.assertFalse(tracker.assign(track, None, 0.0, 0.2))
+        self.assertFalse(tracker.claim(track, 0.9))
+        self.assertTrue(tracker.claim(track, 1.3))
+
+        self.assertTrue(tracker.assign(track, 7, 0.9, 1.4))
+        self.assertFalse(tracker.claim(track, 5.0))
+        self.assertTrue(tracker.claim(track, 11.5))
+        self.assertFalse(tracker.assign(track, 7, 0.9, 11.6))  # already reported
+        self.assertEqual(track.user_id, 7)
+
+        # A disagreeing re-verification clears the identity
+        self.assertTrue(tracker.claim(track, 22.0))
+        self.assertFalse(tracker.assign(track, 9, 0.8, 22.1))
+        self.assertIsNone(track.user_id)
+        self.assertTrue(tracker.claim(track, 23.2))
+        self.assertTrue(tracker.assign(track, 9, 0.8, 23.3))
+
+
+if __name__ == '__main__':
+    unittest.main()
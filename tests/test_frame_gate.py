@@ -0,0 +1,66 @@
+import unittest
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.services.camera_ingest import CameraIngest, SyntheticSource
+from app.services.frame_gate import BLURRY, BRIGHT, DARK, STATIC, FrameGate
+
+
+def scene(shift=0, level=128, size=(480, 640)):
+    """A textured frame; ``shift`` moves a bright square across it"""
+    rng = np.random.default_rng(7)
+    image = np.clip(rng.normal(level, 30, size), 0, 255).astype(np.uint8)
+    image[100:250, 100 + shift:250 + shift] = 230
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+
+class FrameGateTestCase(unittest.TestCase):
+    """Test cases for the motion and quality gate"""
+
+    def test_skip_reasons(self):
+        """Test that unchanged, dark, bright and blurred frames are skipped"""
+        gate = FrameGate()
+        self.assertIsNone(gate.check('cam', scene()))
+        self.assertEqual(gate.check('cam', scene()), STATIC)
+        self.assertIsNone(gate.check('cam', scene(shift=80)))
+        self.assertEqual(gate.check('cam', scene(level=10) // 4), DARK)
+        self.assertEqual(gate.check('cam', np.full((480, 640, 3), 250, np.uint8)), BRIGHT)
+        self.assertEqual(gate.check('cam', cv2.GaussianBlur(scene(shift=160), (0, 0), 8)), BLURRY)
+
+        # Cameras are compared only with their own previous frame
+        self.assertIsNone(gate.check('other', scene(shift=80)))
+        self.assertEqual(gate.snapshot()['cam'],
+                         {'passed': 2, STATIC: 1, DARK: 1, BRIGHT: 1, BLURRY: 1})
+
+    def test_ingest_reports_skips(self):
+        """Test that the ingest counts gated frames per location"""
+        app = create_app('testing')
+        app.config.update(CAMERA_CAPTURE_FPS=0, CAMERA_RECONNECT_SECONDS=0.05)
+        frames = [scene(), scene(), scene(), scene(shift=40)]
+        handled = []
+        ingest = CameraIngest(app, handled.append, workers=1,
+                              open_source=lambda camera_id: SyntheticSource(frames, fps=100))
+        ingest.start()
+        ingest.sync_cameras({1: 'cam-1'})
+        deadline = time.monotonic() + 2
+        while not handled and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        ingest.stop()
+
+        stats = ingest.stats()[1]
+        self.assertGreaterEqual(stats[STATIC], 2)
+        self.assertEqual(stats['captured'], stats['passed'])
+        self.assertGreaterEqual(len(handled), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
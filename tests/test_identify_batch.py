@@ -0,0 +1,157 @@
+import unittest
+import io
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import User
+from app.services.probe_cache import get_probe_cache
+
+
+def color_encoding(image):
+    """A stable 128-d encoding per dominant colour; None for black images"""
+    color = tuple(int(round(value / 10)) for value in image.reshape(-1, 3).mean(axis=0))
+    if not any(color):
+        return None
+    return np.random.default_rng(abs(hash(color)) % (2 ** 32)).standard_normal(128).astype(np.float32)
+
+
+class ColorPipeline:
+    """Stands in for the face models: one 'face' per non-black image"""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, images, largest_only=False):
+        self.calls.append(len(images))
+        encodings = [color_encoding(image) for image in images]
+        return ([[None] if encoding is not None else [] for encoding in encodings],
+                [encoding[None, :] if encoding is not None else np.empty((0, 128), np.float32)
+                 for encoding in encodings],
+                {'detect': 1.0, 'detect_images': [1.0 / len(images)] * len(images), 'align': 0.0, 'embed': 1.0})
+
+    @staticmethod
+    def align(image, face):
+        return image[:112, :112]
+
+    def embed(self, crops):
+        self.calls.append(len(crops))
+        return np.stack([color_encoding(crop) for crop in crops])
+
+
+def jpeg(color, size=(320, 240)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG', quality=95)
+    return buffer.getvalue()
+
+
+class IdentifyBatchTestCase(unittest.TestCase):
+    """Test cases for the batch identification API"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app = create_app('testing')
+        self.encodings_dir = tempfile.TemporaryDirectory()
+        self.app.config['ENCODINGS_FOLDER'] = self.encodings_dir.name
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+
+        get_probe_cache(self.app.config).clear()  # shared by the whole process
+        self.pipeline = ColorPipeline()
+        patcher = mock.patch('app.services.face_recognition_service.get_pipeline', return_value=self.pipeline)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.colors = [(200, 40, 40), (40, 200, 40), (40, 40, 200)]
+        self.users = []
+        for number, color in enumerate(self.colors[:2], start=1):
+            user = User(state_code=f'LA/23A/000{number}', full_name=f'Member {number}',
+                        email=f'member{number}@example.com')
+            user.set_password('testpass')
+            user.set_pin('1234')
+            user.set_face_encoding(color_encoding(np.array(color[::-1], dtype=np.float64)[None, None, :]))  # BGR
+            db.session.add(user)
+            self.users.append(user)
+        db.session.commit()
+        self.client.post('/auth/login', data={'email': 'member1@example.com', 'password': 'testpass'})
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.encodings_dir.cleanup()
+
+    def _post(self, images, **form):
+        data = dict(form, images=[(io.BytesIO(image), f'frame{i}.jpg') for i, image in enumerate(images)])
+        return self.client.post('/api/face_recognition/identify_batch', data=data,
+                                content_type='multipart/form-data')
+
+    def test_batch_results_in_order(self):
+        """Test per-image matches, misses and errors from one batched pass"""
+        frames = [jpeg(self.colors[1]), jpeg(self.colors[2]), jpeg((0, 0, 0)), b'not an image', jpeg(self.colors[0])]
+        response = self._post(frames)
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+
+        results = body['results']
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3, 4])
+        self.assertEqual(results[0]['state_code'], 'LA/23A/0002')
+        self.assertEqual(results[4]['user_id'], self.users[0].id)
+        self.assertTrue(results[1]['face_found'])
+        self.assertFalse(results[1]['matched'])
+        self.assertFalse(results[2]['face_found'])
+        self.assertEqual(results[3]['error'], 'Invalid image file')
+        self.assertIn('decode_ms', results[0]['timings'])
+        self.assertIn('detect_ms', results[0]['timings'])
+        self.assertEqual(set(body['timings']),
+                         {'decode_ms', 'detect_ms', 'align_ms', 'embed_ms', 'match_ms', 'total_ms'})
+        # Every decodable image went through one pipeline call
+        self.assertEqual(self.pipeline.calls, [4])
+
+        # A resubmission is served from the probe cache
+        cached = self._post(frames[:2]).get_json()['results']
+        self.assertTrue(all(result['cached'] for result in cached))
+        self.assertEqual(cached[0]['user_id'], self.users[1].id)
+        self.assertEqual(self.pipeline.calls, [4])
+
+    def test_crops_and_limits(self):
+        """Test aligned crops skip detection, and request validation"""
+        crops = [jpeg(self.colors[0], size=(112, 112)), jpeg(self.colors[1], size=(96, 96))]
+        results = self._post(crops, crops='1').get_json()['results']
+        self.assertEqual([result['user_id'] for result in results], [user.id for user in self.users])
+        self.assertNotIn('detect_ms', results[0]['timings'])
+
+        self.assertEqual(self._post([]).status_code, 400)
+        self.app.config['FACE_BATCH_MAX_IMAGES'] = 1
+        self.assertEqual(self._post(crops).status_code, 400)
+
+        with mock.patch('app.services.face_recognition_service.get_pipeline', return_value=None):
+            self.app.config['FACE_BATCH_MAX_IMAGES'] = 32
+            self.assertEqual(self._post(crops).status_code, 503)
+
+    def test_unknown_faces_kept_once(self):
+        """Test that faces nobody matches go to the unknown face store, once per capture"""
+        folder = os.path.join(self.encodings_dir.name, 'unknown')
+        self.app.config.update(UNKNOWN_FACES_FOLDER=folder, UNKNOWN_FACES_MAX_COUNT=100)
+        frames = [jpeg(self.colors[2]), jpeg(self.colors[0]), jpeg((0, 0, 0))]
+        self._post(frames)
+        self._post(frames)  # cached: not kept again
+        self._post([jpeg(self.colors[2], size=(112, 112))], crops='1')
+        names = sorted(os.listdir(folder))
+        self.assertEqual(len(names), 4)
+        self.assertEqual({name.rsplit('.', 1)[1] for name in names}, {'jpg', 'npy'})
+
+
+if __name__ == '__main__':
+    unittest.main()
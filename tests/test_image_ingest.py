@@ -0,0 +1,66 @@
+import unittest
+import io
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.image_ingest import ImageTooLarge, decode_bgr, open_reduced, probe_image
+
+
+def jpeg_bytes(size, exif_orientation=None):
+    rows, columns = np.mgrid[0:size[1], 0:size[0]]
+    pixels = np.dstack([columns % 256, rows % 256, (rows + columns) % 256]).astype(np.uint8)
+    buffer = io.BytesIO()
+    image = Image.fromarray(pixels)
+    if exif_orientation is None:
+        image.save(buffer, 'JPEG', quality=85)
+    else:
+        exif = Image.Exif()
+        exif[0x0112] = exif_orientation
+        image.save(buffer, 'JPEG', quality=85, exif=exif)
+    return buffer.getvalue()
+
+
+class ImageIngestTestCase(unittest.TestCase):
+    """Test cases for reduced-resolution image decoding"""
+
+    def test_jpeg_decodes_at_reduced_scale(self):
+        """Test that a large JPEG is decoded near twice the target, never below it"""
+        image = open_reduced(io.BytesIO(jpeg_bytes((4000, 3000))), (400, 400))
+        self.assertEqual(image.size, (1000, 750))
+        self.assertEqual(image.mode, 'RGB')
+
+        small = open_reduced(io.BytesIO(jpeg_bytes((600, 450))), (400, 400))
+        self.assertEqual(small.size, (600, 450))
+
+    def test_exif_orientation_is_applied(self):
+        """Test that rotated phone photos come out upright"""
+        image = open_reduced(io.BytesIO(jpeg_bytes((1600, 1200), exif_orientation=6)), (400, 400))
+        self.assertEqual(image.size, (600, 800))
+
+    def test_pixel_cap_rejects_from_header(self):
+        """Test that oversized images are refused before decoding"""
+        data = jpeg_bytes((2000, 1500))
+        self.assertEqual(probe_image(data), ('JPEG', (2000, 1500)))
+        with self.assertRaises(ImageTooLarge):
+            probe_image(data, max_pixels=1000 * 1000)
+        with self.assertRaises(ImageTooLarge):
+            open_reduced(io.BytesIO(data), (400, 400), max_pixels=1000 * 1000)
+        with self.assertRaises(ImageTooLarge):
+            decode_bgr(data, max_pixels=1000 * 1000)
+
+    def test_decode_bgr_reduced(self):
+        """Test OpenCV reduced decoding keeps the shorter side above the minimum"""
+        data = jpeg_bytes((4000, 3000))
+        self.assertEqual(decode_bgr(data, min_side=480).shape, (750, 1000, 3))
+        self.assertEqual(decode_bgr(data).shape, (3000, 4000, 3))
+        self.assertIsNone(decode_bgr(b'not an image'))
+
+
+if __name__ == '__main__':
+    unittest.main()
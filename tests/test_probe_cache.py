@@ -0,0 +1,134 @@
+import unittest
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import User
+from app.services.face_recognition_service import FaceRecognitionService
+from app.services.probe_cache import ProbeCache
+from app.services.unknown_faces import get_unknown_store
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingPipeline:
+    """Returns a fixed encoding per call and counts the images encoded"""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.images = 0
+
+    def encode(self, images, largest_only=False):
+        self.images += len(images)
+        return [[None]] * len(images), [self.encoding[None, :] for _ in images], {}
+
+    def align(self, image, face):
+        return np.zeros((112, 112, 3), dtype=np.uint8)
+
+
+class ProbeCacheTestCase(unittest.TestCase):
+    """Test cases for the probe embedding cache"""
+
+    def test_lru_ttl_and_versions(self):
+        """Test eviction by size and age, and results tied to the gallery version"""
+        clock = FakeClock()
+        cache = ProbeCache(max_entries=2, ttl_seconds=10, clock=clock)
+        encoding = np.ones(4, dtype=np.float32)
+        cache.put('a', encoding, version=1, result=(7, 0.9))
+        cache.put('b', None, version=1, result=None)
+
+        self.assertEqual(cache.get('a', 1).result, (7, 0.9))
+        self.assertIsNone(cache.get('a', 1, scope=3).result)
+        stale = cache.get('a', 2)
+        self.assertIsNone(stale.result)
+        np.testing.assert_array_equal(stale.encoding, encoding)
+
+        cache.put('c', encoding, version=1)  # 'b' is least recently used
+        self.assertIsNone(cache.get('b', 1))
+        self.assertIsNotNone(cache.get('a', 1))
+
+        clock.now = 11
+        self.assertIsNone(cache.get('a', 1))
+        self.assertEqual(len(cache), 1)
+
+
+class CachedRecognitionTestCase(unittest.TestCase):
+    """Test cases for cached recognition of repeated captures"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.encodings_dir = tempfile.TemporaryDirectory()
+        self.app.config['ENCODINGS_FOLDER'] = self.encodings_dir.name
+        self.app.config['FACE_GALLERY_REFRESH_SECONDS'] = 0
+        db.create_all()
+
+        self.encoding = np.random.default_rng(5).standard_normal(128).astype(np.float32)
+        self.pipeline = CountingPipeline(self.encoding)
+        self.service = FaceRecognitionService(pipeline=self.pipeline, probe_cache=ProbeCache())
+        self.service.load_known_faces()
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), (120, 100, 80)).save(buffer, 'JPEG')
+        self.capture = buffer.getvalue()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.encodings_dir.cleanup()
+
+    def test_retry_skips_embedding_until_gallery_changes(self):
+        """Test that a retried capture reuses its embedding and its result"""
+        self.assertEqual(self.service.recognize_face_from_image(self.capture), (None, 0.0))
+        self.assertEqual(self.service.recognize_face_from_image(io.BytesIO(self.capture)), (None, 0.0))
+        self.assertEqual(self.pipeline.images, 1)
+
+        # Enrolling the member bumps the gallery version; the cached result is
+        # recomputed from the cached embedding
+        user = User(state_code='TEST001', full_name='Test User', email='test@example.com')
+        user.set_password('testpass')
+        user.set_pin('1234')
+        user.set_face_encoding(self.encoding)
+        db.session.add(user)
+        db.session.flush()
+        self.service.enroll_user(user)
+        db.session.commit()
+
+        user_id, confidence = self.service.recognize_face_from_image(self.capture)
+        self.assertEqual(user_id, user.id)
+        self.assertGreater(confidence, 0.9)
+        self.assertEqual(self.pipeline.images, 1)
+        self.assertEqual(self.service.probe_cache.hits, 2)
+
+    def test_unmatched_capture_is_kept_once(self):
+        """Test that a fresh face nobody matches goes to the unknown face store, a retry does not"""
+        self.app.config.update(UNKNOWN_FACES_FOLDER=os.path.join(self.encodings_dir.name, 'unknown'),
+                               UNKNOWN_FACES_MAX_COUNT=10)
+        self.service.recognize_face_from_image(self.capture, location_id=4)
+        self.service.recognize_face_from_image(self.capture, location_id=4)
+        faces = get_unknown_store(self.app.config).faces()
+        self.assertEqual([face.location_id for face in faces], [4])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.encodings_dir.name, 'unknown'))),
+                         [faces[0].id + '.jpg', faces[0].id + '.npy'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import unittest
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import User, FaceTemplate, GalleryChange
+from app.services.face_recognition_service import FaceRecognitionService
+from app.services.reembedding import pending_users, reembed_gallery, swap_gallery
+
+
+class Interrupted(Exception):
+    pass
+
+
+class ModelStub:
+    """Encodes images by path with a fixed 'new model'; can fail partway through"""
+
+    def __init__(self, encodings, fail_after=None):
+        self.encodings = encodings
+        self.fail_after = fail_after
+        self.calls = []
+
+    def __call__(self, path):
+        if self.fail_after is not None and len(self.calls) >= self.fail_after:
+            raise Interrupted()
+        self.calls.append(path)
+        return self.encodings.get(path)
+
+
+class ReembeddingTestCase(unittest.TestCase):
+    """Test cases for re-embedding the gallery with a new model"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app = create_app('testing')
+        self.folder = tempfile.TemporaryDirectory()
+        # One member of three has no face under the new model
+        self.app.config.update(ENCODINGS_FOLDER=self.folder.name, FACE_MODEL_VERSION='v1',
+                               FACE_REEMBED_MAX_DROP_RATE=0.5)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        rng = np.random.default_rng(0)
+        self.old = rng.standard_normal((3, 128)).astype(np.float32)
+        self.new = rng.standard_normal((3, 128)).astype(np.float32)
+        self.users, self.paths = [], []
+        for index in range(3):
+            user = User(state_code=f'LA/23A/000{index}', full_name=f'Member {index}',
+                        email=f'member{index}@example.com')
+            user.set_password('testpass')
+            user.set_pin('1234')
+            path = os.path.join(self.folder.name, f'{index}.jpg')
+            with open(path, 'wb') as f:
+                f.write(b'face')
+            if index < 2:
+                user.add_face_template(self.old[index], image_path=path, model_version='v1')
+            else:
+                # Enrolled before templates: only the stored image
+                user.set_face_encoding(self.old[index])
+                user.face_image_path = path
+            db.session.add(user)
+            self.users.append(user)
+            self.paths.append(path)
+        db.session.commit()
+        self.service = FaceRecognitionService()
+        self.service.load_known_faces()
+
+        # The new model finds no face in member 1's image
+        self.model = {self.paths[0]: self.new[0], self.paths[2]: self.new[2]}
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.folder.cleanup()
+
+    def _gallery_encoding(self, user_id):
+        rows = list(self.service.gallery.user_ids)
+        return self.service.gallery.encodings[rows.index(user_id)]
+
+    def _assert_same_direction(self, a, b):
+        self.assertGreater(float(a @ b) / (np.linalg.norm(a) * np.linalg.norm(b)), 0.999)
+
+    def test_resumes_and_swaps_atomically(self):
+        """Test that an interrupted job keeps serving the old gallery and resumes where it stopped"""
+        with self.assertRaises(Interrupted):
+            reembed_gallery('v2', batch_size=1, encode=ModelStub(self.model, fail_after=2))
+        first = db.session.get(User, self.users[0].id)
+        self.assertEqual(first.next_encoding_version, 'v2')
+        self.assertEqual(first.face_encoding_version, 'v1')
+        self.assertEqual([user.id for user in pending_users('v2')], [self.users[2].id])
+        self.assertIsNone(GalleryChange.latest_reload())
+
+        self.service.refresh(force=True)
+        self.assertEqual(self.service.model_version, 'v1')
+        self._assert_same_direction(self._gallery_encoding(self.users[0].id), self.old[0])
+
+        model = ModelStub(self.model)
+        result = reembed_gallery('v2', batch_size=1, encode=model)
+        self.assertEqual(model.calls, [self.paths[2]])
+        self.assertEqual((result['reembedded'], result['no_face'], result['failed'], result['swapped']),
+                         (1, 0, 0, True))
+
+        # Workers switch model and encodings together on their next refresh
+        self.service.refresh(force=True)
+        self.assertEqual(self.service.active_model_version(), 'v2')
+        self.assertEqual(sorted(self.service.gallery.user_ids), [self.users[0].id, self.users[2].id])
+        self._assert_same_direction(self._gallery_encoding(self.users[0].id), self.new[0])
+        self._assert_same_direction(self._gallery_encoding(self.users[2].id), self.new[2])
+        self.assertEqual([t.model_version for t in FaceTemplate.query.all()], ['v2'])
+        self.assertEqual(db.session.get(User, self.users[2].id).face_encoding_version, 'v2')
+
+        # A fresh worker maps the snapshot published at the swap
+        fresh = FaceRecognitionService()
+        self.assertTrue(fresh.load_known_faces())
+        self.assertEqual((fresh.model_version, len(fresh.gallery)), ('v2', 2))
+        self.assertFalse(swap_gallery('v2'))
+
+    def test_enrolment_during_job_is_redone(self):
+        """Test that a member enrolling mid-job is re-embedded again before the swap"""
+        reembed_gallery('v2', encode=ModelStub(self.model), swap=False)
+        self.assertIsNone(pending_users('v2').first())
+
+        user = db.session.get(User, self.users[0].id)
+        user.add_face_template(self.old[1], image_path=self.paths[1], model_version='v1')
+        db.session.commit()
+        self.assertIsNone(user.next_encoding_version)
+        self.assertFalse(swap_gallery('v2'))
+
+        model = ModelStub(self.model)
+        self.assertTrue(reembed_gallery('v2', encode=model)['swapped'])
+        self.assertEqual(model.calls, [self.paths[0], self.paths[1]])
+        user = db.session.get(User, self.users[0].id)
+        self.assertEqual((user.face_encoding_version, user.face_templates.count()), ('v2', 1))
+
+    def test_unreadable_images_are_not_faceless(self):
+        """Test that a missing image leaves its member pending and that large drops need forcing"""
+        os.remove(self.paths[2])
+        model = ModelStub(self.model)
+        result = reembed_gallery('v2', encode=model)
+        self.assertEqual(model.calls, [self.paths[0], self.paths[1]])
+        self.assertEqual((result['reembedded'], result['no_face'], result['failed'], result['swapped']),
+                         (1, 1, 1, False))
+        self.assertEqual([user.id for user in pending_users('v2')], [self.users[2].id])
+        self.assertIsNone(db.session.get(User, self.users[2].id).next_encoding_version)
+
+        # Once the image is back, dropping one member in three is still too many
+        with open(self.paths[2], 'wb') as f:
+            f.write(b'face')
+        self.app.config['FACE_REEMBED_MAX_DROP_RATE'] = 0.2
+        result = reembed_gallery('v2', encode=ModelStub(self.model))
+        self.assertEqual((result['reembedded'], result['failed'], result['swapped']), (1, 0, False))
+        self.assertIsNone(GalleryChange.latest_reload())
+
+        self.assertTrue(swap_gallery('v2', force=True))
+        self.service.refresh(force=True)
+        self.assertEqual(sorted(self.service.gallery.user_ids), [self.users[0].id, self.users[2].id])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import numpy as np
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import User
+from app.services.attendance_service import AttendanceService
+from app.services.registry import get_face_service, get_registry
+from config.config import TestingConfig
+
+
+class ServiceRegistryTestCase(unittest.TestCase):
+    """Test cases for the app-scoped face service and readiness"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.encodings_dir = tempfile.TemporaryDirectory()
+        # Warming at start fails here: the tables do not exist yet
+        with mock.patch.object(TestingConfig, 'FACE_WARM_ON_START', True), \
+                mock.patch.object(TestingConfig, 'ENCODINGS_FOLDER', self.encodings_dir.name):
+            self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.encodings_dir.cleanup()
+
+    def _user(self):
+        user = User(state_code='LA/23A/0001', full_name='Test User', email='test@example.com')
+        user.set_password('testpass')
+        user.set_pin('1234')
+        user.set_face_encoding(np.random.default_rng(0).standard_normal(128).astype(np.float32))
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def test_health_reports_readiness(self):
+        """Test that health checks fail until the gallery loads, then pass, without loading it"""
+        registry = get_registry()
+        self.assertFalse(registry.ready)
+        self.assertIsNotNone(registry.error)
+
+        db.create_all()
+        self._user()
+        self.assertEqual(self.client.get('/api/health').status_code, 503)
+        self.assertFalse(registry.ready)
+        get_face_service()
+        response = self.client.get('/api/health')
+        self.assertEqual(response.status_code, 200)
+        status = response.get_json()
+        self.assertTrue(status['ready'])
+        self.assertEqual(status['gallery_size'], 1)
+        self.assertIsNone(status['error'])
+
+    def test_failed_warm_backs_off(self):
+        """Test that requests do not retry a failed warm-up until it is due, and a retry runs in the background"""
+        self.app.config['FACE_WARM_RETRY_SECONDS'] = 60
+        registry = get_registry()
+        self.addCleanup(registry.cancel_retry)
+        self.assertFalse(registry.warm())
+        self.assertTrue(registry._timer.is_alive())
+        self.assertGreater(self.client.get('/api/health').get_json()['retry_in_seconds'], 50)
+
+        db.create_all()
+        self._user()
+        self.assertIs(get_face_service(), registry.face_service)
+        self.assertFalse(registry.ready)
+
+        registry.cancel_retry()
+        registry._retry()
+        self.assertTrue(registry.ready)
+        self.assertIsNone(registry.retry_at)
+        self.assertEqual(len(get_face_service().gallery), 1)
+
+    def test_one_face_service_per_app(self):
+        """Test that requests share the warmed service and its gallery"""
+        db.create_all()
+        user = self._user()
+        service = get_face_service()
+        self.assertIs(AttendanceService().face_service, service)
+        self.assertIs(get_face_service(), service)
+        self.assertEqual(list(service.gallery.user_ids), [user.id])
+
+        # Admin changes reach the shared gallery without a reload
+        service.unenroll_user(user.id)
+        db.session.commit()
+        self.assertEqual(len(get_face_service().gallery), 0)
+
+        other = create_app('testing')
+        self.assertIsNot(get_registry(other), get_registry())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import os
+import sys
+import tempfile
+from datetime import date, time
+from unittest import mock
+
+import numpy as np
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import User, Location, CDSchedule
+from app.services.face_recognition_service import FaceRecognitionService
+from app.services.timing import Histogram, get_timings, record_ms, span, trace
+
+
+class TimingTestCase(unittest.TestCase):
+    """Test cases for stage spans and histograms"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        get_timings().reset()
+
+    def test_histogram_percentiles(self):
+        """Test that percentiles report the bucket bound, capped at the slowest sample"""
+        histogram = Histogram()
+        for duration_ms in [0.3] * 90 + [7] * 9 + [40]:
+            histogram.observe(int(duration_ms * 1e6))
+        summary = histogram.to_dict()
+        self.assertEqual(summary['count'], 100)
+        self.assertEqual((summary['p50_ms'], summary['p90_ms'], summary['p99_ms']), (0.5, 0.5, 10.0))
+        self.assertEqual(summary['max_ms'], 40.0)
+        self.assertEqual(summary['buckets']['0.5'], 90)
+        self.assertEqual(Histogram().percentile(0.5), 0.0)
+
+    def test_spans_feed_histograms_and_traces(self):
+        """Test that spans always reach the histograms and only traced blocks collect them"""
+        with span('face.search'):
+            pass
+        with trace() as stages:
+            record_ms('face.embed', 2.0)
+            record_ms('face.embed', 3.0)
+        with trace(enabled=False) as disabled:
+            record_ms('face.embed', 1.0)
+        self.assertEqual(stages, {'face.embed': 5.0})
+        self.assertIsNone(disabled)
+
+        snapshot = get_timings().snapshot()
+        self.assertEqual(snapshot['stages']['face.embed']['count'], 3)
+        self.assertEqual(snapshot['stages']['face.search']['count'], 1)
+        text = get_timings().prometheus()
+        self.assertIn('recognition_stage_seconds_count{stage="face.embed"} 3', text)
+        self.assertIn('recognition_stage_seconds_bucket{stage="face.embed",le="+Inf"} 3', text)
+
+
+class AttendanceTimingTestCase(unittest.TestCase):
+    """Test cases for the timings of face attendance requests"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app = create_app('testing')
+        self.encodings_dir = tempfile.TemporaryDirectory()
+        self.app.config['ENCODINGS_FOLDER'] = self.encodings_dir.name
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        get_timings().reset()
+
+        self.encoding = np.random.default_rng(0).standard_normal(128).astype(np.float32)
+        user = User(state_code='LA/23A/0001', full_name='Test Member', email='member@example.com')
+        user.set_password('testpass')
+        user.set_pin('1234')
+        user.set_face_encoding(self.encoding)
+        location = Location(name='Secretariat', local_government='Ikeja', state='Lagos')
+        db.session.add_all([user, location])
+        db.session.commit()
+        self.schedule = CDSchedule(location_id=location.id, schedule_date=date.today(),
+                                   start_time=time(0, 0), end_time=time(23, 59, 59))
+        db.session.add(self.schedule)
+        db.session.commit()
+        self.client.post('/auth/login', data={'email': 'member@example.com', 'password': 'testpass'})
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.encodings_dir.cleanup()
+
+    def _mark(self, headers=None):
+        with mock.patch.object(FaceRecognitionService, 'capture_probe_from_camera', return_value=self.encoding):
+            return self.client.post('/mark_face_attendance', json={'schedule_id': self.schedule.id, 'pin': '1234'},
+                                    headers=headers or {})
+
+    def test_debug_header_returns_stage_timings(self):
+        """Test that only requests with the debug header get their timings back"""
+        response = self._mark({'X-Debug-Timings': '1'})
+        self.assertEqual(response.status_code, 200)
+        timings = response.get_json()['timings']
+        for stage in ('attendance.total', 'attendance.lookup', 'attendance.pin', 'face.verify',
+                      'attendance.commit'):
+            self.assertIn(stage, timings)
+        self.assertGreaterEqual(timings['attendance.total'], timings['attendance.commit'])
+
+        # Already marked: a failure still reports where the time went
+        response = self._mark({'X-Debug-Timings': '1'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('attendance.duplicate_check', response.get_json()['timings'])
+        self.assertNotIn('timings', self._mark().get_json())
+
+    def test_metrics_endpoint(self):
+        """Test that the metrics endpoint serves the worker's histograms to admins and token holders only"""
+        self._mark()
+        self.assertEqual(self.client.get('/api/metrics').status_code, 401)
+        self.assertEqual(self.app.test_client().get('/api/metrics').status_code, 401)
+
+        self.app.config['METRICS_TOKEN'] = 'secret'
+        self.assertEqual(self.client.get('/api/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/api/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        response = self.client.get('/api/metrics', headers={'Authorization': 'Bearer secret'})
+        stages = response.get_json()['stages']
+        self.assertEqual(stages['attendance.total']['count'], 1)
+        self.assertEqual(stages['face.verify']['count'], 1)
+
+        self.app.config['METRICS_TOKEN'] = None
+        admin = User(state_code='ADMIN001', full_name='Admin', email='admin@example.com', is_admin=True)
+        admin.set_password('adminpass')
+        admin.set_pin('0000')
+        db.session.add(admin)
+        db.session.commit()
+        self.client.get('/auth/logout')
+        self.client.post('/auth/login', data={'email': 'admin@example.com', 'password': 'adminpass'})
+        text = self.client.get('/api/metrics?format=prometheus').get_data(as_text=True)
+        self.assertIn('stage="attendance.commit"', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
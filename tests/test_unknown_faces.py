@@ -0,0 +1,212 @@
+import unittest
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import FaceTemplate, User
+from app.services.unknown_faces import (UnknownFaceClusters, UnknownFaceStore, enrolment_suggestions,
+                                        load_clusters, record_unknown_face)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1700000000.0
+
+    def __call__(self):
+        return self.now
+
+
+class NearestStub:
+    """Stands in for the face service: every centroid is nearest to one user"""
+
+    def __init__(self, user_id, distance):
+        self.user_id, self.distance = user_id, distance
+
+    def nearest_users(self, encodings):
+        return [(self.user_id, self.distance)] * len(encodings)
+
+
+THUMBNAIL = np.full((112, 112, 3), 128, dtype=np.uint8)
+
+
+def identities(count, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, 128)).astype(np.float32)
+
+
+def sample(identity, rng):
+    return identity + 0.05 * rng.standard_normal(128).astype(np.float32)
+
+
+class UnknownFaceStoreTestCase(unittest.TestCase):
+    """Test cases for keeping, bounding and clustering unknown faces"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.folder = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+        self.store = UnknownFaceStore(self.folder.name, max_faces=5, max_age=3600, prune_every=1000,
+                                      clock=self.clock)
+        self.rng = np.random.default_rng(1)
+
+    def tearDown(self):
+        """Clean up after tests"""
+        self.folder.cleanup()
+
+    def test_bounded_by_age_and_count(self):
+        """Test that old faces expire first, then the oldest beyond the limit"""
+        people = identities(1)
+        for location_id in (None, 7, 7, 7):
+            self.store.add(sample(people[0], self.rng), THUMBNAIL, location_id)
+            self.clock.now += 1000
+        faces = self.store.faces()
+        self.assertEqual([face.location_id for face in faces], [None, 7, 7, 7])
+        self.assertEqual(faces[1].captured_at, 1700001000.0)
+        self.assertTrue(os.path.exists(self.store.path(faces[0].id)))
+
+        self.assertEqual(self.store.prune(), 1)  # the first is over an hour old
+        for _ in range(4):
+            self.store.add(sample(people[0], self.rng), THUMBNAIL)
+        self.assertEqual(self.store.prune(), 2)
+        self.assertEqual(len(self.store.faces()), 5)
+        self.assertNotIn(faces[1].id, [face.id for face in self.store.faces()])
+        self.assertFalse(os.path.exists(self.store.path(faces[1].id)))
+
+    def test_incremental_clusters(self):
+        """Test that runs only assign new faces, follow pruning and never reuse labels"""
+        self.store.max_faces = 100
+        people = identities(3)
+        for person in (0, 1, 0, 2, 0, 1):
+            self.store.add(sample(people[person], self.rng), THUMBNAIL)
+            self.clock.now += 1  # ids order by capture time; ties would order randomly
+        clusters = UnknownFaceClusters(self.store, max_distance=0.6)
+        self.assertEqual(clusters.update(), 6)
+        self.assertEqual([len(cluster.faces) for cluster in clusters.clusters()], [3, 2, 1])
+
+        # State survives a restart; only the new faces are assigned
+        self.store.add(sample(people[2], self.rng), THUMBNAIL)
+        clusters = UnknownFaceClusters(self.store, max_distance=0.6)
+        self.assertEqual(clusters.update(), 1)
+        self.assertEqual(clusters.update(), 0)
+        sizes = {cluster.label: len(cluster.faces) for cluster in clusters.clusters()}
+        self.assertEqual(sorted(sizes.values()), [2, 2, 3])
+        self.assertEqual([cluster.label for cluster in clusters.clusters(min_size=3)], [1])
+
+        # Dismissed faces are deleted and their label is not handed out again
+        self.assertEqual(clusters.dismiss(1), 3)
+        self.assertEqual(len(self.store.faces()), 4)
+        self.store.add(sample(people[0], self.rng), THUMBNAIL)
+        clusters.update()
+        self.assertEqual(max(cluster.label for cluster in clusters.clusters()), 4)
+
+        # Faces pruned from the store leave their clusters
+        self.store.remove([face.id for face in clusters.get(2).faces])
+        clusters.update()
+        self.assertIsNone(clusters.get(2))
+        self.assertEqual(len(clusters.labels), 2)
+
+    def test_suggestions(self):
+        """Test that groups close to a member suggest templates, others an enrolment"""
+        self.store.max_faces = 100
+        people = identities(1)
+        for location_id in (3, 3, 5):
+            self.store.add(sample(people[0], self.rng), THUMBNAIL, location_id)
+            self.clock.now += 60
+        clusters = UnknownFaceClusters(self.store)
+        clusters.update()
+        close = enrolment_suggestions(clusters.clusters(), NearestStub(42, 0.7), max_distance=0.8)[0]
+        self.assertEqual(close['action'], 'add_templates')
+        self.assertEqual(close['nearest_user_id'], 42)
+        self.assertEqual(close['location_ids'], [3, 5])
+        self.assertEqual((close['last_seen'] - close['first_seen']).total_seconds(), 120)
+        far = enrolment_suggestions(clusters.clusters(), NearestStub(42, 1.1), max_distance=0.8)[0]
+        self.assertEqual(far['action'], 'enrol')
+
+
+class UnknownFaceReviewTestCase(unittest.TestCase):
+    """Test cases for the admin review of unknown faces"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app = create_app('testing')
+        self.folder = tempfile.TemporaryDirectory()
+        self.app.config.update(UNKNOWN_FACES_FOLDER=os.path.join(self.folder.name, 'unknown'),
+                               ENCODINGS_FOLDER=self.folder.name, UNKNOWN_FACES_MAX_COUNT=100,
+                               UNKNOWN_FACES_MIN_CLUSTER=2)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+
+        self.admin = User(state_code='ADMIN', full_name='Admin', email='admin@example.com', is_admin=True)
+        self.member = User(state_code='LA/23A/0001', full_name='Test Member', email='member@example.com')
+        for user in (self.admin, self.member):
+            user.set_password('testpass')
+            user.set_pin('1234')
+            db.session.add(user)
+        db.session.commit()
+        self.client.post('/auth/login', data={'email': 'admin@example.com', 'password': 'testpass'})
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.folder.cleanup()
+
+    def test_review_and_enrol_group(self):
+        """Test that a reviewed group becomes a member's template"""
+        rng = np.random.default_rng(2)
+        person = identities(1, seed=5)[0]
+        face_ids = [record_unknown_face(sample(person, rng), THUMBNAIL, None) for _ in range(3)]
+        self.assertTrue(all(face_ids))
+        clusters = load_clusters(self.app.config)
+        clusters.update()
+        label = clusters.clusters()[0].label
+
+        page = self.client.get('/admin/unknown_faces')
+        self.assertEqual(page.status_code, 200)
+        self.assertIn(b'3 faces', page.data)
+        self.assertEqual(self.client.get(f'/admin/unknown_faces/{face_ids[0]}.jpg').status_code, 200)
+        self.assertEqual(self.client.get('/admin/unknown_faces/..%2Fsecret.jpg').status_code, 404)
+
+        response = self.client.post(f'/admin/unknown_faces/{label}/enrol', data={'state_code': 'LA/23A/0001'})
+        self.assertEqual(response.status_code, 302)
+        member = db.session.get(User, self.member.id)
+        self.assertEqual(member.face_templates.count(), 1)
+        self.assertGreater(float(member.get_face_encoding() @ person) / np.linalg.norm(person), 0.9)
+        self.assertEqual(load_clusters(self.app.config).store.faces(), [])
+
+    def test_group_only_added_to_a_member_it_resembles(self):
+        """Test that a group is refused for a member other than the one it looks like"""
+        rng = np.random.default_rng(3)
+        person, stranger = identities(2, seed=6)
+        other = User(state_code='LA/23A/0002', full_name='Other Member', email='other@example.com')
+        other.set_password('testpass')
+        other.set_pin('1234')
+        other.set_face_encoding(stranger)
+        self.member.set_face_encoding(person)
+        db.session.add(other)
+        db.session.commit()
+        for _ in range(3):
+            record_unknown_face(sample(person, rng), THUMBNAIL, None)
+        clusters = load_clusters(self.app.config)
+        clusters.update()
+        label = clusters.clusters()[0].label
+
+        for state_code in ('LA/23A/0002', 'ADMIN'):
+            self.client.post(f'/admin/unknown_faces/{label}/enrol', data={'state_code': state_code})
+        self.assertEqual(FaceTemplate.query.count(), 0)
+        self.assertEqual(len(load_clusters(self.app.config).store.faces()), 3)
+
+        self.client.post(f'/admin/unknown_faces/{label}/enrol', data={'state_code': 'LA/23A/0001'})
+        self.assertEqual(db.session.get(User, self.member.id).face_templates.count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()